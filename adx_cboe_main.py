@@ -7,6 +7,8 @@ import math              # For working with math related functions
 import psycopg2          # PostgreSQL database connection
 import logging           # For structured logging
 from kiteconnect import KiteConnect  # Zerodha API connection
+from broker_client import BROKER_MODE, create_broker_client  # Live KiteConnect or local fake (BROKER_MODE=fake)
+from engine_metrics import metrics  # Per-stage latency histograms and counters (ENGINE_METRICS=0 disables)
 
 
 # Logging Setup
@@ -25,14 +27,23 @@ API_KEY = "8re7mjcm2btaozwf"  #  Replace with your actual API key
 API_SECRET = "fw8gm7wfeclcic9rlkp0tbzx4h2ss2n1"  # Replace with your actual API secret
 ACCESS_TOKEN_FILE = "access_token.txt"
 
-#  Initialize KiteConnect
-kite = KiteConnect(api_key=API_KEY)
+#  Initialize KiteConnect (or the offline fake when BROKER_MODE=fake)
+kite = create_broker_client(API_KEY)
+
+#  Every REST call is timed and counted per method (engine_rest_calls_total / stage="rest_call")
+metrics.instrument_methods(kite, ("ltp", "quote", "historical_data", "instruments"))
 
 
 def get_access_token():
     """
     Checks if the access token exists and is valid. If not, prompts the user to manually enter a new one.
     """
+    #  Local fake broker → no login flow
+    if BROKER_MODE == "fake":
+        access_token = kite.generate_session(None, api_secret=API_SECRET)["access_token"]
+        kite.set_access_token(access_token)
+        return access_token
+
     #  Step 1: Check if access_token.txt exists
     if os.path.exists(ACCESS_TOKEN_FILE):
         with open(ACCESS_TOKEN_FILE, "r") as file:
@@ -79,6 +90,11 @@ else:
     logging.error(" API authentication failed. Please check credentials and try again.")
 
 from psycopg2 import sql
+from psycopg2.extras import execute_values
+import psycopg2.pool
+import threading
+from contextlib import contextmanager
+from collections import namedtuple
 
 #  Database Configuration
 DB_NAME = "postgres"
@@ -87,34 +103,431 @@ DB_PASSWORD = "admin123"
 DB_HOST = "localhost"
 DB_PORT = "5432"
 
-#  Connect to PostgreSQL
-def connect_to_db():
+#  Connection Pool Settings
+DB_POOL_MIN = 1
+DB_POOL_MAX = 8
+DB_POOL_TIMEOUT = 10  # Seconds to wait for a free connection before giving up
+
+#  Pooled, persistent PostgreSQL connections (shared by the live loop and every helper)
+db_pool = psycopg2.pool.ThreadedConnectionPool(
+    DB_POOL_MIN,
+    DB_POOL_MAX,
+    dbname=DB_NAME,
+    user=DB_USER,
+    password=DB_PASSWORD,
+    host=DB_HOST,
+    port=DB_PORT
+)
+logging.info(f" Database connection pool ready (min={DB_POOL_MIN}, max={DB_POOL_MAX})")
+
+_db_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+_db_pool_lock = threading.Lock()
+_unit_of_work = threading.local()
+
+#  Pool metrics → exposed through get_db_pool_stats()
+db_pool_stats = {
+    "checkouts": 0,
+    "in_use": 0,
+    "wait_seconds_total": 0.0,
+    "wait_seconds_max": 0.0,
+    "checkout_seconds_total": 0.0,
+    "checkout_seconds_max": 0.0,
+}
+
+def checkout_db_connection():
+    """
+    Checks a connection out of the pool, waiting up to DB_POOL_TIMEOUT seconds for a free one.
+    Records wait time (queueing for a slot) and checkout latency (wait + getconn).
+    """
+    start = time.perf_counter()
+    if not _db_pool_slots.acquire(timeout=DB_POOL_TIMEOUT):
+        raise psycopg2.pool.PoolError(f"No free database connection after {DB_POOL_TIMEOUT}s")
+    waited = time.perf_counter() - start
+
+    try:
+        conn = db_pool.getconn()
+    except Exception:
+        _db_pool_slots.release()
+        raise
+    elapsed = time.perf_counter() - start
+
+    with _db_pool_lock:
+        db_pool_stats["checkouts"] += 1
+        db_pool_stats["in_use"] += 1
+        db_pool_stats["wait_seconds_total"] += waited
+        db_pool_stats["wait_seconds_max"] = max(db_pool_stats["wait_seconds_max"], waited)
+        db_pool_stats["checkout_seconds_total"] += elapsed
+        db_pool_stats["checkout_seconds_max"] = max(db_pool_stats["checkout_seconds_max"], elapsed)
+    return conn
+
+def release_db_connection(conn):
+    """
+    Returns a connection to the pool (broken connections are discarded and replaced on demand).
+    """
+    try:
+        db_pool.putconn(conn, close=bool(conn.closed))
+    finally:
+        with _db_pool_lock:
+            db_pool_stats["in_use"] -= 1
+        _db_pool_slots.release()
+
+def get_db_pool_stats():
+    """
+    Returns a snapshot of pool size, connections in use, and average/max wait and checkout latency.
+    """
+    with _db_pool_lock:
+        stats = dict(db_pool_stats)
+    checkouts = max(stats["checkouts"], 1)
+    stats["size"] = DB_POOL_MAX
+    stats["idle"] = DB_POOL_MAX - stats["in_use"]
+    stats["wait_seconds_avg"] = stats["wait_seconds_total"] / checkouts
+    stats["checkout_seconds_avg"] = stats["checkout_seconds_total"] / checkouts
+    return stats
+
+@contextmanager
+def candle_unit_of_work():
+    """
+    Per-candle unit of work. Every db_cursor() opened inside it (on this thread) runs on one
+    pooled connection, so the bar insert and all indicator writes for a token commit together.
+    """
+    conn = checkout_db_connection()
+    _unit_of_work.conn = conn
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        _unit_of_work.conn = None
+        release_db_connection(conn)
+
+#  Cursor counting DB round trips and rows read / written per statement kind
+class MeteredCursor(psycopg2.extensions.cursor):
+    def execute(self, query, vars=None):
+        if not metrics.enabled:
+            return super().execute(query, vars)
+
+        kind = statement_kind(query)
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            metrics.observe("db_statement", time.perf_counter() - start, kind=kind)
+            metrics.count("db_round_trips_total", kind=kind)
+            if kind != "select" and self.rowcount > 0:
+                metrics.count("db_rows_written_total", self.rowcount, kind=kind)
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None:
+            metrics.count("db_rows_read_total")
+        return row
+
+    def fetchall(self):
+        rows = super().fetchall()
+        metrics.count("db_rows_read_total", len(rows))
+        return rows
+
+def statement_kind(query):
+    """
+    First SQL keyword of a statement (select / insert / update / ...), for metric labels.
+    """
+    if isinstance(query, bytes):
+        query = query[:32].decode(errors="ignore")
+    elif not isinstance(query, str):
+        return "composed"
+    words = query.split(None, 1)
+    return words[0].lower() if words else "empty"
+
+@contextmanager
+def db_cursor():
+    """
+    Yields a cursor for one helper's statements.
+    Inside candle_unit_of_work() it runs on the unit's connection under a savepoint, so a failing
+    helper is rolled back on its own; otherwise a pooled connection is used and committed on exit.
+    """
+    conn = getattr(_unit_of_work, "conn", None)
+
+    if conn is not None:
+        cur = conn.cursor(cursor_factory=MeteredCursor)
+        cur.execute("SAVEPOINT db_cursor;")
+        try:
+            yield cur
+            cur.execute("RELEASE SAVEPOINT db_cursor;")
+        except Exception:
+            cur.execute("ROLLBACK TO SAVEPOINT db_cursor;")
+            raise
+        finally:
+            cur.close()
+        return
+
+    conn = checkout_db_connection()
+    try:
+        with conn.cursor(cursor_factory=MeteredCursor) as cur:
+            yield cur
+        conn.commit()
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        release_db_connection(conn)
+
+#  Process-level schema cache → {table_name: set of column names}
+#  Filled once per table (at creation or first use) and invalidated only on DDL
+table_columns_cache = {}
+
+def get_table_columns(cur, table_name):
+    """
+    Returns the column names of table_name, querying information_schema only on a cache miss.
+    """
+    columns = table_columns_cache.get(table_name)
+    if columns is None:
+        cur.execute("""
+            SELECT column_name
+            FROM information_schema.columns
+            WHERE table_name = %s;
+        """, (table_name,))
+        columns = {row[0] for row in cur.fetchall()}
+        if columns:  # Never cache a table that does not exist (yet)
+            table_columns_cache[table_name] = columns
+    return columns
+
+def ensure_table_columns(cur, table_name, columns, column_type="FLOAT"):
+    """
+    Adds every missing column of `columns` to table_name in one batched ALTER TABLE
+    and keeps the schema cache in sync. Returns the list of columns that were added.
+    """
+    existing = get_table_columns(cur, table_name)
+    missing = [column for column in columns if column not in existing]
+
+    if missing:
+        add_clause = ", ".join(f"ADD COLUMN IF NOT EXISTS {column} {column_type}" for column in missing)
+        cur.execute(f"ALTER TABLE {table_name} {add_clause};")
+        table_columns_cache[table_name] = existing | set(missing)
+        logging.info(f" Added missing columns {missing} to table {table_name}")
+
+    return missing
+
+def invalidate_table_columns(table_name):
+    """
+    Drops the cached schema of table_name (call after any DDL on it).
+    """
+    table_columns_cache.pop(table_name, None)
+
+#  Candle / Indicator Store
+#  One long-format table for every contract and timeframe, keyed by (instrument_token, timeframe, timestamp)
+#  and range-partitioned by trading day. A contract's candles are a series of it, not a table of their own,
+#  so a contract switch is a different filter and old strikes keep their history until their day is pruned.
+OHLC_TABLE = "ohlc_candles"
+OHLC_RETENTION_DAYS = 30  # Trading-day partitions older than this are dropped at startup
+SERIES_FILTER = "instrument_token = %s AND timeframe = %s"
+
+class CandleSeries(namedtuple("CandleSeries", ["token", "timeframe", "symbol"])):
+    """
+    One contract's candles of one timeframe (minutes) in OHLC_TABLE.
+    """
+    __slots__ = ()
+
+    def __str__(self):
+        return f"{self.symbol} {self.timeframe}-min"
+
+def ohlc_series(token, symbol, timeframe):
+    return CandleSeries(int(token), int(timeframe), symbol)
+
+def series_token(series, *args, **kwargs):
+    # Token label of a per-series stage timer (first argument is the series)
+    return series.token
+
+def create_ohlc_store():
+    """
+    Creates the partitioned candle / indicator table and its indexes if they do not exist.
+    Prices and indicators are REAL, the oscillation state is SMALLINT; the primary key serves
+    series scans and a BRIN index on timestamp serves time-range scans across series.
+    """
+    try:
+        with db_cursor() as cur:
+            cur.execute(f"""
+                CREATE TABLE IF NOT EXISTS {OHLC_TABLE} (
+                    instrument_token INTEGER NOT NULL,
+                    timeframe SMALLINT NOT NULL,
+                    timestamp TIMESTAMPTZ NOT NULL,
+                    open REAL,
+                    high REAL,
+                    low REAL,
+                    close REAL,
+                    volume BIGINT,
+                    adx REAL,
+                    di_plus REAL,
+                    di_minus REAL,
+                    ema_22 REAL,
+                    ema_33 REAL,
+                    stoch_k REAL,
+                    stoch_d REAL,
+                    odd_bull REAL,
+                    odd_bear REAL,
+                    odd_stagnant REAL,
+                    hl2 REAL,
+                    atr REAL,
+                    initial_upper_bar REAL,
+                    initial_lower_bar REAL,
+                    supertrend_upper REAL,
+                    supertrend_lower REAL,
+                    os SMALLINT,
+                    spt REAL,
+                    max_channel REAL,
+                    min_channel REAL,
+                    supertrend_avg REAL,
+                    PRIMARY KEY (instrument_token, timeframe, timestamp)
+                ) PARTITION BY RANGE (timestamp);
+            """)
+            cur.execute(f"CREATE INDEX IF NOT EXISTS {OHLC_TABLE}_timestamp_brin ON {OHLC_TABLE} USING BRIN (timestamp);")
+
+            # Fill the schema cache once
+            get_table_columns(cur, OHLC_TABLE)
+
+        logging.info(f" Candle store {OHLC_TABLE} ready")
+
+    except Exception as e:
+        logging.error(f" Failed to create candle store {OHLC_TABLE}: {e}")
+
+#  Trading days that already have a partition (filled on creation, cleared on prune)
+ohlc_partitions = set()
+ohlc_partitions_lock = threading.Lock()
+
+def ohlc_partition_name(day):
+    return f"{OHLC_TABLE}_{day:%Y%m%d}"
+
+def ensure_ohlc_partitions(days):
+    """
+    Creates the missing trading-day partitions of OHLC_TABLE. Runs on its own pooled connection
+    and commits immediately, so call it before opening a unit of work that writes those days.
+    """
+    missing = set(days) - ohlc_partitions
+    if not missing:
+        return
+
+    with ohlc_partitions_lock:
+        missing -= ohlc_partitions
+        if not missing:
+            return
+
+        conn = checkout_db_connection()
+        try:
+            with conn.cursor(cursor_factory=MeteredCursor) as cur:
+                for day in sorted(missing):
+                    # Bounds in exchange time (IST), so a partition holds exactly one trading day
+                    cur.execute(f"""
+                        CREATE TABLE IF NOT EXISTS {ohlc_partition_name(day)}
+                        PARTITION OF {OHLC_TABLE}
+                        FOR VALUES FROM (%s) TO (%s);
+                    """, (f"{day} 00:00+05:30", f"{day + datetime.timedelta(days=1)} 00:00+05:30"))
+            conn.commit()
+            ohlc_partitions.update(missing)
+            logging.info(f" Created {OHLC_TABLE} partitions for {', '.join(str(day) for day in sorted(missing))}")
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            release_db_connection(conn)
+
+def prune_ohlc_partitions(retention_days=OHLC_RETENTION_DAYS, today=None):
+    """
+    Drops every trading-day partition older than retention_days (a metadata-only DROP per day).
+    """
+    cutoff = (today or datetime.date.today()) - datetime.timedelta(days=retention_days)
     try:
-        conn = psycopg2.connect(
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            host=DB_HOST,
-            port=DB_PORT
-        )
-        conn.autocommit = True  # Enable autocommit mode
-        return conn
+        with db_cursor() as cur:
+            cur.execute("""
+                SELECT child.relname
+                FROM pg_inherits
+                JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+                JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+                WHERE parent.relname = %s;
+            """, (OHLC_TABLE,))
+
+            for (partition,) in cur.fetchall():
+                day = datetime.datetime.strptime(partition.rsplit("_", 1)[-1], "%Y%m%d").date()
+                if day < cutoff:
+                    cur.execute(f"DROP TABLE IF EXISTS {partition};")
+                    ohlc_partitions.discard(day)
+                    logging.info(f" Dropped {OHLC_TABLE} partition {partition} (older than {retention_days} days)")
+
     except Exception as e:
-        logging.error(f" Failed to connect to database: {e}")
-        return None
-connect_to_db()
+        logging.error(f" Error pruning {OHLC_TABLE} partitions: {e}")
+
+#  Bulk write-back of computed indicator columns
+def bulk_update_series(cur, series, df, columns):
+    """
+    Writes the given indicator columns of df back to one series in a single round trip.
+    Rows are staged with execute_values as one VALUES list and applied with a single
+    UPDATE ... FROM join on timestamp. NaN values are written as NULL.
+
+    Args:
+        cur: Open cursor to write through (caller commits).
+        series (CandleSeries): Contract / timeframe whose rows are updated.
+        df (pd.DataFrame): Must contain 'timestamp' and every name in columns.
+        columns (list): Indicator columns to write (same names in df and table).
+
+    Returns:
+        int: Number of rows written.
+    """
+    if df.empty:
+        return 0
+
+    start = time.perf_counter()
+
+    rows = [
+        (row[0],) + tuple(None if pd.isna(value) else float(value) for value in row[1:])
+        for row in df[["timestamp"] + columns].itertuples(index=False, name=None)
+    ]
+
+    set_clause = ", ".join(f"{column} = v.{column}" for column in columns)
+    value_columns = ", ".join(["timestamp"] + columns)
+    template = "(" + ", ".join(["%s::timestamptz"] + ["%s::float8"] * len(columns)) + ")"
+
+    execute_values(cur, f"""
+        UPDATE {OHLC_TABLE} AS t
+        SET {set_clause}
+        FROM (VALUES %s) AS v({value_columns})
+        WHERE t.instrument_token = {int(series.token)}
+          AND t.timeframe = {int(series.timeframe)}
+          AND t.timestamp = v.timestamp;
+    """, rows, template=template, page_size=len(rows))
+
+    elapsed = time.perf_counter() - start
+    rows_per_sec = len(rows) / elapsed if elapsed > 0 else float("inf")
+    logging.info(f" Bulk updated {len(rows)} rows [{', '.join(columns)}] in {series} "
+                 f"in {elapsed:.3f}s ({rows_per_sec:.0f} rows/sec)")
+    return len(rows)
 
 #Fetch nifty index price 
+#  Last-price cache fed by on_ticks (REST LTP only when the streamed value is stale)
+from price_cache import LastPriceCache
+
+NIFTY_INDEX_TOKEN = 256265
+LTP_MAX_AGE = 5.0          # Seconds a streamed index price is trusted
+OPTION_LTP_MAX_AGE = 60.0  # Seconds a streamed option price is trusted
+
+last_prices = LastPriceCache(max_age=LTP_MAX_AGE)
+
 def get_nifty50_price():
     """
-    Fetches the real-time Nifty 50 index price with retry logic.
+    Returns the Nifty 50 index price from the websocket cache, falling back to
+    kite.ltp (with retry logic) when the streamed price is missing or stale.
     """
+    nifty_price = last_prices.last_price(NIFTY_INDEX_TOKEN)
+    if nifty_price is not None:
+        return nifty_price
+
     retries = 5
     for attempt in range(retries):
         try:
             nifty_data = kite.ltp("NSE:NIFTY 50")
             nifty_price = nifty_data["NSE:NIFTY 50"]["last_price"]
             logging.info(f"Fetched Nifty 50 Index Price: {nifty_price}")
+            last_prices.update(NIFTY_INDEX_TOKEN, nifty_price)
             return nifty_price
         except Exception as e:
             logging.warning(f" Attempt {attempt + 1}/{retries}: Error fetching Nifty 50 price: {e}")
@@ -123,17 +536,25 @@ def get_nifty50_price():
     logging.error(" Failed to fetch Nifty 50 price after retries.")
     return None
 
-# Get all available option instruments
-option_instruments = kite.instruments("NFO")
+# Get all available option instruments (indexed, cached on disk and downloaded at most once per day)
+from instrument_index import InstrumentIndex
+
+INSTRUMENT_CACHE_DIR = "instrument_cache"
+instrument_index = InstrumentIndex.load(kite, "NFO", cache_dir=INSTRUMENT_CACHE_DIR)
 
 
 #Fetch nifty 50 option price 
 def get_nifty50_option_price(option_token):
     """
-    Fetches the real-time price of the Nifty 50 option contract from Zerodha API.
+    Returns the price of the Nifty 50 option contract from the websocket cache, falling
+    back to the Zerodha LTP API when the streamed price is missing or stale.
     :param option_token: Instrument token of the Nifty 50 option contract.
     :return: Last traded price (LTP) of the option contract.
     """
+    option_price = last_prices.last_price(option_token, max_age=OPTION_LTP_MAX_AGE)
+    if option_price is not None:
+        return option_price
+
     try:
         logging.info(f"Fetching LTP for token: {option_token}")
         
@@ -149,6 +570,7 @@ def get_nifty50_option_price(option_token):
         if token_str in option_data:
             option_price = option_data[token_str]["last_price"]
             logging.info(f" Fetched Nifty 50 Option Price: {option_price}")
+            last_prices.update(option_token, option_price)
             return option_price
         else:
             logging.error(f" LTP response does not contain expected token: {option_token}")
@@ -162,28 +584,16 @@ def get_nifty50_option_price(option_token):
 import datetime
 import logging
 
-#Fetch nifty custom weekly expiry date
+#Fetch nifty nearest weekly expiry date
 def get_custom_nifty_expiry():
     """
-    Returns a manually mapped expiry date based on today's date for Nifty 50 contracts.
+    Returns the nearest listed Nifty 50 option expiry (weekly or monthly) on or after today,
+    taken from the instrument index.
     """
-    today = datetime.date.today()
-
-
-
-    if today <= datetime.date(today.year, 6, 5):
-        return datetime.date(today.year, 6, 5)  # Weekly expiry
-    elif today <= datetime.date(today.year, 6, 12):
-        return datetime.date(today.year, 6, 12)  # Weekly expiry
-    elif today <= datetime.date(today.year, 6, 19):
-        return datetime.date(today.year, 6, 19)  # Monthly expiry
-    elif today <= datetime.date(today.year, 6, 26):
-        return datetime.date(today.year, 6, 26)  # Weekly expiry
-    elif today <= datetime.date(today.year, 7, 3):
-        return datetime.date(today.year, 7, 3)  # Weekly expiry
-    else:
-        logging.error(" No predefined expiry date available for current date.")
-        return None
+    expiry = instrument_index.next_expiry("NIFTY", datetime.date.today())
+    if expiry is None:
+        logging.error(" No listed NIFTY expiry available for current date.")
+    return expiry
 
 
 # Find the nearest OTM CE contract based on the Nifty index price
@@ -194,22 +604,15 @@ def get_nearest_otm_ce_contract(nifty_index_price):
         if not expiry:
             return None, None
 
-        ce_options = [
-            inst for inst in option_instruments
-            if inst["name"] == "NIFTY"
-            and inst["instrument_type"] == "CE"
-            and inst["expiry"] == expiry
-        ]
+        #  Nearest OTM CE: Next strike ABOVE the current price (binary search on the strike ladder)
+        otm_ce_strike = int(math.ceil(nifty_index_price / 50) * 50)
 
-        if not ce_options:
+        best_ce = instrument_index.nearest_strike("NIFTY", expiry, "CE", otm_ce_strike)
+
+        if not best_ce:
             logging.warning(" No CE contracts found for selected expiry.")
             return None, None
 
-        #  Nearest OTM CE: Next strike ABOVE the current price
-        otm_ce_strike = int(math.ceil(nifty_index_price / 50) * 50)
-
-        best_ce = min(ce_options, key=lambda x: abs(x["strike"] - otm_ce_strike))
-
         ltp = get_nifty50_option_price(best_ce["instrument_token"])
         logging.info(f" CE OTM Contract: {best_ce['tradingsymbol']} | Token: {best_ce['instrument_token']} | 💰 LTP: {ltp}")
         return best_ce["tradingsymbol"], best_ce["instrument_token"]
@@ -225,22 +628,15 @@ def get_nearest_otm_pe_contract(nifty_index_price):
         if not expiry:
             return None, None
 
-        pe_options = [
-            inst for inst in option_instruments
-            if inst["name"] == "NIFTY"
-            and inst["instrument_type"] == "PE"
-            and inst["expiry"] == expiry
-        ]
+        #  Nearest OTM PE: Next strike BELOW the current price (binary search on the strike ladder)
+        otm_pe_strike = int(math.floor(nifty_index_price / 50) * 50)
 
-        if not pe_options:
+        best_pe = instrument_index.nearest_strike("NIFTY", expiry, "PE", otm_pe_strike)
+
+        if not best_pe:
             logging.warning(" No PE contracts found for selected expiry.")
             return None, None
 
-        #  Nearest OTM PE: Next strike BELOW the current price
-        otm_pe_strike = int(math.floor(nifty_index_price / 50) * 50)
-
-        best_pe = min(pe_options, key=lambda x: abs(x["strike"] - otm_pe_strike))
-
         ltp = get_nifty50_option_price(best_pe["instrument_token"])
         logging.info(f" PE OTM Contract: {best_pe['tradingsymbol']} | Token: {best_pe['instrument_token']} | 💰 LTP: {ltp}")
         return best_pe["tradingsymbol"], best_pe["instrument_token"]
@@ -249,10 +645,13 @@ def get_nearest_otm_pe_contract(nifty_index_price):
         logging.error(f" Error in get_nearest_otm_pe_contract: {e}")
         return None, None
 
+#  Candle timeframes (minutes → Kite historical interval); every timeframe is its own series in OHLC_TABLE
+CANDLE_TIMEFRAMES = {1: "minute", 3: "3minute", 5: "5minute", 15: "15minute", 60: "60minute"}
+
 def get_nearest_otm_ce_pe_tables(nifty_price):
     """
     Fetch nearest OTM CE & PE contracts based on latest NIFTY price
-    and return their respective 5-minute OHLC table names and metadata.
+    and return their respective 5-minute OHLC series and metadata.
     """
     ce_symbol, ce_token = get_nearest_otm_ce_contract(nifty_price)
     pe_symbol, pe_token = get_nearest_otm_pe_contract(nifty_price)
@@ -261,119 +660,26 @@ def get_nearest_otm_ce_pe_tables(nifty_price):
         logging.error(" Failed to fetch nearest OTM CE/PE contracts.")
         return None
 
+    ce_row = instrument_index.by_token(ce_token)
+    pe_row = instrument_index.by_token(pe_token)
+
     return {
         "CE": {
             "symbol": ce_symbol,
             "token": ce_token,
-            "table_5min": f"{ce_symbol.lower()}_ohlc_5min"
+            "strike": ce_row["strike"],
+            "expiry": ce_row["expiry"],
+            "series_5min": ohlc_series(ce_token, ce_symbol, 5)
         },
         "PE": {
             "symbol": pe_symbol,
             "token": pe_token,
-            "table_5min": f"{pe_symbol.lower()}_ohlc_5min"
+            "strike": pe_row["strike"],
+            "expiry": pe_row["expiry"],
+            "series_5min": ohlc_series(pe_token, pe_symbol, 5)
         }
     }
 
-def create_nearest_otm_ohlc_tables(ce_symbol, pe_symbol):
-    """
-    Create 5-minute OHLC tables for nearest OTM CE and PE contracts.
-    Drops existing tables and recreates with required structure for:
-    - ADX and DI indicators
-    - CBOE (Stoch RSI + Market Index + Odds) indicator
-    """
-
-    conn = connect_to_db()
-    if conn:
-        try:
-            cur = conn.cursor()
-
-            # Define table names
-            ce_table_5min = f"{ce_symbol.lower()}_ohlc_5min"
-            pe_table_5min = f"{pe_symbol.lower()}_ohlc_5min"
-
-            # Drop existing 5-min tables if exist
-            for table in [ce_table_5min, pe_table_5min]:
-                cur.execute(f"DROP TABLE IF EXISTS {table} CASCADE;")
-                logging.info(f" Dropped existing table if present: {table}")
-
-            # Create CE 5-min table
-            cur.execute(f"""
-                CREATE TABLE {ce_table_5min} (
-                    timestamp TIMESTAMPTZ PRIMARY KEY,
-                    open FLOAT,
-                    high FLOAT,
-                    low FLOAT,
-                    close FLOAT,
-                    volume FLOAT,
-                    adx FLOAT,
-                    di_plus FLOAT,
-                    di_minus FLOAT,
-                    ema_22 FLOAT,
-                    ema_33 FLOAT,
-                    stoch_k FLOAT,
-                    stoch_d FLOAT,
-                    odd_bull FLOAT,
-                    odd_bear FLOAT,
-                    odd_stagnant FLOAT,
-                    hl2 FLOAT,
-                    atr FLOAT,
-                    initial_upper_bar FLOAT,
-                    initial_lower_bar FLOAT,
-                    supertrend_upper FLOAT,
-                    supertrend_lower FLOAT,
-                    os FLOAT,
-                    spt FLOAT,
-                    max_channel FLOAT,
-                    min_channel FLOAT,
-                    supertrend_avg FLOAT
-
-                );
-            """)
-
-            # Create PE 5-min table
-            cur.execute(f"""
-                CREATE TABLE {pe_table_5min} (
-                    timestamp TIMESTAMPTZ PRIMARY KEY,
-                    open FLOAT,
-                    high FLOAT,
-                    low FLOAT,
-                    close FLOAT,
-                    volume FLOAT,
-                    adx FLOAT,
-                    di_plus FLOAT,
-                    di_minus FLOAT,
-                    ema_22 FLOAT,
-                    ema_33 FLOAT,
-                    stoch_k FLOAT,
-                    stoch_d FLOAT,
-                    odd_bull FLOAT,
-                    odd_bear FLOAT,
-                    odd_stagnant FLOAT,
-                    hl2 FLOAT,
-                    atr FLOAT,
-                    initial_upper_bar FLOAT,
-                    initial_lower_bar FLOAT,
-                    supertrend_upper FLOAT,
-                    supertrend_lower FLOAT,
-                    os FLOAT,
-                    spt FLOAT,
-                    max_channel FLOAT,
-                    min_channel FLOAT,
-                    supertrend_avg FLOAT
-                );
-            """)
-
-            conn.commit()
-            logging.info(" Created fresh 5-minute OHLC tables for Nearest OTM CE/PE successfully.")
-
-            cur.close()
-            conn.close()
-
-        except Exception as e:
-            logging.error(f" Failed to create 5-minute OHLC tables for Nearest OTM CE/PE: {e}")
-
-
-
 #  Step 1: Fetch Latest Nifty 50 Price
 nifty_price = get_nifty50_price()
 
@@ -387,11 +693,9 @@ if nearest_contracts:
     print("\n Nearest OTM PE Contract Details:")
     print(nearest_contracts["PE"])
 
-    #  Step 3: Create Fresh OHLC Tables for Nearest OTM CE & PE
-    create_nearest_otm_ohlc_tables(
-        nearest_contracts["CE"]["symbol"],
-        nearest_contracts["PE"]["symbol"]
-    )
+    #  Step 3: Make sure the candle store exists and drop expired trading days
+    create_ohlc_store()
+    prune_ohlc_partitions()
 
 else:
     print(" Failed to fetch nearest CE/PE contracts. Exiting...")
@@ -407,29 +711,22 @@ def get_ce_contracts(nifty_index_price):
         if not expiry:
             return []
 
-        ce_options = [
-            inst for inst in option_instruments
-            if inst["name"] == "NIFTY"
-            and inst["instrument_type"] == "CE"
-            and inst["expiry"] == expiry
-        ]
-
-        if not ce_options:
-            logging.warning(" No CE contracts found for selected expiry.")
-            return []
-
         lower_limit = int(math.floor((nifty_index_price - 500) / 50) * 50)
         upper_limit = int(math.floor((nifty_index_price + 500) / 50) * 50)
 
-        selected_contracts = []
+        #  Strike range straight from the sorted strike ladder (only the 50-point steps)
+        selected_contracts = [
+            {
+                "symbol": option["tradingsymbol"],
+                "token": option["instrument_token"]
+            }
+            for option in instrument_index.strikes_between("NIFTY", expiry, "CE", lower_limit, upper_limit)
+            if (option["strike"] - lower_limit) % 50 == 0
+        ]
 
-        for strike in range(lower_limit, upper_limit + 1, 50):
-            for option in ce_options:
-                if option["strike"] == strike:
-                    selected_contracts.append({
-                        "symbol": option["tradingsymbol"],
-                        "token": option["instrument_token"]
-                    })
+        if not selected_contracts:
+            logging.warning(" No CE contracts found for selected expiry.")
+            return []
 
         logging.info(f" Total CE Contracts Found: {len(selected_contracts)}")
         return selected_contracts
@@ -449,29 +746,22 @@ def get_pe_contracts(nifty_index_price):
         if not expiry:
             return []
 
-        pe_options = [
-            inst for inst in option_instruments
-            if inst["name"] == "NIFTY"
-            and inst["instrument_type"] == "PE"
-            and inst["expiry"] == expiry
-        ]
-
-        if not pe_options:
-            logging.warning(" No PE contracts found for selected expiry.")
-            return []
-
         lower_limit = int(math.floor((nifty_index_price - 500) / 50) * 50)
         upper_limit = int(math.floor((nifty_index_price + 500) / 50) * 50)
 
-        selected_contracts = []
+        #  Strike range straight from the sorted strike ladder (only the 50-point steps)
+        selected_contracts = [
+            {
+                "symbol": option["tradingsymbol"],
+                "token": option["instrument_token"]
+            }
+            for option in instrument_index.strikes_between("NIFTY", expiry, "PE", lower_limit, upper_limit)
+            if (option["strike"] - lower_limit) % 50 == 0
+        ]
 
-        for strike in range(lower_limit, upper_limit + 1, 50):
-            for option in pe_options:
-                if option["strike"] == strike:
-                    selected_contracts.append({
-                        "symbol": option["tradingsymbol"],
-                        "token": option["instrument_token"]
-                    })
+        if not selected_contracts:
+            logging.warning(" No PE contracts found for selected expiry.")
+            return []
 
         logging.info(f" Total PE Contracts Found: {len(selected_contracts)}")
         return selected_contracts
@@ -503,6 +793,11 @@ print("PE Contracts:")
 for contract in contracts['pe_contracts']:
     print(contract)
 
+from backfill import HistoricalBackfill
+from candle_store import PYARROW_AVAILABLE, CandleStore
+from gap_planner import GapPlanner, exchange_time
+from broker_client import IST
+
 #List of market holidays
 #  Market Holidays for 2025
 MARKET_HOLIDAYS = {
@@ -512,179 +807,137 @@ MARKET_HOLIDAYS = {
     "2025-11-05", "2025-12-25"
 }
 
-#  Fetch last trading day's OHLC data for a single table (dynamic)
-def fetch_last_trading_day_ohlc_for_table(table_name, instrument_token, interval):
-    """
-    Fetches last trading day's OHLC data for the given table and instrument token.
-    Used when switching nearest ITM CE/PE contracts dynamically.
-
-    Args:
-        table_name (str): Name of the database table (example: nifty25apr23850ce_ohlc_1min)
-        instrument_token (int): Instrument token of the option contract
-        interval (str): "minute" for 1-min data, "5minute" for 5-min data
-    """
-
-    try:
-        conn = connect_to_db()
-        if not conn:
-            return None
-
-        cur = conn.cursor()
-
-        now = datetime.datetime.now()
-        last_trading_day = now - datetime.timedelta(days=1)
-
-        #  Ensure we pick previous working day (skip weekends and holidays)
-        while last_trading_day.strftime("%Y-%m-%d") in MARKET_HOLIDAYS or last_trading_day.weekday() in [5, 6]:
-            last_trading_day -= datetime.timedelta(days=1)
-
-        from_date = last_trading_day.strftime("%Y-%m-%d 09:15:00")
-        to_date = last_trading_day.strftime("%Y-%m-%d 15:30:00")
+#  Historical Backfill Settings
+BACKFILL_WORKERS = 6  # Concurrent historical_data fetches (kept below DB_POOL_MAX)
 
-        logging.info(f" Fetching last trading day's {interval} data for token {instrument_token}: {from_date} to {to_date}")
+#  Expected 09:15–15:30 bar grid of every trading day (weekends and MARKET_HOLIDAYS skipped)
+gap_planner = GapPlanner(MARKET_HOLIDAYS)
 
-        # Fetch Historical Data
-        historical_data = kite.historical_data(
-            instrument_token=instrument_token,
-            from_date=from_date,
-            to_date=to_date,
-            interval=interval
-        )
-
-        if historical_data:
-            df = pd.DataFrame(historical_data)
-            df["timestamp"] = pd.to_datetime(df["date"])
-            df.drop(columns=["date"], inplace=True)
-
-            for _, row in df.iterrows():
-                cur.execute(f"""
-                    INSERT INTO {table_name} (timestamp, open, high, low, close, volume)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (timestamp) DO NOTHING;
-                """, (
-                    row["timestamp"],
-                    row["open"],
-                    row["high"],
-                    row["low"],
-                    row["close"],
-                    row["volume"]  #  Added for CBOE indicator
-                ))
-
-            conn.commit()
-            logging.info(f"Last trading day's {interval} data inserted into {table_name} successfully.")
-        else:
-            logging.warning(f" No historical data found for token {instrument_token}.")
-
-        cur.close()
-        conn.close()
-
-    except Exception as e:
-        logging.error(f" Error fetching last trading day's {interval} data for table {table_name}: {e}")
-        return None
-
-
-
-#  Fetch & Merge Today's Data for a Specific 5-Min Table (CE or PE)
-def fetch_and_merge_ohlc_for_table(table_name, instrument_token, interval="5minute"):
+def get_last_trading_day(now=None):
     """
-    Fetch and merge today's OHLC data (including last trading day's) for a 5-minute table.
+    Previous working day before `now` (skips weekends and MARKET_HOLIDAYS).
     """
+    return gap_planner.previous_trading_day((now or datetime.datetime.now()).date())
 
-    conn = connect_to_db()
-    if not conn:
-        return
+def get_stored_bar_times(series_list, start, end):
+    """
+    Stored bar timestamps of every series with start <= timestamp <= end, in one query.
+    Returns {series: set of timestamps}.
+    """
+    stored = {series: set() for series in series_list}
+    keys = {(series.token, series.timeframe): series for series in series_list}
+    if not keys:
+        return stored
 
-    cur = conn.cursor()
+    with db_cursor() as cur:
+        cur.execute(f"""
+            SELECT instrument_token, timeframe, timestamp
+            FROM {OHLC_TABLE}
+            WHERE (instrument_token, timeframe) IN %s
+              AND timestamp >= %s AND timestamp <= %s;
+        """, (tuple(keys), start, end))
+        for token, timeframe, timestamp in cur.fetchall():
+            stored[keys[(token, timeframe)]].add(timestamp)
+
+    return stored
+
+@metrics.timed("insert_candles", token_of=series_token)
+def insert_candles(series, candles):
+    """
+    Inserts kite.historical_data candles into one OHLC series with one multi-row
+    INSERT ... ON CONFLICT DO NOTHING. Returns the number of new rows.
+    """
+    rows = [
+        (series.token, series.timeframe, candle["date"], candle["open"], candle["high"],
+         candle["low"], candle["close"], candle["volume"])
+        for candle in candles
+    ]
+    if not rows:
+        return 0
 
-    # Step 1: Fetch Last Trading Day's Data
-    fetch_last_trading_day_ohlc_for_table(table_name, instrument_token, interval)
+    ensure_ohlc_partitions({candle["date"].date() for candle in candles})
 
-    # Step 2: Fetch Today's Data up to current completed candle
-    now = datetime.datetime.now()
-    from_date = now.replace(hour=9, minute=15, second=0).strftime("%Y-%m-%d %H:%M:%S")
-    to_date = now.replace(minute=(now.minute // 5) * 5, second=0).strftime("%Y-%m-%d %H:%M:%S")
+    with db_cursor() as cur:
+        execute_values(cur, f"""
+            INSERT INTO {OHLC_TABLE} (instrument_token, timeframe, timestamp, open, high, low, close, volume)
+            VALUES %s
+            ON CONFLICT (instrument_token, timeframe, timestamp) DO NOTHING;
+        """, rows, page_size=len(rows))
+        return cur.rowcount
 
-    logging.info(f" Fetching today's {interval} data for {table_name} from {from_date} to {to_date}")
+#  Local Parquet candle store in front of historical_data (only missing ranges hit the API)
+CANDLE_STORE_DIR = "candle_store"
+candle_store = CandleStore(CANDLE_STORE_DIR) if PYARROW_AVAILABLE else None
+logging.info(f" Candle store: {CANDLE_STORE_DIR if candle_store else 'disabled (pyarrow not installed)'}")
 
-    try:
-        data = kite.historical_data(
-            instrument_token=instrument_token,
-            from_date=from_date,
-            to_date=to_date,
-            interval=interval
-        )
-
-        if data:
-            df = pd.DataFrame(data)
-            df["timestamp"] = pd.to_datetime(df["date"])
-            df.drop(columns=["date"], inplace=True)
-
-            for _, row in df.iterrows():
-                cur.execute(f"""
-                    INSERT INTO {table_name} (timestamp, open, high, low, close, volume)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (timestamp) DO NOTHING;
-                """, (
-                    row["timestamp"],
-                    row["open"],
-                    row["high"],
-                    row["low"],
-                    row["close"],
-                    row["volume"]  #  Volume added for CBOE indicator
-                ))
+historical_backfill = HistoricalBackfill(kite, insert_candles, workers=BACKFILL_WORKERS, store=candle_store)
 
-            conn.commit()
-            logging.info(f" Today's {interval} data merged into {table_name} successfully!")
+#  Backfill many OHLC series at once (CE/PE, any timeframe)
+@metrics.timed("backfill")
+def backfill_ohlc_series(series_list, now=None):
+    """
+    Completes every series from the last trading day's open up to its last closed bar.
+    The stored bars are compared with the expected bar grid and only the missing windows
+    are requested (neighbouring missing bars in one request), concurrently within Kite's
+    historical-API rate limit; each series' candles are bulk inserted.
 
-        else:
-            logging.warning(f" No today's {interval} data fetched for {table_name}")
+    With the candle store, each series is one job spanning its missing windows: the store
+    splits it into the days it does not hold yet, so no day is fetched (or written) twice.
+    """
+    now = now or datetime.datetime.now(IST)
+    start = datetime.datetime.combine(get_last_trading_day(now), gap_planner.session_open, IST)
 
+    try:
+        stored = get_stored_bar_times(series_list, start, now)
     except Exception as e:
-        logging.error(f" Error fetching today's {interval} data for {table_name}: {e}")
-
-    finally:
-        cur.close()
-        conn.close()
-
-fetch_and_merge_ohlc_for_table(nearest_contracts["CE"]["table_5min"], nearest_contracts["CE"]["token"], "5minute")
-fetch_and_merge_ohlc_for_table(nearest_contracts["PE"]["table_5min"], nearest_contracts["PE"]["token"], "5minute")
+        logging.error(f" Error reading stored bars, backfilling full ranges: {e}")
+        stored = {series: set() for series in series_list}
+
+    jobs = []
+    for series in series_list:
+        interval = CANDLE_TIMEFRAMES[series.timeframe]
+        windows = gap_planner.plan(series.timeframe, start, now, stored[series])
+        if windows and candle_store is not None:
+            windows = [(windows[0][0], windows[-1][1])]
+        jobs.extend((series, series.token, interval, from_date, to_date) for from_date, to_date in windows)
+
+    logging.info(f" Gap plan: {len(jobs)} requests for {len(series_list)} series "
+                 f"({sum(len(bars) for bars in stored.values())} bars already stored)")
+    return historical_backfill.run(jobs)
+
+#  Backfill every timeframe of the nearest OTM CE/PE in one concurrent batch
+backfill_ohlc_series([
+    ohlc_series(nearest_contracts[side]["token"], nearest_contracts[side]["symbol"], timeframe)
+    for timeframe in CANDLE_TIMEFRAMES
+    for side in ("CE", "PE")
+])
 
 import datetime
+from contract_registry import ContractRegistry
 
 def create_nearest_otm_contracts_table():
     """
     Drops (if exists) and creates the nearest_otm_contracts table cleanly,
-    tailored for 5-minute ADX-based strategies (no 1-min tables).
+    tailored for 5-minute ADX-based strategies.
     """
     try:
-        conn = connect_to_db()
-        if not conn:
-            return
-
-        cur = conn.cursor()
-
-        # Drop table if exists
-        cur.execute("DROP TABLE IF EXISTS nearest_otm_contracts;")
-        logging.info(" Dropped existing nearest_otm_contracts table.")
-
-        # Create fresh table with only 5-min references
-        cur.execute("""
-            CREATE TABLE nearest_otm_contracts (
-                ce_symbol TEXT,
-                ce_token BIGINT,
-                ce_table_5min TEXT,
-                pe_symbol TEXT,
-                pe_token BIGINT,
-                pe_table_5min TEXT,
-                update_timestamp TIMESTAMPTZ
-            );
-        """)
-        conn.commit()
-
-        logging.info(" Created fresh nearest_otm_contracts table successfully!")
+        with db_cursor() as cur:
+            # Drop table if exists
+            cur.execute("DROP TABLE IF EXISTS nearest_otm_contracts;")
+            logging.info(" Dropped existing nearest_otm_contracts table.")
+
+            # Create fresh table (candles live in OHLC_TABLE under ce_token / pe_token)
+            cur.execute("""
+                CREATE TABLE nearest_otm_contracts (
+                    ce_symbol TEXT,
+                    ce_token BIGINT,
+                    pe_symbol TEXT,
+                    pe_token BIGINT,
+                    update_timestamp TIMESTAMPTZ
+                );
+            """)
 
-        cur.close()
-        conn.close()
+            logging.info(" Created fresh nearest_otm_contracts table successfully!")
 
     except Exception as e:
         logging.error(f" Error creating nearest_otm_contracts table: {e}")
@@ -692,272 +945,181 @@ def create_nearest_otm_contracts_table():
 
 create_nearest_otm_contracts_table()
 
-def update_nearest_otm_contracts():
+@metrics.timed("persist_contracts")
+def persist_nearest_otm_contracts(snapshot):
     """
-    Fetches the latest Nifty price, finds nearest OTM CE/PE contracts,
-    and updates the nearest_otm_contracts table with only 5min table info.
+    Writes the contract registry's current CE/PE contracts to the nearest_otm_contracts table
+    (for external readers). Called on the registry's write-behind thread, never on the candle path.
     """
-    try:
-        # Step 1: Fetch live Nifty price
-        nifty_price = get_nifty50_price()
-        if nifty_price is None:
-            logging.warning(" Failed to fetch Nifty 50 price while updating nearest OTM contracts.")
-            return
-
-        # Step 2: Get nearest OTM CE/PE contracts
-        nearest_otm = get_nearest_otm_ce_pe_tables(nifty_price)
-        if nearest_otm is None:
-            logging.warning(" Failed to fetch nearest OTM CE/PE contracts.")
-            return
-
-        current_timestamp = datetime.datetime.now()
-
-        # Step 3: Connect to DB
-        conn = connect_to_db()
-        if not conn:
-            logging.error(" Database connection failed during nearest OTM update.")
-            return
-        
-        cur = conn.cursor()
-
-        # Step 4: Clear old row
+    with db_cursor() as cur:
+        # Step 1: Clear old row
         cur.execute("TRUNCATE TABLE nearest_otm_contracts;")
 
-        # Step 5: Insert new row
+        # Step 2: Insert new row
         cur.execute("""
             INSERT INTO nearest_otm_contracts (
-                ce_symbol, ce_token, ce_table_5min,
-                pe_symbol, pe_token, pe_table_5min,
+                ce_symbol, ce_token,
+                pe_symbol, pe_token,
                 update_timestamp
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s);
+            ) VALUES (%s, %s, %s, %s, %s);
         """, (
-            nearest_otm["CE"]["symbol"],
-            nearest_otm["CE"]["token"],
-            nearest_otm["CE"]["table_5min"],
-            nearest_otm["PE"]["symbol"],
-            nearest_otm["PE"]["token"],
-            nearest_otm["PE"]["table_5min"],
-            current_timestamp
+            snapshot["CE"]["symbol"],
+            snapshot["CE"]["token"],
+            snapshot["PE"]["symbol"],
+            snapshot["PE"]["token"],
+            snapshot["updated_at"]
         ))
 
-        conn.commit()
-        cur.close()
-        conn.close()
-
-        logging.info(f" Nearest OTM CE/PE contracts updated successfully at {current_timestamp}!")
+    logging.info(f" Nearest OTM CE/PE contracts persisted (as of {snapshot['updated_at']})")
 
-    except Exception as e:
-        logging.error(f" Error while updating nearest OTM contracts: {e}")
+#  In-memory Contract Registry (current CE/PE with hysteresis; persisted write-behind)
+OTM_STRIKE_STEP = 50
+OTM_HYSTERESIS = 10.0  # Points spot must move past a strike boundary before the contract switches
 
+contract_registry = ContractRegistry(strike_step=OTM_STRIKE_STEP, hysteresis=OTM_HYSTERESIS,
+                                     persist=persist_nearest_otm_contracts)
 
-update_nearest_otm_contracts()
-
-#  Initialize Current CE and PE Tokens from nearest_otm_contracts
-def initialize_current_tokens():
+@metrics.timed("contract_selection")
+def update_nearest_otm_contracts():
     """
-    Fetches the latest CE and PE tokens from the nearest_otm_contracts table
-    and initializes global variables: current_ce_token and current_pe_token.
+    Fetches the latest Nifty price, finds nearest OTM CE/PE contracts and applies them
+    to the contract registry. Returns the sides that switched (empty if none).
     """
-    global current_ce_token, current_pe_token
-
     try:
-        conn = connect_to_db()
-        if not conn:
-            logging.error(" Failed to connect to DB while initializing current tokens.")
-            return False
-
-        cur = conn.cursor()
+        # Step 1: Fetch live Nifty price (websocket cache, REST only when stale)
+        nifty_price = get_nifty50_price()
+        if nifty_price is None:
+            logging.warning(" Failed to fetch Nifty 50 price while updating nearest OTM contracts.")
+            return []
 
-        cur.execute("""
-            SELECT ce_token, pe_token 
-            FROM nearest_otm_contracts
-            ORDER BY update_timestamp DESC
-            LIMIT 1;
-        """)
-        result = cur.fetchone()
-
-        if result and len(result) == 2:
-            current_ce_token = result[0]
-            current_pe_token = result[1]
-            logging.info(f" Initialized Current CE Token: {current_ce_token}, PE Token: {current_pe_token}")
-            success = True
-        else:
-            logging.error(" No data found in nearest_otm_contracts table to initialize tokens.")
-            success = False
+        # Step 2: Get nearest OTM CE/PE contracts
+        nearest_otm = get_nearest_otm_ce_pe_tables(nifty_price)
+        if nearest_otm is None:
+            logging.warning(" Failed to fetch nearest OTM CE/PE contracts.")
+            return []
 
-        cur.close()
-        conn.close()
-        return success
+        # Step 3: Switch only when spot left the current strike band (hysteresis)
+        return contract_registry.update(nifty_price, nearest_otm)
 
     except Exception as e:
-        logging.error(f" Error initializing current tokens: {e}")
-        return False
+        logging.error(f" Error while updating nearest OTM contracts: {e}")
+        return []
 
 
-#  Call this during setup
-initialize_current_tokens()
+#  Seed the registry with the contracts the startup tables were built for
+contract_registry.update(nifty_price, nearest_contracts)
+ce_token, pe_token = contract_registry.tokens()
+logging.info(f" Initialized Current CE Token: {ce_token}, PE Token: {pe_token}")
 
 import pandas as pd
 import numpy as np
+from indicator_kernels import (
+    NUMBA_AVAILABLE, wilder_smooth, true_range, atr_rma,
+    supertrend_bands, oscillation_state, supertrend_channels
+)
 
-def calculate_adx_for_table(table_name: str, period: int = 2):
+logging.info(f" Indicator kernels loaded ({'numba JIT' if NUMBA_AVAILABLE else 'pure NumPy fallback'})")
+
+@metrics.timed("adx", token_of=series_token)
+def calculate_adx_for_series(series: CandleSeries, period: int = 2):
     """
     Calculates ADX, DI+, and DI− using Wilder's smoothing (matching Pine Script)
-    and updates them in the given OHLC table.
+    and updates them in the given OHLC series.
     """
     try:
-        conn = connect_to_db()
-        if not conn:
-            logging.error(" DB connection failed for ADX calculation.")
-            return
+        with db_cursor() as cur:
+            # Fetch OHLC data
+            cur.execute(f"SELECT timestamp, open, high, low, close FROM {OHLC_TABLE} WHERE {SERIES_FILTER} ORDER BY timestamp ASC;",
+                        (series.token, series.timeframe))
+            rows = cur.fetchall()
+            if not rows:
+                logging.warning(f" No data found for {series} for ADX calculation.")
+                return
+
+            # Create DataFrame
+            df = pd.DataFrame(rows, columns=["timestamp", "open", "high", "low", "close"])
+            df["prev_close"] = df["close"].shift(1)
+            df["prev_high"] = df["high"].shift(1)
+            df["prev_low"] = df["low"].shift(1)
+
+            # True Range
+            tr1 = df["high"] - df["low"]
+            tr2 = (df["high"] - df["prev_close"]).abs()
+            tr3 = (df["low"] - df["prev_close"]).abs()
+            df["tr"] = pd.concat([tr1, tr2, tr3], axis=1).max(axis=1)
+
+            # Directional Movement
+            up_move = df["high"] - df["prev_high"]
+            down_move = df["prev_low"] - df["low"]
+            df["+dm"] = np.where((up_move > down_move) & (up_move > 0), up_move, 0.0)
+            df["-dm"] = np.where((down_move > up_move) & (down_move > 0), down_move, 0.0)
+
+            # Wilder smoothing (seeded with the sum of the first `period` bars)
+            df["tr_smooth"] = wilder_smooth(df["tr"].to_numpy(), period)
+            df["+dm_smooth"] = wilder_smooth(df["+dm"].to_numpy(), period)
+            df["-dm_smooth"] = wilder_smooth(df["-dm"].to_numpy(), period)
+
+            # DI+, DI-
+            df["di_plus"] = 100 * df["+dm_smooth"] / df["tr_smooth"]
+            df["di_minus"] = 100 * df["-dm_smooth"] / df["tr_smooth"]
+
+            # DX and ADX
+            df["dx"] = 100 * (df["di_plus"] - df["di_minus"]).abs() / (df["di_plus"] + df["di_minus"])
+            df["adx"] = df["dx"].rolling(window=period).mean()
+
+            # Update DB
+            df[["adx", "di_plus", "di_minus"]] = df[["adx", "di_plus", "di_minus"]].round(4)
+            bulk_update_series(cur, series, df, ["adx", "di_plus", "di_minus"])
+
+            logging.info(f" ADX, DI+ and DI− (PineScript match) updated for {series}")
 
-        cur = conn.cursor()
+    except Exception as e:
+        logging.error(f" Error in calculate_adx_for_series({series}): {e}")
 
-        # Fetch OHLC data
-        cur.execute(f"SELECT timestamp, open, high, low, close FROM {table_name} ORDER BY timestamp ASC;")
-        rows = cur.fetchall()
-        if not rows:
-            logging.warning(f" No data found in table {table_name} for ADX calculation.")
-            return
 
-        # Create DataFrame
-        df = pd.DataFrame(rows, columns=["timestamp", "open", "high", "low", "close"])
-        df["prev_close"] = df["close"].shift(1)
-        df["prev_high"] = df["high"].shift(1)
-        df["prev_low"] = df["low"].shift(1)
-
-        # True Range
-        tr1 = df["high"] - df["low"]
-        tr2 = (df["high"] - df["prev_close"]).abs()
-        tr3 = (df["low"] - df["prev_close"]).abs()
-        df["tr"] = pd.concat([tr1, tr2, tr3], axis=1).max(axis=1)
-
-        # Directional Movement
-        up_move = df["high"] - df["prev_high"]
-        down_move = df["prev_low"] - df["low"]
-        df["+dm"] = np.where((up_move > down_move) & (up_move > 0), up_move, 0.0)
-        df["-dm"] = np.where((down_move > up_move) & (down_move > 0), down_move, 0.0)
-
-        # Initialize smoothing columns
-        df["tr_smooth"] = 0.0
-        df["+dm_smooth"] = 0.0
-        df["-dm_smooth"] = 0.0
-
-        # Seed values
-        df.loc[period, "tr_smooth"] = df["tr"].iloc[1:period+1].sum()
-        df.loc[period, "+dm_smooth"] = df["+dm"].iloc[1:period+1].sum()
-        df.loc[period, "-dm_smooth"] = df["-dm"].iloc[1:period+1].sum()
-
-        # Wilder smoothing
-        for i in range(period + 1, len(df)):
-            df.loc[i, "tr_smooth"] = df.loc[i-1, "tr_smooth"] - (df.loc[i-1, "tr_smooth"] / period) + df.loc[i, "tr"]
-            df.loc[i, "+dm_smooth"] = df.loc[i-1, "+dm_smooth"] - (df.loc[i-1, "+dm_smooth"] / period) + df.loc[i, "+dm"]
-            df.loc[i, "-dm_smooth"] = df.loc[i-1, "-dm_smooth"] - (df.loc[i-1, "-dm_smooth"] / period) + df.loc[i, "-dm"]
-
-        # DI+, DI-
-        df["di_plus"] = 100 * df["+dm_smooth"] / df["tr_smooth"]
-        df["di_minus"] = 100 * df["-dm_smooth"] / df["tr_smooth"]
-
-        # DX and ADX
-        df["dx"] = 100 * (df["di_plus"] - df["di_minus"]).abs() / (df["di_plus"] + df["di_minus"])
-        df["adx"] = df["dx"].rolling(window=period).mean()
-
-        # Update DB
-        for _, row in df.iterrows():
-            cur.execute(f"""
-                UPDATE {table_name}
-                SET 
-                    adx = %s,
-                    di_plus = %s,
-                    di_minus = %s
-                WHERE timestamp = %s;
-            """, (
-                round(row["adx"], 4) if not pd.isna(row["adx"]) else None,
-                round(row["di_plus"], 4) if not pd.isna(row["di_plus"]) else None,
-                round(row["di_minus"], 4) if not pd.isna(row["di_minus"]) else None,
-                row["timestamp"]
-            ))
-
-        conn.commit()
-        logging.info(f" ADX, DI+ and DI− (PineScript match) updated for table {table_name}")
-
-        cur.close()
-        conn.close()
-
-    except Exception as e:
-        logging.error(f" Error in calculate_adx_for_table({table_name}): {e}")
+calculate_adx_for_series(nearest_contracts["CE"]["series_5min"], period=2)
+calculate_adx_for_series(nearest_contracts["PE"]["series_5min"], period=2)
 
 
-calculate_adx_for_table(nearest_contracts["CE"]["table_5min"], period=2)
-calculate_adx_for_table(nearest_contracts["PE"]["table_5min"], period=2)
-
-
-def calculate_ema_for_table(table_name: str, length: int):
+@metrics.timed("ema", token_of=series_token)
+def calculate_ema_for_series(series: CandleSeries, length: int):
     """
     Calculates Exponential Moving Average (EMA) of 'close' for a given length
-    and updates the specified table's corresponding column (ema_<length>).
+    and updates the series' corresponding column (ema_<length>).
     """
     column_name = f"ema_{length}"
     try:
-        conn = connect_to_db()
-        if not conn:
-            logging.error(" DB connection failed for EMA calculation.")
-            return
+        with db_cursor() as cur:
+            #  Step 1: Ensure EMA column exists (served from the schema cache)
+            ensure_table_columns(cur, OHLC_TABLE, [column_name], column_type="REAL")
 
-        cur = conn.cursor()
+            #  Step 2: Fetch close prices
+            cur.execute(f"SELECT timestamp, close FROM {OHLC_TABLE} WHERE {SERIES_FILTER} ORDER BY timestamp ASC;",
+                        (series.token, series.timeframe))
+            rows = cur.fetchall()
+            if not rows:
+                logging.warning(f" No data found for {series} for EMA-{length} calculation.")
+                return
 
-        #  Step 1: Ensure EMA column exists
-        cur.execute(f"""
-            SELECT column_name
-            FROM information_schema.columns
-            WHERE table_name = %s AND column_name = %s;
-        """, (table_name, column_name))
-        result = cur.fetchone()
-
-        if not result:
-            cur.execute(f"ALTER TABLE {table_name} ADD COLUMN {column_name} FLOAT;")
-            logging.info(f" Added missing column: {column_name} to table {table_name}")
-
-        #  Step 2: Fetch close prices
-        cur.execute(f"SELECT timestamp, close FROM {table_name} ORDER BY timestamp ASC;")
-        rows = cur.fetchall()
-        if not rows:
-            logging.warning(f" No data found in table {table_name} for EMA-{length} calculation.")
-            return
+            df = pd.DataFrame(rows, columns=["timestamp", "close"])
 
-        df = pd.DataFrame(rows, columns=["timestamp", "close"])
-
-        #  Step 3: Calculate EMA
-        df[column_name] = df["close"].ewm(span=length, adjust=False).mean()
-
-        #  Step 4: Update table
-        for _, row in df.iterrows():
-            cur.execute(
-                f"""
-                UPDATE {table_name}
-                SET {column_name} = %s
-                WHERE timestamp = %s;
-                """,
-                (
-                    round(row[column_name], 4) if not pd.isna(row[column_name]) else None,
-                    row["timestamp"]
-                )
-            )
+            #  Step 3: Calculate EMA
+            df[column_name] = df["close"].ewm(span=length, adjust=False).mean()
 
-        conn.commit()
-        logging.info(f" EMA-{length} updated for table {table_name}")
+            #  Step 4: Update table
+            df[column_name] = df[column_name].round(4)
+            bulk_update_series(cur, series, df, [column_name])
 
-        cur.close()
-        conn.close()
+            logging.info(f" EMA-{length} updated for {series}")
 
     except Exception as e:
-        logging.error(f" Error in calculate_ema_for_table({table_name}, {length}): {e}")
+        logging.error(f" Error in calculate_ema_for_series({series}, {length}): {e}")
 
 
-calculate_ema_for_table(nearest_contracts["CE"]["table_5min"], length=22)
-calculate_ema_for_table(nearest_contracts["CE"]["table_5min"], length=33)
-calculate_ema_for_table(nearest_contracts["PE"]["table_5min"], length=22)
-calculate_ema_for_table(nearest_contracts["PE"]["table_5min"], length=33)
+calculate_ema_for_series(nearest_contracts["CE"]["series_5min"], length=22)
+calculate_ema_for_series(nearest_contracts["CE"]["series_5min"], length=33)
+calculate_ema_for_series(nearest_contracts["PE"]["series_5min"], length=22)
+calculate_ema_for_series(nearest_contracts["PE"]["series_5min"], length=33)
 
 
 def f_sum(series: pd.Series, length: int) -> pd.Series:
@@ -968,12 +1130,18 @@ def f_sum(series: pd.Series, length: int) -> pd.Series:
     return series.rolling(window=length).sum()
 
 
-def calculate_cboe_for_table(table_name: str, smoothK=3, smoothD=3, lengthRSI=14, lengthStoch=14, lengthcboe=7):
+#  Debug dump of Stochastic RSI (k, d) for plotting in TradingView: set CBOE_DEBUG_DIR to write
+#  one CSV per series (off by default; recomputes run concurrently on the candle workers)
+CBOE_DEBUG_DIR = os.environ.get("CBOE_DEBUG_DIR", "")
+
+
+@metrics.timed("cboe", token_of=series_token)
+def calculate_cboe_for_series(series: CandleSeries, smoothK=3, smoothD=3, lengthRSI=14, lengthStoch=14, lengthcboe=7):
     """
     Calculates the custom CBOE indicator and updates the database table with the results.
 
     Parameters:
-    - table_name (str): Name of the PostgreSQL table.
+    - series (CandleSeries): Contract / timeframe in the candle store.
     - smoothK (int): Smoothing period for Stochastic RSI K line.
     - smoothD (int): Smoothing period for Stochastic RSI D line.
     - lengthRSI (int): Period for base RSI calculation.
@@ -981,1196 +1149,731 @@ def calculate_cboe_for_table(table_name: str, smoothK=3, smoothD=3, lengthRSI=14
     - lengthcboe (int): Period for secondary RSI used in market odds.
     """
     try:
-        conn = connect_to_db()
-        if not conn:
-            logging.error(" DB connection failed for CBOE calculation.")
-            return
-
-        cur = conn.cursor()
-
-        # Data fetching, processing, and updating will go here in next steps
-        # Step 1: Fetch data from the DB
-        cur.execute(f"SELECT timestamp, close, volume FROM {table_name} ORDER BY timestamp ASC;")
-        rows = cur.fetchall()
-        if not rows:
-            logging.warning(f" No data in {table_name} for RSI calculation.")
-            return
-
-        df = pd.DataFrame(rows, columns=["timestamp", "close", "volume"])
-
-        # Step 2: Calculate RSI using Wilder-style smoothing (ta.rsi)
-        def calculate_rsi_rma(series, length):
-            delta = series.diff()
-            gain = delta.clip(lower=0)
-            loss = -delta.clip(upper=0)
-            avg_gain = gain.ewm(alpha=1/length, adjust=False).mean()
-            avg_loss = loss.ewm(alpha=1/length, adjust=False).mean()
-            rs = avg_gain / avg_loss
-            rsi = 100 - (100 / (1 + rs))
-            return rsi
-
-        # Pine-style RSI calculation
-        df["rsi1"] = calculate_rsi_rma(df["close"], lengthRSI)
-
-        logging.info(" Saved RSI (rsi1) values to data.csv for comparison.")
-
-        # Step 3: Calculate Stochastic RSI
-        rsi_min = df["rsi1"].rolling(window=lengthStoch).min()
-        rsi_max = df["rsi1"].rolling(window=lengthStoch).max()
-
-        # Handle divide-by-zero with np.nan to match TradingView behavior
-        df["stoch_rsi"] = 100 * (df["rsi1"] - rsi_min) / (rsi_max - rsi_min)
-        df["k"] = df["stoch_rsi"].rolling(window=smoothK).mean()
-        df["d"] = df["k"].rolling(window=smoothD).mean()
-
-        # Step 4: Save values to CSV for debug/plotting in TradingView
-        df[["timestamp","k", "d"]].to_csv("data.csv", index=False)
-
-        logging.info(" Saved RSI + Stochastic RSI (k, d) to data.csv for debug.")
-
-        # Step 4: CBOE RSI-based oscillator
-        df["rs"] = calculate_rsi_rma(df["close"], lengthcboe)
-        df["rh"] = df["rs"].rolling(window=lengthcboe).max()
-        df["rl"] = df["rs"].rolling(window=lengthcboe).min()
-
-        df["stch"] = 100 * (df["rs"] - df["rl"]) / (df["rh"] - df["rl"])
-        df["stch1"] = 100 - df["stch"]
-
-        # Step X: Compute intermediate CBOE metrics
-        df["f1"] = df["stch"] * df["stch1"] / 100
-        df["f2"] = df["stch"] - df["f1"]
-        df["f3"] = df["stch1"] - df["f1"]
-        df["f4"] = df["f1"] + df["f2"] + df["f3"]
-
-        df["newsk"] = df["stch"].rolling(window=3).mean()
-
-        # Step X: Match TradingView's logic for volume-weighted price change
-        df["change"] = df["close"].diff()
-
-        # Apply Pine-style logic using ta.change(src)
-        df["up_input"] = np.where(df["change"] > 0, df["close"], 0)
-        df["down_input"] = np.where(df["change"] < 0, df["close"], 0)
-
-        df["up_volume_price"] = df["volume"] * df["up_input"]
-        df["down_volume_price"] = df["volume"] * df["down_input"]
-
-        df["upper_s"] = f_sum(df["up_volume_price"], lengthcboe)
-        df["lower_s"] = f_sum(df["down_volume_price"], lengthcboe)
-
-        df["R"] = df["upper_s"] / df["lower_s"].replace(0, np.nan)
-        df["market_index"] = 100 - (100 / (1 + df["R"]))
-
-        # Step X: Derive price-bullish, bearish, stagnant structure
-        df["_bull_gross"] = df["market_index"]
-        df["_bear_gross"] = 100 - df["market_index"]
-
-        df["_price_stagnant"] = (df["_bull_gross"] * df["_bear_gross"]) / 100
-        df["_price_bull"] = df["_bull_gross"] - df["_price_stagnant"]
-        df["_price_bear"] = df["_bear_gross"] - df["_price_stagnant"]
-
-
-        # Step X: Normalize the price values into a probability distribution
-        df["_coeff_price"] = (df["_price_stagnant"] + df["_price_bull"] + df["_price_bear"]) / 100
-
-        df["_bull"] = df["_price_bull"] / df["_coeff_price"]
-        df["_bear"] = df["_price_bear"] / df["_coeff_price"]
-        df["_stagnant"] = df["_price_stagnant"] / df["_coeff_price"]
-
-        # Apply PCR factor using f2, f3, f4
-        df["_temp_stagnant"] = df["_stagnant"] * (1 + (df["f3"] / df["f4"]))
-        df["_temp_bull"] = df["_bull"] * (1 + (df["f2"] / df["f4"]))
-        df["_temp_bear"] = df["_bear"] * (1 + (df["f3"] / df["f4"]))
-
-        df["_coeff"] = (df["_temp_stagnant"] + df["_temp_bull"] + df["_temp_bear"]) / 100
-
-        df["_odd_bull"] = df["_temp_bull"] / df["_coeff"]
-        df["_odd_bear"] = df["_temp_bear"] / df["_coeff"]
-        df["_odd_stagnant"] = df["_temp_stagnant"] / df["_coeff"]
-
-        # Step Y: Update final indicators into the database
-        for _, row in df.iterrows():
-            cur.execute(f"""
-                UPDATE {table_name}
-                SET 
-                    stoch_k = %s,
-                    stoch_d = %s,
-                    odd_bull = %s,
-                    odd_bear = %s,
-                    odd_stagnant = %s
-                WHERE timestamp = %s;
-            """, (
-                round(row["k"], 4) if not pd.isna(row["k"]) else None,
-                round(row["d"], 4) if not pd.isna(row["d"]) else None,
-                round(row["_odd_bull"], 4) if not pd.isna(row["_odd_bull"]) else None,
-                round(row["_odd_bear"], 4) if not pd.isna(row["_odd_bear"]) else None,
-                round(row["_odd_stagnant"], 4) if not pd.isna(row["_odd_stagnant"]) else None,
-                row["timestamp"]
-            ))
+        with db_cursor() as cur:
+            # Data fetching, processing, and updating will go here in next steps
+            # Step 1: Fetch data from the DB
+            cur.execute(f"SELECT timestamp, close, volume FROM {OHLC_TABLE} WHERE {SERIES_FILTER} ORDER BY timestamp ASC;",
+                        (series.token, series.timeframe))
+            rows = cur.fetchall()
+            if not rows:
+                logging.warning(f" No data in {series} for RSI calculation.")
+                return
+
+            df = pd.DataFrame(rows, columns=["timestamp", "close", "volume"])
+
+            # Step 2: Calculate RSI using Wilder-style smoothing (ta.rsi)
+            def calculate_rsi_rma(series, length):
+                delta = series.diff()
+                gain = delta.clip(lower=0)
+                loss = -delta.clip(upper=0)
+                avg_gain = gain.ewm(alpha=1/length, adjust=False).mean()
+                avg_loss = loss.ewm(alpha=1/length, adjust=False).mean()
+                rs = avg_gain / avg_loss
+                rsi = 100 - (100 / (1 + rs))
+                return rsi
+
+            # Pine-style RSI calculation
+            df["rsi1"] = calculate_rsi_rma(df["close"], lengthRSI)
+
+            # Step 3: Calculate Stochastic RSI
+            rsi_min = df["rsi1"].rolling(window=lengthStoch).min()
+            rsi_max = df["rsi1"].rolling(window=lengthStoch).max()
+
+            # Handle divide-by-zero with np.nan to match TradingView behavior
+            df["stoch_rsi"] = 100 * (df["rsi1"] - rsi_min) / (rsi_max - rsi_min)
+            df["k"] = df["stoch_rsi"].rolling(window=smoothK).mean()
+            df["d"] = df["k"].rolling(window=smoothD).mean()
+
+            # Step 4: Save values to CSV for debug/plotting in TradingView (CBOE_DEBUG_DIR only)
+            if CBOE_DEBUG_DIR:
+                debug_file = os.path.join(CBOE_DEBUG_DIR, f"cboe_{series.token}_{series.timeframe}min.csv")
+                df[["timestamp","k", "d"]].to_csv(debug_file, index=False)
+                logging.info(f" Saved RSI + Stochastic RSI (k, d) to {debug_file} for debug.")
+
+            # Step 4: CBOE RSI-based oscillator
+            df["rs"] = calculate_rsi_rma(df["close"], lengthcboe)
+            df["rh"] = df["rs"].rolling(window=lengthcboe).max()
+            df["rl"] = df["rs"].rolling(window=lengthcboe).min()
+
+            df["stch"] = 100 * (df["rs"] - df["rl"]) / (df["rh"] - df["rl"])
+            df["stch1"] = 100 - df["stch"]
+
+            # Step X: Compute intermediate CBOE metrics
+            df["f1"] = df["stch"] * df["stch1"] / 100
+            df["f2"] = df["stch"] - df["f1"]
+            df["f3"] = df["stch1"] - df["f1"]
+            df["f4"] = df["f1"] + df["f2"] + df["f3"]
+
+            df["newsk"] = df["stch"].rolling(window=3).mean()
+
+            # Step X: Match TradingView's logic for volume-weighted price change
+            df["change"] = df["close"].diff()
+
+            # Apply Pine-style logic using ta.change(src)
+            df["up_input"] = np.where(df["change"] > 0, df["close"], 0)
+            df["down_input"] = np.where(df["change"] < 0, df["close"], 0)
+
+            df["up_volume_price"] = df["volume"] * df["up_input"]
+            df["down_volume_price"] = df["volume"] * df["down_input"]
+
+            df["upper_s"] = f_sum(df["up_volume_price"], lengthcboe)
+            df["lower_s"] = f_sum(df["down_volume_price"], lengthcboe)
+
+            df["R"] = df["upper_s"] / df["lower_s"].replace(0, np.nan)
+            df["market_index"] = 100 - (100 / (1 + df["R"]))
+
+            # Step X: Derive price-bullish, bearish, stagnant structure
+            df["_bull_gross"] = df["market_index"]
+            df["_bear_gross"] = 100 - df["market_index"]
+
+            df["_price_stagnant"] = (df["_bull_gross"] * df["_bear_gross"]) / 100
+            df["_price_bull"] = df["_bull_gross"] - df["_price_stagnant"]
+            df["_price_bear"] = df["_bear_gross"] - df["_price_stagnant"]
+
+
+            # Step X: Normalize the price values into a probability distribution
+            df["_coeff_price"] = (df["_price_stagnant"] + df["_price_bull"] + df["_price_bear"]) / 100
+
+            df["_bull"] = df["_price_bull"] / df["_coeff_price"]
+            df["_bear"] = df["_price_bear"] / df["_coeff_price"]
+            df["_stagnant"] = df["_price_stagnant"] / df["_coeff_price"]
+
+            # Apply PCR factor using f2, f3, f4
+            df["_temp_stagnant"] = df["_stagnant"] * (1 + (df["f3"] / df["f4"]))
+            df["_temp_bull"] = df["_bull"] * (1 + (df["f2"] / df["f4"]))
+            df["_temp_bear"] = df["_bear"] * (1 + (df["f3"] / df["f4"]))
+
+            df["_coeff"] = (df["_temp_stagnant"] + df["_temp_bull"] + df["_temp_bear"]) / 100
+
+            df["_odd_bull"] = df["_temp_bull"] / df["_coeff"]
+            df["_odd_bear"] = df["_temp_bear"] / df["_coeff"]
+            df["_odd_stagnant"] = df["_temp_stagnant"] / df["_coeff"]
+
+            # Step Y: Update final indicators into the database
+            out = pd.DataFrame({
+                "timestamp": df["timestamp"],
+                "stoch_k": df["k"].round(4),
+                "stoch_d": df["d"].round(4),
+                "odd_bull": df["_odd_bull"].round(4),
+                "odd_bear": df["_odd_bear"].round(4),
+                "odd_stagnant": df["_odd_stagnant"].round(4),
+            })
+            bulk_update_series(cur, series, out, ["stoch_k", "stoch_d", "odd_bull", "odd_bear", "odd_stagnant"])
 
+            logging.info(f" Updated indicators for {series}")
 
-        conn.commit()
-        logging.info(f" Updated indicators for table: {table_name}")
     except Exception as e:
-        logging.error(f" Error in calculate_cboe_for_table({table_name}): {e}")
-        
-calculate_cboe_for_table(nearest_contracts["CE"]["table_5min"])
-
-#  Calculate HL2 (High + Low) / 2 for a specific table
-def calculate_hl2_for_table(table_name):
-    """
-    Calculates HL2 (High + Low) / 2 and updates for all rows in a specific 5min OHLC table.
-    """
-    try:
-        conn = connect_to_db()
-        if not conn:
-            return
+        logging.error(f" Error in calculate_cboe_for_series({series}): {e}")
         
-        cur = conn.cursor()
-
-        #  Update HL2 for all rows (no WHERE condition)
-        cur.execute(f"""
-            UPDATE {table_name}
-            SET hl2 = (high + low) / 2;
-        """)
-        conn.commit()
-
-        logging.info(f" HL2 recalculated and updated for all rows in {table_name}")
-
-        cur.close()
-        conn.close()
-
-    except Exception as e:
-        logging.error(f" Error updating HL2 for {table_name}: {e}")
-
-
-calculate_hl2_for_table(nearest_contracts["CE"]["table_5min"])
-calculate_hl2_for_table(nearest_contracts["PE"]["table_5min"])
+calculate_cboe_for_series(nearest_contracts["CE"]["series_5min"])
 
 #  ATR Settings
 ATR_LENGTH = 10
 ATR_MULTIPLIER = 3
 
-def calculate_atr_for_table(table_name):
+#  Columns produced by the fused Supertrend / channel engine (in computation order)
+SUPERTREND_COLUMNS = [
+    "hl2", "atr", "initial_upper_bar", "initial_lower_bar",
+    "supertrend_upper", "supertrend_lower", "os", "spt",
+    "max_channel", "min_channel", "supertrend_avg"
+]
+
+@metrics.timed("supertrend", token_of=series_token)
+def calculate_supertrend_for_series(series):
     """
-    Calculates ATR (Average True Range) using RMA logic
-    and updates 'atr' column for the full table.
+    Fused Supertrend / channel engine for a specific OHLC series.
+
+    Reads OHLC once and computes every stage in memory as NumPy arrays:
+    hl2 -> atr (RMA x ATR_MULTIPLIER) -> initial upper/lower bands -> supertrend upper/lower
+    -> oscillation state (os) -> supertrend pivot (spt) -> max/min channel -> supertrend average.
+    All columns are then persisted with a single bulk update in one transaction.
     """
     try:
-        conn = connect_to_db()
-        if not conn:
-            return
-        
-        cur = conn.cursor()
+        with db_cursor() as cur:
+            logging.info(f" Calculating Supertrend & Channels for {series}")
 
-        logging.info(f" Calculating ATR for table: {table_name}")
-
-        # Fetch full OHLC data (not only where atr is null)
-        cur.execute(f"""
-            SELECT timestamp, high, low, close
-            FROM {table_name}
-            ORDER BY timestamp;
-        """)
-        rows = cur.fetchall()
-
-        if not rows:
-            logging.warning(f" No data found for ATR calculation in {table_name}")
-            return
+            # Check required columns exist (served from the schema cache)
+            existing_columns = get_table_columns(cur, OHLC_TABLE)
+            missing_columns = [col for col in ["high", "low", "close"] + SUPERTREND_COLUMNS if col not in existing_columns]
 
-        df = pd.DataFrame(rows, columns=['timestamp', 'high', 'low', 'close'])
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
+            if missing_columns:
+                logging.warning(f" Columns {missing_columns} missing in {OHLC_TABLE}. Skipping...")
+                return
 
-        df['true_range'] = 0.0
-        df['atr'] = 0.0
-
-        for i in range(1, len(df)):
-            high = df.iloc[i]['high']
-            low = df.iloc[i]['low']
-            prev_close = df.iloc[i - 1]['close']
-            tr = max(high - low, abs(high - prev_close), abs(low - prev_close))
-            df.at[df.index[i], 'true_range'] = tr
+            # Fetch OHLC once
+            cur.execute(f"""
+                SELECT timestamp, high, low, close
+                FROM {OHLC_TABLE}
+                WHERE {SERIES_FILTER}
+                ORDER BY timestamp;
+            """, (series.token, series.timeframe))
+            rows = cur.fetchall()
+
+            if not rows:
+                logging.warning(f" No data found in {series} for Supertrend calculation.")
+                return
+
+            df = pd.DataFrame(rows, columns=['timestamp', 'high', 'low', 'close'])
+            high = df['high'].to_numpy(dtype=float)
+            low = df['low'].to_numpy(dtype=float)
+            close = df['close'].to_numpy(dtype=float)
+
+            # Step 1: HL2
+            hl2 = (high + low) / 2
+
+            # Step 2: True Range (first bar has no previous close and stays 0)
+            true_range_values = true_range(high, low, close)
+
+            # Step 3: ATR (simple mean while warming up, then RMA), scaled by multiplier
+            atr = atr_rma(true_range_values, ATR_LENGTH) * ATR_MULTIPLIER
+
+            # Step 4: Initial bands
+            initial_upper = hl2 + atr
+            initial_lower = hl2 - atr
+
+            # Step 5: Supertrend upper / lower bands
+            supertrend_upper, supertrend_lower = supertrend_bands(initial_upper, initial_lower, close)
+
+            # Step 6: Oscillation State (1 = Bullish, 0 = Bearish)
+            os_state = oscillation_state(close, supertrend_upper, supertrend_lower)
+
+            # Step 7: Supertrend Pivot
+            spt = np.where(os_state == 1, supertrend_lower, supertrend_upper)
+
+            # Step 8: Max / Min Channels
+            max_channel, min_channel = supertrend_channels(close, spt, os_state)
+
+            # Step 9: Supertrend Average Channel
+            supertrend_avg = (max_channel + min_channel) / 2
+
+            # Persist every column in one statement
+            out = pd.DataFrame({
+                "timestamp": df["timestamp"],
+                "hl2": hl2,
+                "atr": atr,
+                "initial_upper_bar": initial_upper,
+                "initial_lower_bar": initial_lower,
+                "supertrend_upper": supertrend_upper,
+                "supertrend_lower": supertrend_lower,
+                "os": os_state,
+                "spt": spt,
+                "max_channel": max_channel,
+                "min_channel": min_channel,
+                "supertrend_avg": supertrend_avg,
+            })
+            bulk_update_series(cur, series, out, SUPERTREND_COLUMNS)
+
+            logging.info(f" Supertrend & Channels calculated & updated successfully for {series}")
 
-        for i in range(len(df)):
-            if i == 0:
-                df.at[df.index[i], 'atr'] = 0.0
-            elif i < ATR_LENGTH:
-                df.at[df.index[i], 'atr'] = df['true_range'][:i+1].mean()
-            else:
-                prev_atr = df.iloc[i-1]['atr']
-                tr = df.iloc[i]['true_range']
-                df.at[df.index[i], 'atr'] = ((prev_atr * (ATR_LENGTH - 1)) + tr) / ATR_LENGTH
+    except Exception as e:
+        logging.error(f" Error updating Supertrend & Channels for {series}: {e}")
 
-        df['atr'] *= ATR_MULTIPLIER
-        df.drop(columns=['true_range'], inplace=True)
 
-        update_query = f"UPDATE {table_name} SET atr = %s WHERE timestamp = %s;"
+#  Calculate Supertrend & Channels for Nearest CE & PE Only (skip NIFTY)
+calculate_supertrend_for_series(nearest_contracts['CE']['series_5min'])
+calculate_supertrend_for_series(nearest_contracts['PE']['series_5min'])
 
-        for _, row in df.iterrows():
-            cur.execute(update_query, (row['atr'], row['timestamp']))
 
-        conn.commit()
-        cur.close()
-        conn.close()
+#  Incremental (append-only) indicator updates
+from incremental_indicators import new_indicator_state, update_indicator_state
 
-        logging.info(f"ATR calculation & update completed for {table_name}")
+EMA_LENGTHS = [22, 33]
 
-    except Exception as e:
-        logging.error(f" Error calculating ATR for {table_name}: {e}")
+#  Columns written by the incremental path, rounded the same way as their full-table functions
+ROUNDED_INDICATOR_COLUMNS = ["adx", "di_plus", "di_minus"] + [f"ema_{length}" for length in EMA_LENGTHS] + [
+    "stoch_k", "stoch_d", "odd_bull", "odd_bear", "odd_stagnant"
+]
+INDICATOR_COLUMNS = ROUNDED_INDICATOR_COLUMNS + SUPERTREND_COLUMNS
 
-#  Apply ATR calculation only to Nearest OTM Contracts
-calculate_atr_for_table(nearest_contracts["CE"]["table_5min"])
-calculate_atr_for_table(nearest_contracts["PE"]["table_5min"])
+#  Recursive indicator state per series → {CandleSeries: state}
+indicator_state = {}
 
-#  Calculate Initial Upper Band for Single Table
-def calculate_initial_upper_band_for_table(table_name):
+@metrics.timed("seed_indicator_state", token_of=series_token)
+def seed_indicator_state(series):
     """
-    Calculate Initial Upper Band (hl2 + atr) for a specific 5-min OHLC table.
+    Rebuilds the incremental state of a series by replaying its stored bars once,
+    so every following bar can be advanced in O(1).
     """
     try:
-        conn = connect_to_db()
-        if not conn:
-            return
-
-        cur = conn.cursor()
-
-        logging.info(f" Calculating Initial Upper Band for Table: {table_name}")
-
-        # Check if hl2 & atr columns exist
-        cur.execute(f"""
-            SELECT EXISTS (
-                SELECT 1 FROM information_schema.columns 
-                WHERE table_name = %s AND column_name = 'hl2'
-            );
-        """, (table_name,))
-        hl2_exists = cur.fetchone()[0]
-
-        cur.execute(f"""
-            SELECT EXISTS (
-                SELECT 1 FROM information_schema.columns 
-                WHERE table_name = %s AND column_name = 'atr'
-            );
-        """, (table_name,))
-        atr_exists = cur.fetchone()[0]
-
-        if not hl2_exists or not atr_exists:
-            logging.warning(f" Columns 'hl2' or 'atr' missing in {table_name}. Skipping...")
-            return
-
-        cur.execute(f"""
-            UPDATE {table_name}
-            SET initial_upper_bar = hl2 + atr;
-        """)
-
-        conn.commit()
-        logging.info(f" Initial Upper Band calculated & updated successfully for {table_name}")
-
-        cur.close()
-        conn.close()
+        with db_cursor() as cur:
+            cur.execute(f"SELECT timestamp, open, high, low, close, volume FROM {OHLC_TABLE} WHERE {SERIES_FILTER} ORDER BY timestamp ASC;",
+                        (series.token, series.timeframe))
+            rows = cur.fetchall()
+
+        state = new_indicator_state(adx_period=2, ema_lengths=EMA_LENGTHS,
+                                    atr_length=ATR_LENGTH, atr_multiplier=ATR_MULTIPLIER)
+        for timestamp, open_, high, low, close, volume in rows:
+            update_indicator_state(state, {
+                "timestamp": timestamp, "open": open_, "high": high,
+                "low": low, "close": close, "volume": volume
+            })
+
+        indicator_state[series] = state
+        logging.info(f" Incremental indicator state seeded for {series} from {len(rows)} bars")
 
     except Exception as e:
-        logging.error(f" Error updating Initial Upper Band for {table_name}: {e}")
+        indicator_state.pop(series, None)
+        logging.error(f" Error seeding incremental indicator state for {series}: {e}")
 
-#  Calculate Initial Lower Band for Single Table
-def calculate_initial_lower_band_for_table(table_name):
+@metrics.timed("indicators_full", token_of=series_token)
+def recalculate_all_indicators_for_series(series):
     """
-    Calculate Initial Lower Band (hl2 - atr) for a specific 5-min OHLC table.
+    Full recompute of every indicator over the series' history, then re-seeds
+    the incremental state for the series.
     """
+    # Add any missing EMA columns in one batched ALTER
     try:
-        conn = connect_to_db()
-        if not conn:
-            return
-
-        cur = conn.cursor()
-
-        logging.info(f" Calculating Initial Lower Band for Table: {table_name}")
-
-        # Check if hl2 & atr columns exist
-        cur.execute(f"""
-            SELECT EXISTS (
-                SELECT 1 FROM information_schema.columns 
-                WHERE table_name = %s AND column_name = 'hl2'
-            );
-        """, (table_name,))
-        hl2_exists = cur.fetchone()[0]
-
-        cur.execute(f"""
-            SELECT EXISTS (
-                SELECT 1 FROM information_schema.columns 
-                WHERE table_name = %s AND column_name = 'atr'
-            );
-        """, (table_name,))
-        atr_exists = cur.fetchone()[0]
-
-        if not hl2_exists or not atr_exists:
-            logging.warning(f" Columns 'hl2' or 'atr' missing in {table_name}. Skipping...")
-            return
-
-        cur.execute(f"""
-            UPDATE {table_name}
-            SET initial_lower_bar = hl2 - atr;
-        """)
-
-        conn.commit()
-        logging.info(f" Initial Lower Band calculated & updated successfully for {table_name}")
-
-        cur.close()
-        conn.close()
-
+        with db_cursor() as cur:
+            ensure_table_columns(cur, OHLC_TABLE, [f"ema_{length}" for length in EMA_LENGTHS], column_type="REAL")
     except Exception as e:
-        logging.error(f" Error updating Initial Lower Band for {table_name}: {e}")
-
-#  Now Apply only to CE and PE contracts
-calculate_initial_upper_band_for_table(nearest_contracts['CE']['table_5min'])
-calculate_initial_upper_band_for_table(nearest_contracts['PE']['table_5min'])
-
-calculate_initial_lower_band_for_table(nearest_contracts['CE']['table_5min'])
-calculate_initial_lower_band_for_table(nearest_contracts['PE']['table_5min'])
+        logging.error(f" Error ensuring EMA columns for {series}: {e}")
 
+    calculate_supertrend_for_series(series)
+    calculate_adx_for_series(series, period=2)
+    for length in EMA_LENGTHS:
+        calculate_ema_for_series(series, length=length)
+    calculate_cboe_for_series(series)
+    seed_indicator_state(series)
 
-# Calculate Supertrend Upper Band
-def calculate_supertrend_upper_for_table(table_name):
+@metrics.timed("indicators_incremental", token_of=series_token)
+def update_indicators_for_new_bar(series, bar):
     """
-    Calculate Dynamic Supertrend Upper Band (Based on Initial Upper Band & Previous Close)
-    for a specific 5-min OHLC table.
+    Computes every indicator for the newly inserted bar only and updates that single row.
+    Falls back to a full recompute when the series has no state yet or the bar is not
+    newer than the last bar the state has seen.
     """
-    try:
-        conn = connect_to_db()
-        if not conn:
-            return
+    state = indicator_state.get(series)
+    if state is None or (state["last_timestamp"] is not None and bar["timestamp"] <= state["last_timestamp"]):
+        recalculate_all_indicators_for_series(series)
+        return
 
-        cur = conn.cursor()
-        logging.info(f" Calculating Supertrend Upper Band for Table: {table_name}")
+    try:
+        values = update_indicator_state(state, bar)
 
-        # Check if required columns exist
-        cur.execute("""
-            SELECT EXISTS (
-                SELECT 1 FROM information_schema.columns 
-                WHERE table_name = %s AND column_name = 'initial_upper_bar'
-            );
-        """, (table_name,))
-        upper_exists = cur.fetchone()[0]
+        params = [
+            None if pd.isna(values[col]) else
+            round(float(values[col]), 4) if col in ROUNDED_INDICATOR_COLUMNS else float(values[col])
+            for col in INDICATOR_COLUMNS
+        ]
+        set_clause = ", ".join(f"{col} = %s" for col in INDICATOR_COLUMNS)
 
-        cur.execute("""
-            SELECT EXISTS (
-                SELECT 1 FROM information_schema.columns 
-                WHERE table_name = %s AND column_name = 'close'
-            );
-        """, (table_name,))
-        close_exists = cur.fetchone()[0]
+        with db_cursor() as cur:
+            cur.execute(f"UPDATE {OHLC_TABLE} SET {set_clause} WHERE {SERIES_FILTER} AND timestamp = %s;",
+                        params + [series.token, series.timeframe, bar["timestamp"]])
 
-        if not upper_exists or not close_exists:
-            logging.warning(f" Columns 'initial_upper_bar' or 'close' missing in {table_name}. Skipping...")
-            return
+        logging.info(f" Indicators updated incrementally for {series} at {bar['timestamp']}")
 
-        cur.execute(f"""
-            SELECT timestamp, initial_upper_bar, close 
-            FROM {table_name} 
-            ORDER BY timestamp;
-        """)
-        rows = cur.fetchall()
-
-        if not rows:
-            logging.warning(f" No data found in {table_name} for Supertrend Upper calculation.")
-            return
+    except Exception as e:
+        #  State may be ahead of the table now → force a full recompute on the next bar
+        indicator_state.pop(series, None)
+        logging.error(f" Error in update_indicators_for_new_bar({series}): {e}")
 
-        df = pd.DataFrame(rows, columns=['timestamp', 'initial_upper_bar', 'close'])
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
 
-        df['supertrend_upper'] = 0.0
+#  Indicators for the other timeframes (the 5-min series are calculated above)
+for timeframe in CANDLE_TIMEFRAMES:
+    if timeframe != 5:
+        for side in ("CE", "PE"):
+            recalculate_all_indicators_for_series(
+                ohlc_series(nearest_contracts[side]["token"], nearest_contracts[side]["symbol"], timeframe))
 
-        for i in range(len(df)):
-            if i == 0:
-                df.at[i, 'supertrend_upper'] = df.at[i, 'initial_upper_bar']
-            else:
-                prev_upper = df.at[i - 1, 'supertrend_upper']
-                initial_upper = df.at[i, 'initial_upper_bar']
-                prev_close = df.at[i - 1, 'close']
 
-                if prev_close < prev_upper:
-                    df.at[i, 'supertrend_upper'] = min(initial_upper, prev_upper)
-                else:
-                    df.at[i, 'supertrend_upper'] = initial_upper
+from kiteconnect import KiteConnect
 
-        df['timestamp'] = df['timestamp'].astype(str)
-        df['supertrend_upper'] = df['supertrend_upper'].astype(float)
 
-        update_query = f"UPDATE {table_name} SET supertrend_upper = %s WHERE timestamp = %s;"
-        for _, row in df.iterrows():
-            cur.execute(update_query, (row['supertrend_upper'], row['timestamp']))
 
-        conn.commit()
-        logging.info(f" Supertrend Upper Band updated successfully for {table_name}")
 
-        cur.close()
-        conn.close()
 
-    except Exception as e:
-        logging.error(f" Error updating Supertrend Upper Band for {table_name}: {e}")
+#Setting up live websocket connection, tick by tick handling and aggregation
+from kiteconnect import KiteTicker
+import logging
+import time
+import os
+import datetime
+from collections import defaultdict, deque
+from token_workers import TokenWorkerPool
+from candle_builder import CandleBuilder, minute_bucket, bucket_to_datetime
+from candle_scheduler import CandleCloseScheduler
+from async_engine import AsyncEngine
+from tick_archive import TickArchive
 
-#  Calculate Supertrend Lower Band
-def calculate_supertrend_lower_for_table(table_name):
-    """
-    Calculate Dynamic Supertrend Lower Band (Based on Initial Lower Band & Previous Close)
-    for a specific 5-min OHLC table.
-    """
-    try:
-        conn = connect_to_db()
-        if not conn:
-            return
+#  Set up logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
-        cur = conn.cursor()
-        logging.info(f" Calculating Supertrend Lower Band for Table: {table_name}")
+#  Zerodha API Credentials
+API_KEY = "8re7mjcm2btaozwf"  # Replace with your API key
 
-        # Check if required columns exist
-        cur.execute("""
-            SELECT EXISTS (
-                SELECT 1 FROM information_schema.columns 
-                WHERE table_name = %s AND column_name = 'initial_lower_bar'
-            );
-        """, (table_name,))
-        lower_exists = cur.fetchone()[0]
+#  Fetch access token dynamically from the file
+if BROKER_MODE == "fake":
+    ACCESS_TOKEN = access_token
+else:
+    with open("access_token.txt", "r") as f:
+        ACCESS_TOKEN = f.read().strip()
 
-        cur.execute("""
-            SELECT EXISTS (
-                SELECT 1 FROM information_schema.columns 
-                WHERE table_name = %s AND column_name = 'close'
-            );
-        """, (table_name,))
-        close_exists = cur.fetchone()[0]
+#  Dynamically Prepare All Instrument Tokens for Subscription
+# From fetched contracts
+INSTRUMENT_TOKENS = [NIFTY_INDEX_TOKEN]  # NIFTY Index Token
 
-        if not lower_exists or not close_exists:
-            logging.warning(f" Columns 'initial_lower_bar' or 'close' missing in {table_name}. Skipping...")
-            return
+# Add all CE + PE contract tokens
+INSTRUMENT_TOKENS += [contract['token'] for contract in contracts['ce_contracts'] + contracts['pe_contracts']]
 
-        cur.execute(f"""
-            SELECT timestamp, initial_lower_bar, close 
-            FROM {table_name} 
-            ORDER BY timestamp;
-        """)
-        rows = cur.fetchall()
-
-        if not rows:
-            logging.warning(f" No data found in {table_name} for Supertrend Lower calculation.")
-            return
+logging.info(f" All Tokens to Subscribe for Live Ticks: {INSTRUMENT_TOKENS}")
 
-        df = pd.DataFrame(rows, columns=['timestamp', 'initial_lower_bar', 'close'])
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        df['supertrend_lower'] = 0.0
+#  Initialize KiteTicker WebSocket
+kws = KiteTicker(API_KEY, ACCESS_TOKEN)
 
-        for i in range(len(df)):
-            if i == 0:
-                df.at[i, 'supertrend_lower'] = df.at[i, 'initial_lower_bar']
-            else:
-                prev_lower = df.at[i - 1, 'supertrend_lower']
-                initial_lower = df.at[i, 'initial_lower_bar']
-                prev_close = df.at[i - 1, 'close']
 
-                if prev_close >= prev_lower:
-                    df.at[i, 'supertrend_lower'] = max(initial_lower, prev_lower)
-                else:
-                    df.at[i, 'supertrend_lower'] = initial_lower
+#  Store Realtime OHLC for Current Candle for Each Symbol
+ohlc_data = {}  
+# Structure → {symbol: {'timestamp': current, 'open': o, 'high': h, 'low': l, 'close': c}}
 
-        df['timestamp'] = df['timestamp'].astype(str)
-        df['supertrend_lower'] = df['supertrend_lower'].astype(float)
+#  Kill Existing WebSocket Processes (Optional - Safe Cleanup)
+def kill_existing_websockets():
+    try:
+        os.system("pkill -f kiteconnect")  
+        logging.info(" Existing WebSocket instances killed successfully.")
+    except Exception as e:
+        logging.error(f" Error while killing existing WebSocket processes: {e}")
 
-        update_query = f"UPDATE {table_name} SET supertrend_lower = %s WHERE timestamp = %s;"
-        for _, row in df.iterrows():
-            cur.execute(update_query, (row['supertrend_lower'], row['timestamp']))
+#  Running OHLC Accumulators for every timeframe (1-min per tick, higher timeframes cascade from 1-min bars)
+candle_builder = CandleBuilder(timeframes=tuple(CANDLE_TIMEFRAMES))
+# Structure → {timeframe: {token: CandleAccumulator}} + completed-bar queues drained by process_ohlc_candle()
 
-        conn.commit()
-        logging.info(f" Supertrend Lower Band updated successfully for {table_name}")
+#  Memory-mapped Tick Archive → tick_archive/<YYYY-MM-DD>/<token>.ticks
+TICK_ARCHIVE_DIR = "tick_archive"
+tick_archive = TickArchive(TICK_ARCHIVE_DIR)
 
-        cur.close()
-        conn.close()
+#  Candle Worker Settings
+CANDLE_WORKER_COUNT = 4   # Parallel per-token compute workers
+CANDLE_QUEUE_SIZE = 64    # Max queued candle tasks per worker before submit() blocks
 
-    except Exception as e:
-        logging.error(f" Error updating Supertrend Lower Band for {table_name}: {e}")
+candle_workers = TokenWorkerPool(workers=CANDLE_WORKER_COUNT, queue_size=CANDLE_QUEUE_SIZE)
 
-#  Apply Only to CE and PE tables
-calculate_supertrend_upper_for_table(nearest_contracts['CE']['table_5min'])
-calculate_supertrend_upper_for_table(nearest_contracts['PE']['table_5min'])
+#  Volume Reconciliation Settings
+VOLUME_RECONCILE_DELAY = 120      # Seconds after bar close before historical_data is trusted
+VOLUME_RECONCILE_INTERVAL = 300   # Seconds between reconciliation batches
+VOLUME_RECONCILE_TIMEOUT = 120    # Seconds a reconciliation batch may take before it is reported
 
-calculate_supertrend_lower_for_table(nearest_contracts['CE']['table_5min'])
-calculate_supertrend_lower_for_table(nearest_contracts['PE']['table_5min'])
+#  Bars awaiting a historical volume check → (series, timestamp str, tick volume, queued at)
+pending_volume_checks = deque()
+pending_volume_lock = threading.Lock()
 
-def calculate_oscillation_state_for_table(table_name):
+def bar_time(timestamp):
     """
-    Calculate Oscillation State (os) for a specific 5-min OHLC table.
+    IST-aware datetime of a builder bar timestamp ("YYYY-MM-DD HH:MM", exchange time), so the
+    TIMESTAMPTZ columns never depend on the DB session time zone.
     """
+    return datetime.datetime.strptime(timestamp, "%Y-%m-%d %H:%M").replace(tzinfo=IST)
 
-    try:
-        conn = connect_to_db()
-        if not conn:
-            return
-
-        cur = conn.cursor()
-        logging.info(f" Calculating Oscillation State for Table: {table_name}")
-
-        # Check required columns
-        cur.execute(f"""
-        SELECT 
-            EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name=%s AND column_name='supertrend_upper'),
-            EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name=%s AND column_name='supertrend_lower'),
-            EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name=%s AND column_name='close')
-        """, (table_name, table_name, table_name))
-        upper_exists, lower_exists, close_exists = cur.fetchone()
-
-        if not (upper_exists and lower_exists and close_exists):
-            logging.warning(f" Required columns missing in {table_name}. Skipping...")
-            return
-
-        cur.execute(f"""
-            SELECT timestamp, close, supertrend_upper, supertrend_lower 
-            FROM {table_name} 
-            ORDER BY timestamp;
-        """)
-        rows = cur.fetchall()
-
-        if not rows:
-            logging.warning(f" No data found in {table_name} for Oscillation State calculation.")
-            return
-
-        df = pd.DataFrame(rows, columns=['timestamp', 'close', 'supertrend_upper', 'supertrend_lower'])
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        df['os'] = 0  # Default Bearish
-
-        for i in range(len(df)):
-            close = df.at[i, 'close']
-            upper_band = df.at[i, 'supertrend_upper']
-            lower_band = df.at[i, 'supertrend_lower']
-
-            if close > upper_band:
-                df.at[i, 'os'] = 1  # Bullish
-            elif close < lower_band:
-                df.at[i, 'os'] = 0  # Bearish
-            else:
-                df.at[i, 'os'] = df.at[i - 1, 'os'] if i > 0 else 0
-
-        df['timestamp'] = df['timestamp'].astype(str)
-        df['os'] = df['os'].astype(int)
-
-        update_query = f"UPDATE {table_name} SET os = %s WHERE timestamp = %s;"
-
-        for _, row in df.iterrows():
-            cur.execute(update_query, (row['os'], row['timestamp']))
-
-        conn.commit()
-        logging.info(f" Oscillation State calculated & updated successfully for {table_name}")
-
-        cur.close()
-        conn.close()
-
-    except Exception as e:
-        logging.error(f" Error updating Oscillation State for {table_name}: {e}")
+def schedule_volume_reconciliation(series, entry):
+    """
+    Queues a stored bar for the deferred historical volume check.
+    """
+    with pending_volume_lock:
+        pending_volume_checks.append((series, entry["timestamp"], entry["volume"], time.monotonic()))
 
+def fetch_historical_volumes(token, from_datetime, to_datetime):
+    """
+    Fetches a token's 1-minute historical candles from from_datetime up to (excluding) to_datetime (IST)
+    with one call through the backfill rate limiter, and sums their volumes into the session-anchored
+    bars of every timeframe (the same buckets as the candle builder).
+    Returns {timeframe: {"YYYY-MM-DD HH:MM": volume}}.
+    """
+    candles = historical_backfill.fetch(token, CANDLE_TIMEFRAMES[1], from_datetime,
+                                        to_datetime - datetime.timedelta(seconds=1))
 
+    volumes = {timeframe: defaultdict(int) for timeframe in CANDLE_TIMEFRAMES}
+    for candle in candles:
+        minute = minute_bucket(exchange_time(candle["date"]))
+        for timeframe, bars in volumes.items():
+            bars[bucket_to_datetime(candle_builder.bucket_of(minute, timeframe)).strftime("%Y-%m-%d %H:%M")] += candle["volume"]
+    return volumes
 
-def calculate_supertrend_pivot_for_table(table_name):
+@metrics.timed("volume_corrections", token_of=series_token)
+def apply_volume_corrections(series, corrections):
     """
-    Calculate Supertrend Pivot (spt) for a specific 5-min OHLC table.
+    Writes corrected volumes back in one bulk update, then recomputes the volume-weighted
+    CBOE columns and re-seeds the incremental state. Runs on the token's candle worker so
+    it never interleaves with a live bar of the same series.
     """
-
     try:
-        conn = connect_to_db()
-        if not conn:
-            return
-        
-        cur = conn.cursor()
-        logging.info(f" Calculating Supertrend Pivot (SPT) for Table: {table_name}")
-
-        # Check if required columns exist
-        cur.execute(f"""
-            SELECT 
-                EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name=%s AND column_name='os'),
-                EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name=%s AND column_name='supertrend_upper'),
-                EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name=%s AND column_name='supertrend_lower')
-        """, (table_name, table_name, table_name))
-        os_exists, upper_exists, lower_exists = cur.fetchone()
-
-        if not (os_exists and upper_exists and lower_exists):
-            logging.warning(f" Required columns missing in {table_name}. Skipping...")
-            return
-
-        cur.execute(f"SELECT timestamp, os, supertrend_upper, supertrend_lower FROM {table_name} ORDER BY timestamp;")
-        rows = cur.fetchall()
-
-        if not rows:
-            logging.warning(f" No data found in {table_name} for Supertrend Pivot calculation.")
-            return
-
-        df = pd.DataFrame(rows, columns=['timestamp', 'os', 'supertrend_upper', 'supertrend_lower'])
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-
-        df['spt'] = df.apply(lambda row: row['supertrend_lower'] if row['os'] == 1 else row['supertrend_upper'], axis=1)
-
-        df['timestamp'] = df['timestamp'].astype(str)
-        df['spt'] = df['spt'].astype(float)
-
-        update_query = f"UPDATE {table_name} SET spt = %s WHERE timestamp = %s;"
-
-        for _, row in df.iterrows():
-            cur.execute(update_query, (row['spt'], row['timestamp']))
-
-        conn.commit()
-        logging.info(f" Supertrend Pivot (SPT) calculated & updated successfully for {table_name}")
-
-        cur.close()
-        conn.close()
+        with candle_unit_of_work():
+            with db_cursor() as cur:
+                bulk_update_series(cur, series, corrections, ["volume"])
+            calculate_cboe_for_series(series)
+        seed_indicator_state(series)
+        logging.info(f" Volume reconciled for {len(corrections)} bars in {series}")
 
     except Exception as e:
-        logging.error(f" Error updating Supertrend Pivot (SPT) for {table_name}: {e}")
-
-
-#  Calculate Oscillation State for CE and PE (not for NIFTY anymore)
-calculate_oscillation_state_for_table(nearest_contracts['CE']['table_5min'])
-calculate_oscillation_state_for_table(nearest_contracts['PE']['table_5min'])
-
-#  Calculate Supertrend Pivot (SPT) for CE and PE (not for NIFTY anymore)
-calculate_supertrend_pivot_for_table(nearest_contracts['CE']['table_5min'])
-calculate_supertrend_pivot_for_table(nearest_contracts['PE']['table_5min'])
+        indicator_state.pop(series, None)
+        logging.error(f" Error applying volume corrections to {series}: {e}")
 
-
-def calculate_max_channel_for_table(table_name):
+@metrics.timed("volume_reconcile")
+def reconcile_pending_volumes():
     """
-    Calculate Max Channel using Oscillation State (os), Close Price, and Supertrend Pivot (spt)
-    for a specific 5-min OHLC table.
+    Runs one reconciliation batch: every bar queued for longer than VOLUME_RECONCILE_DELAY
+    is checked against a single rate-limited 1-minute historical_data call per token (the
+    higher timeframes are summed from it), and series with mismatching volumes are corrected
+    on their candle worker.
     """
+    cutoff = time.monotonic() - VOLUME_RECONCILE_DELAY
+    due = defaultdict(lambda: defaultdict(list))  # token → series → [(timestamp, tick volume), ...]
 
-    try:
-        conn = connect_to_db()
-        if not conn:
-            return
-        
-        cur = conn.cursor()
-        logging.info(f" Calculating Max Channel for Table: {table_name}")
-
-        # Check if required columns exist
-        cur.execute(f"""
-            SELECT 
-                EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name=%s AND column_name='os'),
-                EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name=%s AND column_name='close'),
-                EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name=%s AND column_name='spt')
-        """, (table_name, table_name, table_name))
-        os_exists, close_exists, spt_exists = cur.fetchone()
-
-        if not (os_exists and close_exists and spt_exists):
-            logging.warning(f" Required columns missing in {table_name}. Skipping...")
-            return
-
-        cur.execute(f"SELECT timestamp, os, close, spt FROM {table_name} ORDER BY timestamp;")
-        rows = cur.fetchall()
-
-        if not rows:
-            logging.warning(f" No data found in {table_name} for Max Channel calculation.")
-            return
-
-        df = pd.DataFrame(rows, columns=['timestamp', 'os', 'close', 'spt'])
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-
-        df['max_channel'] = 0.0
-
-        for i in range(len(df)):
-            close = df.at[i, 'close']
-            os = df.at[i, 'os']
-            spt = df.at[i, 'spt']
-
-            if i == 0:
-                df.at[i, 'max_channel'] = close
-            else:
-                prev_max_channel = df.at[i - 1, 'max_channel']
-                prev_os = df.at[i - 1, 'os']
-
-                if close > spt:
-                    df.at[i, 'max_channel'] = max(prev_max_channel, close)
-                elif os == 1:
-                    df.at[i, 'max_channel'] = max(close, prev_max_channel)
-                else:
-                    df.at[i, 'max_channel'] = min(spt, prev_max_channel)
-
-        df['timestamp'] = df['timestamp'].astype(str)
-        df['max_channel'] = df['max_channel'].astype(float)
+    with pending_volume_lock:
+        while pending_volume_checks and pending_volume_checks[0][3] <= cutoff:
+            series, timestamp, volume, _ = pending_volume_checks.popleft()
+            due[series.token][series].append((timestamp, volume))
 
-        update_query = f"UPDATE {table_name} SET max_channel = %s WHERE timestamp = %s;"
-
-        for _, row in df.iterrows():
-            cur.execute(update_query, (row['max_channel'], row['timestamp']))
-
-        conn.commit()
-        logging.info(f" Max Channel calculated & updated successfully for {table_name}")
-
-        cur.close()
-        conn.close()
+    for token, by_series in due.items():
+        try:
+            #  One window from the earliest bar start to the latest bar end of any timeframe
+            bar_starts = [(bar_time(timestamp), series.timeframe)
+                          for series, bars in by_series.items() for timestamp, _ in bars]
+            from_datetime = min(start for start, _ in bar_starts)
+            to_datetime = max(start + datetime.timedelta(minutes=timeframe) for start, timeframe in bar_starts)
+            historical = fetch_historical_volumes(token, from_datetime, to_datetime)
+        except Exception as e:
+            logging.error(f" Error fetching historical volumes for token {token}: {e}")
+            continue
+
+        for series, bars in by_series.items():
+            volumes = historical[series.timeframe]
+            corrections = pd.DataFrame(
+                [(bar_time(timestamp), volumes[timestamp]) for timestamp, volume in bars
+                 if timestamp in volumes and volumes[timestamp] != volume],
+                columns=["timestamp", "volume"]
+            )
 
-    except Exception as e:
-        logging.error(f" Error updating Max Channel for {table_name}: {e}")
+            if corrections.empty:
+                logging.info(f" Tick volumes match historical data for {len(bars)} bars of {series}")
+                continue
 
+            candle_workers.submit(series.token, apply_volume_corrections, series, corrections)
 
-def calculate_min_channel_for_table(table_name):
+@metrics.timed("finalise_candle", token_of=series_token)
+def finalise_candle(series, entry):
     """
-    Calculate Min Channel using Oscillation State (os), Close Price, and Supertrend Pivot (spt)
-    for a specific 5-min OHLC table.
+    Persists one finished bar of a series and updates its indicators in a single unit of
+    work. Runs on the token's candle worker, so tokens are processed in parallel while
+    bars of the same token stay in order.
     """
+    #Volume comes from the volume_traded deltas of the ticks; historical_data is checked later in the background
+    logging.info(f" {series.timeframe}-min OHLC for Token {series.token}: {entry}")
 
+    #  One unit of work per candle: the insert and every indicator write commit together
     try:
-        conn = connect_to_db()
-        if not conn:
-            return
-
-        cur = conn.cursor()
-        logging.info(f" Calculating Min Channel for Table: {table_name}")
-
-        # Check if required columns exist
-        cur.execute(f"""
-            SELECT 
-                EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name=%s AND column_name='os'),
-                EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name=%s AND column_name='close'),
-                EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name=%s AND column_name='spt')
-        """, (table_name, table_name, table_name))
-        os_exists, close_exists, spt_exists = cur.fetchone()
-
-        if not (os_exists and close_exists and spt_exists):
-            logging.warning(f" Required columns missing in {table_name}. Skipping...")
-            return
-
-        cur.execute(f"SELECT timestamp, os, close, spt FROM {table_name} ORDER BY timestamp;")
-        rows = cur.fetchall()
-
-        if not rows:
-            logging.warning(f" No data found in {table_name} for Min Channel calculation.")
-            return
-
-        df = pd.DataFrame(rows, columns=['timestamp', 'os', 'close', 'spt'])
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-
-        df['min_channel'] = 0.0
+        ensure_ohlc_partitions([datetime.date.fromisoformat(entry["timestamp"][:10])])
 
-        for i in range(len(df)):
-            close = df.at[i, 'close']
-            os = df.at[i, 'os']
-            spt = df.at[i, 'spt']
-
-            if i == 0:
-                df.at[i, 'min_channel'] = close
+        with candle_unit_of_work():
+            with metrics.timer("insert_bar", token=series.token), db_cursor() as cur:
+                cur.execute(f"""
+                    INSERT INTO {OHLC_TABLE} (instrument_token, timeframe, timestamp, open, high, low, close, volume)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                    ON CONFLICT (instrument_token, timeframe, timestamp) DO NOTHING
+                    RETURNING timestamp;
+                """, (series.token, series.timeframe, bar_time(entry["timestamp"]), entry["open"], entry["high"],
+                      entry["low"], entry["close"], entry["volume"]))
+                inserted = cur.fetchone()
+
+            # Calculate indicators (only the new row when the bar was appended)
+            if inserted:
+                update_indicators_for_new_bar(series, {**entry, "timestamp": inserted[0]})
             else:
-                prev_min_channel = df.at[i - 1, 'min_channel']
-                prev_os = df.at[i - 1, 'os']
-
-                if close < spt:
-                    df.at[i, 'min_channel'] = min(prev_min_channel, close)
-                elif os == 0:
-                    df.at[i, 'min_channel'] = min(close, prev_min_channel)
-                else:
-                    df.at[i, 'min_channel'] = max(spt, prev_min_channel)
+                recalculate_all_indicators_for_series(series)
 
-        df['timestamp'] = df['timestamp'].astype(str)
-        df['min_channel'] = df['min_channel'].astype(float)
+        metrics.count("bars_finalised_total", token=series.token, timeframe=series.timeframe)
 
-        update_query = f"UPDATE {table_name} SET min_channel = %s WHERE timestamp = %s;"
-
-        for _, row in df.iterrows():
-            cur.execute(update_query, (row['min_channel'], row['timestamp']))
-
-        conn.commit()
-        logging.info(f" Min Channel calculated & updated successfully for {table_name}")
-
-        cur.close()
-        conn.close()
+        #  Committed → queue the tick-derived volume for the deferred historical check
+        if inserted:
+            schedule_volume_reconciliation(series, entry)
 
     except Exception as e:
-        logging.error(f" Error updating Min Channel for {table_name}: {e}")
+        #  Rolled back → incremental state may be ahead of the store
+        indicator_state.pop(series, None)
+        invalidate_table_columns(OHLC_TABLE)
+        logging.error(f" Candle unit of work failed for {series}: {e}")
 
-#  Calculate Max Channel for Nearest CE & PE Only (skip NIFTY)
-calculate_max_channel_for_table(nearest_contracts['CE']['table_5min'])
-calculate_max_channel_for_table(nearest_contracts['PE']['table_5min'])
+#  Pre-warmed Neighbouring Strikes
+PREWARM_STRIKES = 2  # Strikes kept hot on each side of the current nearest OTM CE and PE
 
-#  Calculate Min Channel for Nearest CE & PE Only (skip NIFTY)
-calculate_min_channel_for_table(nearest_contracts['CE']['table_5min'])
-calculate_min_channel_for_table(nearest_contracts['PE']['table_5min'])
+#  token → {"symbol", "ready"}: every listed contract has its series, candles and indicator
+#  state maintained live by its candle worker, so switching to it needs no I/O
+warm_contracts = {}
+warm_contracts_lock = threading.Lock()
 
-def calculate_supertrend_avg_for_table(table_name):
+@metrics.timed("warm_contract", token_of=lambda token, *args: token)
+def warm_contract(token, symbol):
     """
-    Calculate Supertrend Average Channel using Max and Min Channels
-    for a specific 5-min OHLC table.
+    Backfills and computes every timeframe series of one contract and seeds its
+    incremental indicator state. Runs on the token's candle worker, ahead of its live bars.
     """
-
     try:
-        conn = connect_to_db()
-        if not conn:
-            return
-
-        cur = conn.cursor()
-        logging.info(f" Calculating Supertrend Average Channel for Table: {table_name}")
-
-        # Check if required columns exist
-        cur.execute(f"""
-            SELECT 
-                EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name=%s AND column_name='max_channel'),
-                EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name=%s AND column_name='min_channel')
-        """, (table_name, table_name))
-        max_exists, min_exists = cur.fetchone()
-
-        if not (max_exists and min_exists):
-            logging.warning(f" Required columns missing in {table_name}. Skipping...")
-            return
-
-        cur.execute(f"SELECT timestamp, max_channel, min_channel FROM {table_name} ORDER BY timestamp;")
-        rows = cur.fetchall()
-
-        if not rows:
-            logging.warning(f" No data found in {table_name} for Supertrend Average calculation.")
-            return
-
-        df = pd.DataFrame(rows, columns=['timestamp', 'max_channel', 'min_channel'])
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-
-        df['supertrend_avg'] = (df['max_channel'] + df['min_channel']) / 2
+        series_list = [ohlc_series(token, symbol, timeframe) for timeframe in CANDLE_TIMEFRAMES]
+        backfill_ohlc_series(series_list)
+        for series in series_list:
+            recalculate_all_indicators_for_series(series)
 
-        df['timestamp'] = df['timestamp'].astype(str)
-        df['supertrend_avg'] = df['supertrend_avg'].astype(float)
-
-        update_query = f"UPDATE {table_name} SET supertrend_avg = %s WHERE timestamp = %s;"
-
-        for _, row in df.iterrows():
-            cur.execute(update_query, (row['supertrend_avg'], row['timestamp']))
-
-        conn.commit()
-        logging.info(f" Supertrend Average Channel calculated & updated successfully for {table_name}")
-
-        cur.close()
-        conn.close()
+        with warm_contracts_lock:
+            if token in warm_contracts:
+                warm_contracts[token]["ready"] = True
+        logging.info(f" Pre-warmed {symbol} ({token})")
 
     except Exception as e:
-        logging.error(f" Error updating Supertrend Average Channel for {table_name}: {e}")
-
-#  Calculate Supertrend Average Channel for Nearest CE & PE Only (skip NIFTY)
-calculate_supertrend_avg_for_table(nearest_contracts['CE']['table_5min'])
-calculate_supertrend_avg_for_table(nearest_contracts['PE']['table_5min'])
+        logging.error(f" Error pre-warming {symbol} ({token}): {e}")
 
-
-def get_5min_table_for_token(token):
+def fill_contract_gaps(token, symbol):
     """
-    Returns the correct 5-min OHLC table name based on token (CE or PE).
+    Requests only the bars of a warm contract that are missing (e.g. missed while the feed
+    was down) and recomputes its series when any arrived. Runs on the token's candle worker.
     """
-    conn = connect_to_db()
-    cur = conn.cursor()
-
-    cur.execute("SELECT ce_token, ce_table_5min, pe_token, pe_table_5min FROM nearest_otm_contracts LIMIT 1;")
-    result = cur.fetchone()
-
-    ce_token, ce_table_5min, pe_token, pe_table_5min = result
-
-    cur.close()
-    conn.close()
+    try:
+        series_list = [ohlc_series(token, symbol, timeframe) for timeframe in CANDLE_TIMEFRAMES]
+        report = backfill_ohlc_series(series_list)
+        if report["rows"]:
+            for series in series_list:
+                recalculate_all_indicators_for_series(series)
 
-    if token == ce_token:
-        return ce_table_5min
-    elif token == pe_token:
-        return pe_table_5min
-    else:
-        return None
+    except Exception as e:
+        logging.error(f" Error filling gaps of {symbol} ({token}): {e}")
 
-def get_symbol_from_token(token):
+def schedule_gap_fill():
     """
-    Returns the symbol (trading symbol) based on token (CE or PE).
+    Queues a gap fill for every warm contract on its candle worker (after a reconnect).
     """
-    conn = connect_to_db()
-    cur = conn.cursor()
-
-    cur.execute("SELECT ce_token, ce_symbol, pe_token, pe_symbol FROM nearest_otm_contracts LIMIT 1;")
-    result = cur.fetchone()
-
-    ce_token, ce_symbol, pe_token, pe_symbol = result
-
-    cur.close()
-    conn.close()
-
-    if token == ce_token:
-        return ce_symbol
-    elif token == pe_token:
-        return pe_symbol
-    else:
-        return None
-    
-
-from kiteconnect import KiteConnect
+    with warm_contracts_lock:
+        contracts = [(token, contract["symbol"]) for token, contract in warm_contracts.items() if contract["ready"]]
 
+    for token, symbol in contracts:
+        candle_workers.submit(token, fill_contract_gaps, token, symbol)
+    logging.info(f" Gap fill queued for {len(contracts)} warm contracts")
 
+def schedule_prewarm(centre_tokens):
+    """
+    Keeps PREWARM_STRIKES strikes on each side of every centre contract warm. New neighbours
+    are warmed in the background on their candle workers; contracts that left the window stop
+    being processed live (their stored history is kept).
+    """
+    wanted = {}
+    for token in centre_tokens:
+        row = instrument_index.by_token(token)
+        if row is None:
+            continue
+        for neighbour in instrument_index.neighbours(row["name"], row["expiry"], row["instrument_type"],
+                                                     row["strike"], PREWARM_STRIKES):
+            wanted[neighbour["instrument_token"]] = neighbour["tradingsymbol"]
 
+    with warm_contracts_lock:
+        new = [(token, symbol) for token, symbol in wanted.items() if token not in warm_contracts]
+        stale = [(token, warm_contracts.pop(token)["symbol"]) for token in list(warm_contracts) if token not in wanted]
+        for token, symbol in new:
+            warm_contracts[token] = {"symbol": symbol, "ready": False}
 
+    #  Only warm contracts get bars; ticks of the rest of the ladder are not buffered
+    candle_builder.set_active(wanted)
 
-#  Initialize this global variable once before starting infinite loop
-last_5min_processed = None
-
-
-#Setting up live websocket connection, tick by tick handling and aggregation
-from kiteconnect import KiteTicker
-import logging
-import time
-import os
-import datetime
-from collections import defaultdict, deque
-
-#  Set up logging
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
-
-#  Zerodha API Credentials
-API_KEY = "8re7mjcm2btaozwf"  # Replace with your API key
-
-#  Fetch access token dynamically from the file
-with open("access_token.txt", "r") as f:
-    ACCESS_TOKEN = f.read().strip()
+    for token, symbol in stale:
+        candle_workers.release(token)
+        for timeframe in CANDLE_TIMEFRAMES:
+            indicator_state.pop(ohlc_series(token, symbol, timeframe), None)
 
-#  Dynamically Prepare All Instrument Tokens for Subscription
-# From fetched contracts
-INSTRUMENT_TOKENS = [256265]  # NIFTY Index Token
+    for token, symbol in new:
+        candle_workers.submit(token, warm_contract, token, symbol)
 
-# Add all CE + PE contract tokens
-INSTRUMENT_TOKENS += [contract['token'] for contract in contracts['ce_contracts'] + contracts['pe_contracts']]
+    if new or stale:
+        logging.info(f" Warm window: +{[symbol for _, symbol in new]} -{[symbol for _, symbol in stale]}")
 
-logging.info(f" All Tokens to Subscribe for Live Ticks: {INSTRUMENT_TOKENS}")
+#  The startup contracts were built above → already warm; warm their neighbours in the background
+for side in ("CE", "PE"):
+    warm_contracts[nearest_contracts[side]["token"]] = {"symbol": nearest_contracts[side]["symbol"], "ready": True}
+schedule_prewarm(contract_registry.tokens())
 
-#  Initialize KiteTicker WebSocket
-kws = KiteTicker(API_KEY, ACCESS_TOKEN)
-
-
-#  Store Realtime OHLC for Current Candle for Each Symbol
-ohlc_data = {}  
-# Structure → {symbol: {'timestamp': current, 'open': o, 'high': h, 'low': l, 'close': c}}
-
-#  Kill Existing WebSocket Processes (Optional - Safe Cleanup)
-def kill_existing_websockets():
-    try:
-        os.system("pkill -f kiteconnect")  
-        logging.info(" Existing WebSocket instances killed successfully.")
-    except Exception as e:
-        logging.error(f" Error while killing existing WebSocket processes: {e}")
-
-#  Tick Buffers for 1-Minute OHLC Calculation
-tick_buffer = defaultdict(lambda: defaultdict(deque))
-# Structure → {symbol: {minute: deque([tick1, tick2, ...])}}
-
-#  Tick Buffers for 5-Minute OHLC Calculation
-tick_buffer_5min = defaultdict(lambda: deque())
-
-def get_verified_5min_volume(token, start_time_str):
+#  Process Live OHLC Candles and Handle Nearest OTM Switching
+@metrics.timed("candle_close")
+def process_ohlc_candle(boundary, closing_timeframes):
     """
-    Fetches the historical 5-minute candle volume using Kite API for a specific token and timestamp.
+    Finalises every bar that closed at `boundary` (exchange time). Called by the candle
+    close scheduler once per bar boundary with the timeframes closing there.
+    Returns the futures of the finalise tasks it submitted (the replay harness waits on them).
     """
+    futures = []
     try:
-        from_datetime = datetime.datetime.strptime(start_time_str, "%Y-%m-%d %H:%M")
-        to_datetime = from_datetime + datetime.timedelta(minutes=5)
-
-        candles = kite.historical_data(
-            instrument_token=token,
-            from_date=from_datetime,
-            to_date=to_datetime,
-            interval="5minute"
-        )
-
-        if candles:
-            return candles[0]['volume']
-        else:
-            logging.warning(f"⚠️ No historical candle found for token {token} at {start_time_str}")
-            return 0
-    except Exception as e:
-        logging.error(f" Error fetching historical volume for token {token}: {e}")
-        return 0
-
-#  Process Live OHLC Candles and Handle Nearest OTM Switching
-def process_ohlc_candle():
-    global current_ce_token, current_pe_token
-    global last_5min_processed  # 🛠️ Important to add this
-
-    current_time = datetime.datetime.now()
-    current_minute = current_time.strftime("%Y-%m-%d %H:%M")  # "YYYY-MM-DD HH:MM"
-
-    try:
-        conn = connect_to_db()
-        if not conn:
-            logging.error(" Cannot connect to database inside process_ohlc_candle()")
-            return
-
-        cur = conn.cursor()
+        # Step 1: Close every bar whose interval has ended (1-min bars cascade into 3/5/15/60-min bars)
+        with metrics.timer("roll"):
+            candle_builder.roll(boundary)
+        logging.info(f" Bar boundary {boundary}: closing {closing_timeframes}-min bars")
+
+        #  Dispatch each finished bar of every warm contract to its token's candle worker (tokens run in parallel)
+        with warm_contracts_lock:
+            symbols = {token: contract["symbol"] for token, contract in warm_contracts.items()}
+        with metrics.timer("dispatch"):
+            for timeframe in CANDLE_TIMEFRAMES:
+                for token, entry in candle_builder.drain(timeframe):
+                    if symbols.get(token) is None:
+                        continue
 
-        # Step 1: Process Previous 1-Minute Candle for Both CE and PE (Only Current Tokens)
-        previous_minute = (current_time - datetime.timedelta(minutes=1)).strftime("%Y-%m-%d %H:%M")
+                    # Resolve the series now: contract switching below may change the routing
+                    series = ohlc_series(token, symbols[token], timeframe)
+                    futures.append(candle_workers.submit(token, finalise_candle, series, entry))
 
-        for token in [current_ce_token, current_pe_token]:
-            if previous_minute in tick_buffer[token]:
-                ticks = list(tick_buffer[token][previous_minute])
+        # Step 2: Switch Nearest OTM only when a 5-min bar closed
+        if 5 in closing_timeframes:
+            logging.info(f" DB pool stats: {get_db_pool_stats()}")
+            logging.info(f" Candle worker queue depths: {candle_workers.queue_depths()}")
+            logging.info(f" Candle builder buffers: {candle_builder.buffer_stats()}")
+            logging.info(f" Last-price cache: {last_prices.hits} hits, {last_prices.misses} REST fallbacks")
 
-                if ticks:
-                    prices = [tick['last_price'] for tick in ticks]
-                    
-                    ohlc_entry = {
-                        "timestamp": previous_minute,
-                        "open": prices[0],
-                        "high": max(prices),
-                        "low": min(prices),
-                        "close": prices[-1],
-                    }
+            logging.info(f" Async engine stats: {async_engine.stats} | tick queue depth {async_engine.tick_queue_depth()}")
+            log_stage_latencies()
 
-                    logging.info(f" 1-min OHLC for Token {token}: {ohlc_entry}")
+            # Step 3: Check nearest OTM contract switching as its own job (an LTP fallback never delays the close)
+            async_engine.spawn("contract-selection", switch_nearest_otm_contracts, timeout=CONTRACT_SELECT_TIMEOUT)
 
-                # Store ticks into 5-min buffer
-                tick_buffer_5min[token].extend(ticks)
-                del tick_buffer[token][previous_minute]
+    except Exception as e:
+        logging.error(f" Error inside process_ohlc_candle(): {e}")
 
+    return futures
 
-        # Step 2: Only Process 5-min Candle and Switch Nearest OTM if NEW 5-min window
-        if current_time.minute % 5 == 0:
-            if last_5min_processed != current_time.strftime("%Y-%m-%d %H:%M"):
-                #  New 5-min window detected
-                last_5min_processed = current_time.strftime("%Y-%m-%d %H:%M")
-                logging.info(f" Detected start of new 5-minute window at {current_time}")
+@metrics.timed("contract_switch")
+def switch_nearest_otm_contracts():
+    """
+    Re-selects the nearest OTM CE/PE contracts and, when they switched, re-centres the warm window.
+    """
+    if not update_nearest_otm_contracts():
+        return
 
-                for token in [current_ce_token, current_pe_token]:
-                    if len(tick_buffer_5min[token]) == 0:
-                        continue
+    logging.info(" Nearest OTM Contract Changed! Switching...")
+    current_tokens = contract_registry.tokens()
 
-                    # 5-min start time
-                    five_min_start = current_time - datetime.timedelta(minutes=5)
-                    five_min_start = five_min_start.replace(second=0, microsecond=0).strftime("%Y-%m-%d %H:%M")
+    # The new contracts are normally pre-warmed neighbours → switching is a pointer swap
+    with warm_contracts_lock:
+        cold = [token for token in current_tokens if not warm_contracts.get(token, {}).get("ready")]
 
-                    five_min_ticks = list(tick_buffer_5min[token])
-                    five_min_prices = [tick['last_price'] for tick in five_min_ticks]
-                    
+    # Re-centre the warm window (cold contracts are warmed on their workers, ahead of their bars)
+    schedule_prewarm(current_tokens)
 
-                    five_min_entry = {
-                        "timestamp": five_min_start,
-                        "open": five_min_prices[0],
-                        "high": max(five_min_prices),
-                        "low": min(five_min_prices),
-                        "close": five_min_prices[-1],
-                        #Volume is fetched historically from the kite api as soon as 5min candle finishes
-                        "volume": get_verified_5min_volume(token, five_min_start)
-                    }
-                    logging.info(f" 5-min OHLC for Token {token}: {five_min_entry}")
+    if cold:
+        logging.warning(f" Switched to contracts that were not pre-warmed yet: {cold} (warming in background)")
+    else:
+        logging.info(" New Nearest OTM Switching completed successfully (pre-warmed, no I/O)!")
 
-                    table_name = get_5min_table_for_token(token)
 
-                    cur.execute(f"""
-                        INSERT INTO {table_name} (timestamp, open, high, low, close, volume)
-                        VALUES (%s, %s, %s, %s, %s, %s)
-                        ON CONFLICT (timestamp) DO NOTHING;
-                    """, (five_min_entry["timestamp"], five_min_entry["open"], five_min_entry["high"],
-                          five_min_entry["low"], five_min_entry["close"], five_min_entry["volume"]))
-                    conn.commit()
-
-                    # logging.info(f" Inserted 5-min OHLC into {table_name}")
-
-                    # Calculate indicators
-                    calculate_hl2_for_table(table_name)
-                    calculate_atr_for_table(table_name)
-                    calculate_initial_upper_band_for_table(table_name)
-                    calculate_initial_lower_band_for_table(table_name)
-                    calculate_supertrend_upper_for_table(table_name)
-                    calculate_supertrend_lower_for_table(table_name)
-                    calculate_oscillation_state_for_table(table_name)
-                    calculate_supertrend_pivot_for_table(table_name)
-                    calculate_max_channel_for_table(table_name)
-                    calculate_min_channel_for_table(table_name)
-                    calculate_supertrend_avg_for_table(table_name)
-                    calculate_adx_for_table(table_name, period=2)
-                    calculate_ema_for_table(table_name, length=22)
-                    calculate_ema_for_table(table_name, length=33)
-                    calculate_cboe_for_table(table_name)
-
-                    # logging.info(f" Indicators recalculated for {table_name}")
-
-                    # Clear buffer
-                    tick_buffer_5min[token].clear()
-
-                # Step 3: After processing both tokens → Check nearest OTM contract switching
-                update_nearest_otm_contracts()
-
-                # Fetch latest nearest_otm_contracts from database
-                conn_check = connect_to_db()
-                if conn_check:
-                    cur_check = conn_check.cursor()
-                    cur_check.execute("""
-                        SELECT ce_token, pe_token
-                        FROM nearest_otm_contracts
-                        ORDER BY update_timestamp DESC
-                        LIMIT 1;
-                    """)
-                    new_result = cur_check.fetchone()
-
-                    if new_result:
-                        new_ce_token, new_pe_token = new_result
-
-                        if new_ce_token != current_ce_token or new_pe_token != current_pe_token:
-                            logging.info(" Nearest OTM Contract Changed! Switching...")
-
-                            # Update current CE/PE tokens
-                            current_ce_token = new_ce_token
-                            current_pe_token = new_pe_token
-
-                            # Create new tables
-                            ce_symbol = get_symbol_from_token(current_ce_token)
-                            pe_symbol = get_symbol_from_token(current_pe_token)
-                            create_nearest_otm_ohlc_tables(ce_symbol, pe_symbol)
-
-                            # Fetch historical into new tables
-                            fetch_and_merge_ohlc_for_table(f"{ce_symbol.lower()}_ohlc_5min", current_ce_token, "5minute")
-                            fetch_and_merge_ohlc_for_table(f"{pe_symbol.lower()}_ohlc_5min", current_pe_token, "5minute")
-
-                            # Calculate indicators for fresh tables
-                            calculate_hl2_for_table(f"{ce_symbol.lower()}_ohlc_5min")
-                            calculate_atr_for_table(f"{ce_symbol.lower()}_ohlc_5min")
-                            calculate_initial_upper_band_for_table(f"{ce_symbol.lower()}_ohlc_5min")
-                            calculate_initial_lower_band_for_table(f"{ce_symbol.lower()}_ohlc_5min")
-                            calculate_supertrend_upper_for_table(f"{ce_symbol.lower()}_ohlc_5min")
-                            calculate_supertrend_lower_for_table(f"{ce_symbol.lower()}_ohlc_5min")
-                            calculate_oscillation_state_for_table(f"{ce_symbol.lower()}_ohlc_5min")
-                            calculate_supertrend_pivot_for_table(f"{ce_symbol.lower()}_ohlc_5min")
-                            calculate_max_channel_for_table(f"{ce_symbol.lower()}_ohlc_5min")
-                            calculate_min_channel_for_table(f"{ce_symbol.lower()}_ohlc_5min")
-                            calculate_supertrend_avg_for_table(f"{ce_symbol.lower()}_ohlc_5min")
-                            calculate_adx_for_table(f"{ce_symbol.lower()}_ohlc_5min", period=2)
-                            calculate_ema_for_table(f"{ce_symbol.lower()}_ohlc_5min", length=22)
-                            calculate_ema_for_table(f"{ce_symbol.lower()}_ohlc_5min", length=33)
-                            calculate_cboe_for_table(f"{ce_symbol.lower()}_ohlc_5min")
-
-                            
-
-                            calculate_hl2_for_table(f"{pe_symbol.lower()}_ohlc_5min")
-                            calculate_atr_for_table(f"{pe_symbol.lower()}_ohlc_5min")
-                            calculate_initial_upper_band_for_table(f"{pe_symbol.lower()}_ohlc_5min")
-                            calculate_initial_lower_band_for_table(f"{pe_symbol.lower()}_ohlc_5min")
-                            calculate_supertrend_upper_for_table(f"{pe_symbol.lower()}_ohlc_5min")
-                            calculate_supertrend_lower_for_table(f"{pe_symbol.lower()}_ohlc_5min")
-                            calculate_oscillation_state_for_table(f"{pe_symbol.lower()}_ohlc_5min")
-                            calculate_supertrend_pivot_for_table(f"{pe_symbol.lower()}_ohlc_5min")
-                            calculate_max_channel_for_table(f"{pe_symbol.lower()}_ohlc_5min")
-                            calculate_min_channel_for_table(f"{pe_symbol.lower()}_ohlc_5min")
-                            calculate_supertrend_avg_for_table(f"{pe_symbol.lower()}_ohlc_5min")
-                            calculate_adx_for_table(f"{pe_symbol.lower()}_ohlc_5min", period=2)
-                            calculate_ema_for_table(f"{pe_symbol.lower()}_ohlc_5min", length=22)
-                            calculate_ema_for_table(f"{pe_symbol.lower()}_ohlc_5min", length=33)
-                            calculate_cboe_for_table(f"{pe_symbol.lower()}_ohlc_5min")
-
-                        
-
-                            logging.info(" New Nearest OTM Switching completed successfully!")
-
-                    cur_check.close()
-                    conn_check.close()
-
-        cur.close()
-        conn.close()
+#  Candle Close Scheduler (sleeps until each bar boundary + grace instead of polling)
+CANDLE_CLOSE_GRACE = 2.0  # Seconds of exchange time to wait after a boundary for late ticks
 
-    except Exception as e:
-        logging.error(f" Error inside process_ohlc_candle(): {e}")
-        if conn:
-            conn.rollback()
-            cur.close()
-            conn.close()
+candle_scheduler = CandleCloseScheduler(process_ohlc_candle, timeframes=tuple(CANDLE_TIMEFRAMES), grace=CANDLE_CLOSE_GRACE)
 
 
 #  Handle WebSocket Connection
+websocket_connects = 0
+
 def on_connect(ws, response):
+    global websocket_connects
     logging.info(" WebSocket Connected. Attempting subscription...")
 
+    #  Reconnected → fetch only the bars missed while the feed was down
+    websocket_connects += 1
+    if websocket_connects > 1:
+        schedule_gap_fill()
+
     try:
         time.sleep(1)  # Small delay before subscribing (prevents race condition)
         ws.subscribe(INSTRUMENT_TOKENS)
@@ -2185,7 +1888,14 @@ def on_connect(ws, response):
         logging.error(f" Subscription failed: {e}")
 
 #  Handle Incoming Tick Data & Assign to Correct Minute
+@metrics.timed("tick_batch")
 def on_ticks(ws, ticks):
+    #  Append-only archive of the raw feed (replay / crash recovery / research)
+    tick_archive.append_ticks(ticks)
+
+    #  Latest price / quote per token for the OTM selection (replaces REST LTP calls)
+    last_prices.update_ticks(ticks)
+
     for tick in ticks:
         
         token = tick['instrument_token']
@@ -2194,8 +1904,43 @@ def on_ticks(ws, ticks):
         if token not in INSTRUMENT_TOKENS:
             continue  # Ignore ticks for any irrelevant tokens (safety)
 
-        tick_time = tick['exchange_timestamp'].strftime("%Y-%m-%d %H:%M")  # Extract minute part
-        tick_buffer[token][tick_time].append(tick)  # Append tick to its respective minute
+        candle_builder.add_tick(token, tick['last_price'], tick['exchange_timestamp'],
+                                tick.get('volume_traded'))  # O(1) OHLCV update
+
+    #  Keep the scheduler's boundaries on exchange time
+    if ticks:
+        candle_scheduler.observe(ticks[-1].get('exchange_timestamp'))
+
+#  asyncio Engine Core (tick intake, bar-boundary timer and blocking I/O jobs with timeouts)
+ENGINE_IO_WORKERS = 4           # Threads for DB / REST jobs run by the engine
+ENGINE_TICK_QUEUE_SIZE = 10000  # Tick batches buffered between the websocket and the intake task
+CLOSE_PATH_BUDGET = 1.0         # Seconds; slower candle closes are logged
+CONTRACT_SELECT_TIMEOUT = 15    # Seconds the nearest OTM re-selection (incl. LTP fallback) may take
+
+async_engine = AsyncEngine(candle_scheduler, on_ticks, tick_queue_size=ENGINE_TICK_QUEUE_SIZE,
+                           io_workers=ENGINE_IO_WORKERS, close_budget=CLOSE_PATH_BUDGET)
+
+#  Engine Metrics Export (Prometheus text: local endpoint and / or periodically flushed file)
+METRICS_PORT = int(os.environ.get("ENGINE_METRICS_PORT", "0"))             # 0 → no HTTP endpoint
+METRICS_FILE = os.environ.get("ENGINE_METRICS_FILE", "")                    # Unset → no file
+METRICS_FLUSH_INTERVAL = 15  # Seconds between metrics file flushes
+
+def log_stage_latencies():
+    """
+    Logs p50 / p95 / p99 (ms) of every timed stage, for the slowest token of each stage.
+    """
+    stages = metrics.snapshot()["stages"]
+    summary = []
+    for stage, by_labels in sorted(stages.items()):
+        worst = max(by_labels.values(), key=lambda stats: stats["p99"])
+        summary.append(f"{stage} {worst['p50'] * 1000:.1f}/{worst['p95'] * 1000:.1f}/{worst['p99'] * 1000:.1f}")
+    if summary:
+        logging.info(f" Stage latency p50/p95/p99 ms (slowest token): {', '.join(summary)}")
+
+if metrics.enabled and METRICS_PORT:
+    metrics.serve(METRICS_PORT)
+if metrics.enabled and METRICS_FILE:
+    async_engine.every("metrics-flush", METRICS_FLUSH_INTERVAL, lambda: metrics.write_file(METRICS_FILE), timeout=5)
 
 #  Handle WebSocket Closure & Reconnection
 def on_close(ws, code, reason):
@@ -2217,18 +1962,23 @@ def on_reconnect(ws, attempts):
 
 #  Assign Event Handlers to WebSocket
 kws.on_connect = on_connect
-kws.on_ticks = on_ticks
+kws.on_ticks = async_engine.feed_ticks  # Queued for the engine's tick-intake task
 kws.on_close = on_close
 kws.on_error = on_error
 kws.on_reconnect = on_reconnect
 
 #  Start WebSocket After Killing Any Existing WebSocket Processes
-kill_existing_websockets()
-logging.info(" Starting WebSocket connection...")
-kws.connect(threaded=True)
-
-#  Process OHLC Data Every Second (Live loop)
-while True:
-    process_ohlc_candle()
-    time.sleep(1)
+if BROKER_MODE == "fake":
+    logging.info(" Fake broker mode: live WebSocket disabled (feed ticks with tick_replay.py)")
+else:
+    kill_existing_websockets()
+    logging.info(" Starting WebSocket connection...")
+    kws.connect(threaded=True)
+
+#  Deferred volume reconciliation against historical_data (periodic engine job)
+async_engine.every("volume-reconcile", VOLUME_RECONCILE_INTERVAL, reconcile_pending_volumes,
+                   timeout=VOLUME_RECONCILE_TIMEOUT)
+
+#  Run the live engine: tick intake, candle closes at every bar boundary and I/O jobs (Live loop)
+async_engine.run()
 
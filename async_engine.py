@@ -0,0 +1,180 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AsyncEngine:
+    """
+    asyncio core of the live engine. One event loop runs the engine's I/O as cooperating tasks:
+
+    - tick intake: feed_ticks() (the KiteTicker callback, any thread) puts each batch on an
+      asyncio.Queue and one task hands the batches to on_ticks(ws, ticks) in order; at most
+      tick_queue_size batches are queued, beyond that feed_ticks() blocks the websocket thread
+      (back-pressure) instead of dropping ticks;
+    - bar boundaries: a timer task sleeps until the scheduler's next boundary + grace and runs
+      the candle-close path on its own single thread, so closes stay serial and in order;
+    - blocking jobs: periodic jobs (every()) and one-off jobs (spawn()) run psycopg2 / Kite
+      REST calls on a separate I/O executor, each behind a timeout.
+
+    The close path only rolls and dispatches bars (indicator work runs on the per-token
+    workers), so a slow REST call or DB statement delays its own task, never a candle close.
+    A job still running when it is due again is skipped rather than stacked.
+    """
+
+    def __init__(self, scheduler, on_ticks, tick_queue_size=10000, io_workers=4, close_budget=1.0):
+        self.scheduler = scheduler
+        self.on_ticks = on_ticks
+        self.tick_queue_size = tick_queue_size
+        self.close_budget = close_budget  # Seconds; slower candle closes are logged
+
+        self._io = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="engine-io")
+        self._close = ThreadPoolExecutor(max_workers=1, thread_name_prefix="engine-close")
+        self._periodic = []      # (name, interval, func, timeout)
+        self._running = set()    # names of blocking jobs in flight
+        self._loop = None
+        self._ticks = None
+        self._stopped = None
+        self._ready = threading.Event()
+        self._tick_slots = threading.Semaphore(tick_queue_size)  # free places in the tick queue
+
+        self.stats = {
+            "tick_batches": 0,
+            "ticks": 0,
+            "backpressure_waits": 0,
+            "boundaries": 0,
+            "slow_closes": 0,
+            "job_timeouts": 0,
+            "job_skips": 0,
+        }
+
+    #  Called from other threads
+
+    def feed_ticks(self, ws, ticks):
+        """
+        KiteTicker on_ticks callback: queues the batch for the intake task
+        (waits for the event loop when the feed connects before it is running).
+        Blocks while tick_queue_size batches are already queued, so a slow intake slows the
+        feed down rather than losing ticks.
+        """
+        self._ready.wait()
+        if not self._tick_slots.acquire(blocking=False):
+            start = time.perf_counter()
+            self._tick_slots.acquire()
+            self.stats["backpressure_waits"] += 1
+            logging.warning(f" Tick queue full ({self.tick_queue_size} batches), websocket thread waited "
+                            f"{time.perf_counter() - start:.3f}s")
+        self._loop.call_soon_threadsafe(self._ticks.put_nowait, (ws, ticks))
+
+    def spawn(self, name, func, *args, timeout=30.0):
+        """
+        Runs func(*args) once on the I/O executor (skipped if a job of that name is in flight).
+        """
+        if self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(lambda: self._loop.create_task(self._job(name, func, args, timeout)))
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+
+    #  Configuration
+
+    def every(self, name, interval, func, timeout=30.0):
+        """
+        Registers a blocking job run every `interval` seconds once the engine is running.
+        """
+        self._periodic.append((name, interval, func, timeout))
+
+    def tick_queue_depth(self):
+        return self._ticks.qsize() if self._ticks is not None else 0
+
+    #  Event loop
+
+    def run(self):
+        """
+        Blocks the calling thread running the event loop until stop().
+        """
+        asyncio.run(self._main())
+
+    async def _main(self):
+        self._loop = asyncio.get_running_loop()
+        self._ticks = asyncio.Queue()  # Bounded by _tick_slots
+        self._stopped = asyncio.Event()
+
+        tasks = [
+            asyncio.create_task(self._tick_intake(), name="tick-intake"),
+            asyncio.create_task(self._boundaries(), name="bar-boundaries"),
+        ] + [
+            asyncio.create_task(self._every(*job), name=job[0]) for job in self._periodic
+        ]
+        self._ready.set()
+        logging.info(f" Async engine running: {', '.join(task.get_name() for task in tasks)}")
+
+        try:
+            await self._stopped.wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._io.shutdown(wait=False)
+            self._close.shutdown(wait=False)
+
+    async def _tick_intake(self):
+        while True:
+            ws, ticks = await self._ticks.get()
+            self._tick_slots.release()
+            try:
+                self.on_ticks(ws, ticks)
+            except Exception as e:
+                logging.error(f" Error in tick intake: {e}")
+            self.stats["tick_batches"] += 1
+            self.stats["ticks"] += len(ticks)
+
+    async def _boundaries(self):
+        while True:
+            delay = self.scheduler.seconds_until_due()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue  # Re-check: the exchange clock offset may have moved while sleeping
+
+            start = time.perf_counter()
+            try:
+                await self._loop.run_in_executor(self._close, self.scheduler.fire_due)
+            except Exception as e:
+                logging.error(f" Error in candle close path: {e}")
+
+            elapsed = time.perf_counter() - start
+            self.stats["boundaries"] += 1
+            if elapsed > self.close_budget:
+                self.stats["slow_closes"] += 1
+                logging.warning(f" Candle close path took {elapsed:.3f}s (budget {self.close_budget}s)")
+
+    async def _every(self, name, interval, func, timeout):
+        while True:
+            await asyncio.sleep(interval)
+            await self._job(name, func, (), timeout)
+
+    async def _job(self, name, func, args, timeout):
+        if name in self._running:
+            self.stats["job_skips"] += 1
+            logging.warning(f" Job {name} still running, skipped this run")
+            return
+
+        self._running.add(name)
+        future = self._loop.run_in_executor(self._io, func, *args)
+        future.add_done_callback(lambda done: self._job_done(name, done))
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            #  The thread cannot be interrupted; it keeps the job marked running until it returns
+            self.stats["job_timeouts"] += 1
+            logging.error(f" Job {name} exceeded its {timeout}s timeout")
+        except Exception as e:
+            logging.error(f" Job {name} failed: {e}")
+
+    def _job_done(self, name, future):
+        self._running.discard(name)
+        if not future.cancelled():
+            future.exception()  # Retrieved here too, so a job that outlived its timeout does not warn at exit
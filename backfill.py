@@ -0,0 +1,102 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from broker_client import KITE_RATE_LIMITS, RateLimiter
+
+
+class HistoricalBackfill:
+    """
+    Concurrent kite.historical_data backfill.
+
+    Jobs are (target, instrument_token, interval, from_date, to_date). Up to `workers`
+    fetches run at once, every request first takes a slot from a token bucket sized to
+    Kite's historical-API limit, and each job's candles are handed to
+    write_candles(target, candles) in one batch. Failed requests are retried with
+    backoff. Progress and rows/sec are logged as jobs finish.
+
+    With a CandleStore, jobs are served read-through from the local store and only the
+    missing ranges reach the API (and its rate limit).
+    """
+
+    def __init__(self, kite, write_candles, workers=6, rate_limit=KITE_RATE_LIMITS["historical_data"],
+                 retries=3, backoff=1.0, store=None):
+        self.kite = kite
+        self.write_candles = write_candles
+        self.store = store
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self._limiter = RateLimiter(rate_limit)
+
+    def fetch(self, token, interval, from_date, to_date):
+        """
+        One historical_data request behind the shared rate limiter, retried with backoff.
+        Other historical_data callers go through here too, so all of them share Kite's limit.
+        """
+        for attempt in range(self.retries + 1):
+            self._limiter.acquire()
+            try:
+                return self.kite.historical_data(
+                    instrument_token=token,
+                    from_date=from_date,
+                    to_date=to_date,
+                    interval=interval
+                )
+            except Exception as e:
+                if attempt == self.retries:
+                    raise
+                logging.warning(f" historical_data for token {token} failed ({e}), retry {attempt + 1}/{self.retries}")
+                time.sleep(self.backoff * (2 ** attempt))
+
+    def _run_job(self, job):
+        target, token, interval, from_date, to_date = job
+        if self.store is not None:
+            candles = self.store.read_through(token, interval, from_date, to_date, self.fetch).to_pylist()
+        else:
+            candles = self.fetch(token, interval, from_date, to_date)
+        if not candles:
+            logging.warning(f" No {interval} data for token {token} ({from_date} → {to_date})")
+            return 0
+        self.write_candles(target, candles)
+        return len(candles)
+
+    def run(self, jobs):
+        """
+        Runs every job and blocks until all are done.
+
+        Returns:
+            dict: jobs, failed, rows, elapsed_sec, rows_per_sec.
+        """
+        jobs = list(jobs)
+        start = time.perf_counter()
+        rows = done = failed = 0
+
+        if not jobs:
+            return {"jobs": 0, "failed": 0, "rows": 0, "elapsed_sec": 0.0, "rows_per_sec": 0.0}
+
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(jobs)), thread_name_prefix="backfill") as pool:
+            futures = {pool.submit(self._run_job, job): job for job in jobs}
+            for future in as_completed(futures):
+                target, token, interval = futures[future][:3]
+                done += 1
+                try:
+                    written = future.result()
+                    rows += written
+                    elapsed = time.perf_counter() - start
+                    logging.info(f" Backfill {done}/{len(jobs)}: {target} ({interval}) +{written} rows "
+                                 f"| {rows} rows in {elapsed:.2f}s ({rows / elapsed:.0f} rows/sec)")
+                except Exception as e:
+                    failed += 1
+                    logging.error(f" Backfill {done}/{len(jobs)}: {target} ({interval}, token {token}) failed: {e}")
+
+        elapsed = time.perf_counter() - start
+        report = {
+            "jobs": len(jobs),
+            "failed": failed,
+            "rows": rows,
+            "elapsed_sec": round(elapsed, 3),
+            "rows_per_sec": round(rows / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+        logging.info(f" Backfill finished: {report}")
+        return report
@@ -0,0 +1,348 @@
+import csv
+import datetime
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+#  Broker client factory + a local stand-in for KiteConnect.
+#
+#  The engine only uses this part of the KiteConnect REST client:
+#      profile(), login_url(), generate_session(), set_access_token(),
+#      ltp(*instruments), instruments(exchange), historical_data(token, from, to, interval)
+#  Anything exposing those methods can be plugged in. BROKER_MODE=fake selects
+#  FakeKiteConnect, which serves the same shapes from fixture files or a seeded generator.
+#
+#  Fixture directory layout (every file optional → seeded generator for the rest):
+#      instruments_<EXCHANGE>.csv              Kite instrument dump format
+#      ltp.json                                {"NSE:NIFTY 50": 23512.4, "12345678": 101.5}
+#      historical/<token>_<interval>.csv       date,open,high,low,close,volume
+
+BROKER_MODE = os.environ.get("BROKER_MODE", "kite")  # "kite" | "fake"
+
+IST = datetime.timezone(datetime.timedelta(hours=5, minutes=30))
+
+#  Kite's per-endpoint request limits (requests / second)
+KITE_RATE_LIMITS = {"historical_data": 3, "ltp": 10, "instruments": 10, "profile": 10}
+
+_INTERVAL_MINUTES = {"minute": 1, "3minute": 3, "5minute": 5, "10minute": 10,
+                     "15minute": 15, "30minute": 30, "60minute": 60, "day": 375}
+_WEEKLY_MONTH_CODES = "123456789OND"
+
+
+def create_broker_client(api_key, mode=None, **fake_options):
+    """
+    Returns the REST client selected by `mode` (default: BROKER_MODE env var):
+    KiteConnect for "kite", FakeKiteConnect for "fake".
+    """
+    mode = mode or BROKER_MODE
+    if mode == "fake":
+        fake_options.setdefault("fixture_dir", os.environ.get("FAKE_KITE_FIXTURES"))
+        fake_options.setdefault("latency", float(os.environ.get("FAKE_KITE_LATENCY", "0")))
+        logging.info(f" Using local fake broker client (fixtures={fake_options['fixture_dir']}, "
+                     f"latency={fake_options['latency']}s)")
+        return FakeKiteConnect(api_key=api_key, **fake_options)
+
+    from kiteconnect import KiteConnect
+    return KiteConnect(api_key=api_key)
+
+
+class RateLimiter:
+    """
+    Token bucket per endpoint. acquire() blocks until a request slot is free, or raises
+    when strict (mirroring Kite's HTTP 429 "Too many requests").
+    """
+
+    def __init__(self, rate, strict=False):
+        self.rate = float(rate)
+        self.strict = strict
+        self._tokens = self.rate
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+            if self._tokens < 1:
+                wait = (1 - self._tokens) / self.rate
+                if self.strict:
+                    from kiteconnect.exceptions import NetworkException
+                    raise NetworkException("Too many requests", code=429)
+                time.sleep(wait)
+                self._tokens = 1
+                self._updated = time.monotonic()
+
+            self._tokens -= 1
+
+
+class FakeKiteConnect:
+    """
+    Deterministic offline KiteConnect stand-in.
+
+    The seeded generator lists NIFTY weekly options (CE/PE, strikes every 50 around the
+    spot) for the next `expiries` weekly expiries, prices the index as a random walk over
+    the trading day and options from intrinsic value plus time value, and produces OHLCV
+    history for any token and interval. The same (seed, token, bar) always yields the same
+    candle, so repeated runs and overlapping requests agree.
+
+    Every call sleeps `latency` seconds and goes through the endpoint's rate limiter, and
+    per-endpoint call counts are kept in `calls`.
+    """
+
+    def __init__(self, api_key=None, fixture_dir=None, seed=7, latency=0.0, rate_limits=None,
+                 strict_rate_limits=False, spot=23500.0, strike_step=50, strikes_each_side=40,
+                 expiries=4, expiry_weekday=3, holidays=()):
+        self.api_key = api_key
+        self.access_token = None
+        self.fixture_dir = fixture_dir
+        self.seed = seed
+        self.latency = latency
+        self.spot = spot
+        self.strike_step = strike_step
+        self.strikes_each_side = strikes_each_side
+        self.expiries = expiries
+        self.expiry_weekday = expiry_weekday
+        self.holidays = {datetime.date.fromisoformat(str(day)) for day in holidays}
+
+        limits = dict(KITE_RATE_LIMITS, **(rate_limits or {}))
+        self._limiters = {name: RateLimiter(rate, strict_rate_limits) for name, rate in limits.items()}
+        self.calls = {name: 0 for name in limits}
+        self._instruments = {}  # exchange → rows
+        self._by_token = {}     # instrument_token → row
+        self._ltp_fixture = self._load_json("ltp.json") or {}
+
+    #  Session ---------------------------------------------------------------------------
+    def login_url(self):
+        return "http://localhost/fake-kite/login"
+
+    def generate_session(self, request_token, api_secret=None):
+        self.access_token = "fake-access-token"
+        return {"access_token": self.access_token, "user_name": "Fake User"}
+
+    def set_access_token(self, access_token):
+        self.access_token = access_token
+
+    def profile(self):
+        self._call("profile")
+        return {"user_name": "Fake User", "user_id": "FAKE01", "broker": "FAKE"}
+
+    #  Market data -----------------------------------------------------------------------
+    def instruments(self, exchange=None):
+        self._call("instruments")
+        return list(self._instrument_rows(exchange or "NFO"))
+
+    def ltp(self, *instruments):
+        self._call("ltp")
+        if len(instruments) == 1 and isinstance(instruments[0], (list, tuple)):
+            instruments = instruments[0]
+
+        now = datetime.datetime.now(IST)
+        response = {}
+        for instrument in instruments:
+            key = str(instrument)
+            token = self._token_for(key)
+            price = self._ltp_fixture.get(key)
+            if price is None:
+                price = self._price_at(token, now)
+            response[key] = {"instrument_token": token, "last_price": round(float(price), 2)}
+        return response
+
+    def historical_data(self, instrument_token, from_date, to_date, interval, continuous=False, oi=False):
+        self._call("historical_data")
+        start, end = as_ist_datetime(from_date), as_ist_datetime(to_date)
+
+        fixture = self._load_historical_csv(instrument_token, interval)
+        if fixture is not None:
+            return [candle for candle in fixture if start <= candle["date"] <= end]
+        return self._generate_history(int(instrument_token), start, end, _INTERVAL_MINUTES[interval])
+
+    #  Internals ---------------------------------------------------------------------------
+    def _instrument_rows(self, exchange):
+        if exchange not in self._instruments:
+            rows = self._load_instruments_csv(exchange) or self._generate_instruments(exchange)
+            self._instruments[exchange] = rows
+            self._by_token.update((row["instrument_token"], row) for row in rows)
+        return self._instruments[exchange]
+
+    def _call(self, endpoint):
+        limiter = self._limiters.get(endpoint)
+        if limiter is not None:
+            limiter.acquire()
+        if self.latency:
+            time.sleep(self.latency)
+        self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+
+    def _fixture_path(self, *parts):
+        if not self.fixture_dir:
+            return None
+        path = os.path.join(self.fixture_dir, *parts)
+        return path if os.path.exists(path) else None
+
+    def _load_json(self, name):
+        path = self._fixture_path(name)
+        if path is None:
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def _load_instruments_csv(self, exchange):
+        path = self._fixture_path(f"instruments_{exchange}.csv")
+        if path is None:
+            return None
+
+        rows = []
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                row["instrument_token"] = int(row["instrument_token"])
+                row["exchange_token"] = int(row.get("exchange_token") or 0)
+                row["strike"] = float(row.get("strike") or 0)
+                row["last_price"] = float(row.get("last_price") or 0)
+                row["tick_size"] = float(row.get("tick_size") or 0.05)
+                row["lot_size"] = int(row.get("lot_size") or 0)
+                row["expiry"] = datetime.date.fromisoformat(row["expiry"]) if row.get("expiry") else None
+                rows.append(row)
+        return rows
+
+    def _load_historical_csv(self, instrument_token, interval):
+        path = self._fixture_path("historical", f"{instrument_token}_{interval}.csv")
+        if path is None:
+            return None
+
+        candles = []
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                candles.append({
+                    "date": as_ist_datetime(row["date"]),
+                    "open": float(row["open"]),
+                    "high": float(row["high"]),
+                    "low": float(row["low"]),
+                    "close": float(row["close"]),
+                    "volume": int(float(row["volume"])),
+                })
+        return candles
+
+    def _expiry_dates(self):
+        day = datetime.date.today()
+        dates = []
+        while len(dates) < self.expiries:
+            if day.weekday() == self.expiry_weekday:
+                dates.append(day)
+            day += datetime.timedelta(days=1)
+        return dates
+
+    def _generate_instruments(self, exchange):
+        if exchange != "NFO":
+            return [{"instrument_token": 256265, "exchange_token": 1001, "tradingsymbol": "NIFTY 50",
+                     "name": "NIFTY 50", "last_price": 0.0, "expiry": None, "strike": 0.0,
+                     "tick_size": 0.0, "lot_size": 0, "instrument_type": "EQ", "segment": "INDICES",
+                     "exchange": exchange}]
+
+        atm = round(self.spot / self.strike_step) * self.strike_step
+        strikes = [atm + i * self.strike_step for i in range(-self.strikes_each_side, self.strikes_each_side + 1)]
+        expiry_dates = self._expiry_dates()
+
+        rows = []
+        for e, expiry in enumerate(expiry_dates):
+            monthly = (expiry + datetime.timedelta(days=7)).month != expiry.month
+            if monthly:
+                prefix = f"NIFTY{expiry:%y}{expiry:%b}".upper()
+            else:
+                prefix = f"NIFTY{expiry:%y}{_WEEKLY_MONTH_CODES[expiry.month - 1]}{expiry:%d}"
+
+            for s, strike in enumerate(strikes):
+                for t, option_type in enumerate(("CE", "PE")):
+                    token = 10_000_000 + e * 100_000 + s * 10 + t
+                    rows.append({
+                        "instrument_token": token, "exchange_token": token // 256,
+                        "tradingsymbol": f"{prefix}{strike}{option_type}", "name": "NIFTY",
+                        "last_price": 0.0, "expiry": expiry, "strike": float(strike), "tick_size": 0.05,
+                        "lot_size": 75, "instrument_type": option_type, "segment": "NFO-OPT", "exchange": "NFO",
+                    })
+        return rows
+
+    def _token_for(self, key):
+        if key.isdigit():
+            return int(key)
+        if key == "NSE:NIFTY 50":
+            return 256265
+        exchange, _, symbol = key.partition(":")
+        for row in self._instrument_rows(exchange or "NFO"):
+            if row["tradingsymbol"] == symbol:
+                return row["instrument_token"]
+        return 0
+
+    def _option(self, token):
+        self._instrument_rows("NFO")
+        return self._by_token.get(token)
+
+    def _rng(self, *key):
+        digest = hashlib.blake2b(repr((self.seed,) + key).encode(), digest_size=8).digest()
+        return np.random.default_rng(int.from_bytes(digest, "little"))
+
+    def _index_at(self, when):
+        #  Random walk of the index over the day, one step per minute from 09:15
+        day = when.date()
+        steps = self._rng("index", day.isoformat()).normal(0, 0.0006, 376)
+        path = self.spot * np.exp(np.cumsum(steps))
+        minute = (when.hour * 60 + when.minute) - (9 * 60 + 15)
+        return float(path[min(max(minute, 0), 375)])
+
+    def _price_at(self, token, when):
+        index = self._index_at(when)
+        if token == 256265:
+            return index
+
+        option = self._option(token)
+        if option is None:
+            return 100.0
+        days = max((option["expiry"] - when.date()).days, 0) + 1
+        intrinsic = max(index - option["strike"], 0) if option["instrument_type"] == "CE" else max(option["strike"] - index, 0)
+        time_value = 0.004 * index * np.sqrt(days / 7.0) * np.exp(-abs(index - option["strike"]) / (0.02 * index))
+        return max(intrinsic + time_value, 0.05)
+
+    def _generate_history(self, token, start, end, minutes):
+        candles = []
+        day = start.date()
+        while day <= end.date():
+            if day.weekday() < 5 and day not in self.holidays:
+                session_open = datetime.datetime.combine(day, datetime.time(9, 15), IST)
+                session_close = datetime.datetime.combine(day, datetime.time(15, 30), IST)
+                bar = session_open
+                while bar < session_close:
+                    if start <= bar <= end:
+                        candles.append(self._generate_bar(token, bar, min(minutes, int((session_close - bar).total_seconds() // 60))))
+                    bar += datetime.timedelta(minutes=minutes)
+            day += datetime.timedelta(days=1)
+        return candles
+
+    def _generate_bar(self, token, bar_start, minutes):
+        rng = self._rng("bar", token, bar_start.isoformat(), minutes)
+        open_ = float(self._price_at(token, bar_start))
+        close = float(self._price_at(token, bar_start + datetime.timedelta(minutes=minutes)))
+        spread = abs(float(rng.normal(0, 0.002))) * max(open_, close)
+        return {
+            "date": bar_start,
+            "open": round(open_, 2),
+            "high": round(max(open_, close) + spread, 2),
+            "low": round(max(min(open_, close) - spread, 0.05), 2),
+            "close": round(close, 2),
+            "volume": int(rng.integers(10, 400)) * 75 * minutes,
+        }
+
+
+def as_ist_datetime(value):
+    """
+    Kite accepts datetimes or "YYYY-MM-DD[ HH:MM[:SS]]" strings; naive values are IST.
+    """
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value.strip())
+    elif isinstance(value, datetime.date) and not isinstance(value, datetime.datetime):
+        value = datetime.datetime.combine(value, datetime.time())
+    return value if value.tzinfo else value.replace(tzinfo=IST)
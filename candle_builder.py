@@ -0,0 +1,257 @@
+import datetime
+import threading
+from collections import deque
+
+
+def minute_bucket(ts):
+    """
+    Integer minute index of a datetime (minutes since 0001-01-01 00:00, naive/exchange time).
+    Days are 1440 minutes, so bucket // tf * tf lands on clock-aligned tf-minute boundaries.
+    """
+    return ts.toordinal() * 1440 + ts.hour * 60 + ts.minute
+
+
+def bucket_to_datetime(bucket):
+    """
+    Inverse of minute_bucket().
+    """
+    return datetime.datetime.fromordinal(bucket // 1440) + datetime.timedelta(minutes=bucket % 1440)
+
+
+class CandleAccumulator:
+    """
+    Running OHLCV of one (token, timeframe) bar, updated in place per tick or per merged bar.
+    """
+    __slots__ = ("bucket", "open", "high", "low", "close", "volume", "ticks")
+
+    def __init__(self, bucket, price, volume=0):
+        self.bucket = bucket
+        self.open = self.high = self.low = self.close = price
+        self.volume = volume
+        self.ticks = 1
+
+    def update(self, price, volume=0):
+        if price > self.high:
+            self.high = price
+        elif price < self.low:
+            self.low = price
+        self.close = price
+        self.volume += volume
+        self.ticks += 1
+
+    @classmethod
+    def from_bar(cls, bucket, bar):
+        """
+        Opens a higher-timeframe bar from its first finished lower-timeframe bar.
+        """
+        higher = cls(bucket, bar.open, bar.volume)
+        higher.high, higher.low, higher.close = bar.high, bar.low, bar.close
+        higher.ticks = bar.ticks
+        return higher
+
+    def merge(self, bar):
+        """
+        Folds a finished lower-timeframe bar into this bar.
+        """
+        if bar.high > self.high:
+            self.high = bar.high
+        if bar.low < self.low:
+            self.low = bar.low
+        self.close = bar.close
+        self.volume += bar.volume
+        self.ticks += bar.ticks
+
+    def to_entry(self):
+        return {
+            "timestamp": bucket_to_datetime(self.bucket).strftime("%Y-%m-%d %H:%M"),
+            "open": self.open,
+            "high": self.high,
+            "low": self.low,
+            "close": self.close,
+            "volume": self.volume,
+        }
+
+
+class CandleBuilder:
+    """
+    Builds candles for several timeframes from one tick stream.
+
+    Only the base (smallest) timeframe is built from ticks: add_tick() runs on the KiteTicker
+    thread and costs O(1). Every finished base bar is then merged into the open bar of each
+    higher timeframe (cascade), so a higher timeframe costs a few bar merges per boundary
+    instead of another pass over the ticks. Higher timeframes must be multiples of the base.
+
+    Bars are anchored at the session open (09:15 by default) and the last bar of the day is
+    cut at the session close, so 60-minute bars run 09:15-10:15, ..., 15:15-15:30 like the
+    exchange's historical candles. Ticks outside the session (pre-open, post-close) only
+    advance the volume baseline, so no bar starts at or after the close.
+
+    A bar is moved to its timeframe's completed queue when the next bucket starts or when
+    roll() sees the clock pass the bar's end. The processing thread takes finished bars with
+    drain(). A single lock guards the hand-off, so memory is bounded by the number of open
+    bars, not by tick count.
+
+    Bar volume is the sum of volume_traded deltas between consecutive ticks of a token
+    (the exchange's cumulative day volume). The first tick of a token or day only sets the
+    baseline, so that bar's volume is a lower bound until it is reconciled.
+
+    set_active() restricts bar building to the tokens that are actually processed: ticks of
+    other subscribed tokens only advance their volume baseline (one tuple per token), so
+    memory stays flat however many strikes are subscribed. buffer_stats() is the gauge.
+    """
+
+    def __init__(self, timeframes=(1, 5), session_open=(9, 15), session_close=(15, 30)):
+        self.timeframes = tuple(sorted(timeframes))
+        self.base = self.timeframes[0]
+        if any(tf % self.base for tf in self.timeframes):
+            raise ValueError(f"Timeframes {self.timeframes} must be multiples of {self.base}")
+
+        self.session_open = session_open[0] * 60 + session_open[1]     # minute of day
+        self.session_close = session_close[0] * 60 + session_close[1]  # minute of day
+        self._open = {tf: {} for tf in self.timeframes}          # tf → {token: CandleAccumulator}
+        self._completed = {tf: deque() for tf in self.timeframes}  # tf → deque([(token, entry), ...])
+        self._closed = {}                                         # token → last handed-off base bucket
+        self._last_volume = {}                                    # token → (day ordinal, cumulative volume_traded)
+        self._active = None                                       # tokens bars are built for (None → every token)
+        self._lock = threading.Lock()
+        self.late_ticks = 0
+        self.ignored_ticks = 0
+        self.off_session_ticks = 0
+
+    def bucket_of(self, minute, tf):
+        """
+        Start minute of the session-anchored tf-minute bar containing `minute`.
+        """
+        return minute - (minute - self.session_open) % tf
+
+    def bar_end(self, bucket, tf):
+        """
+        End minute of a bar, cut at the session close.
+        """
+        close = bucket - bucket % 1440 + self.session_close
+        return min(bucket + tf, close) if bucket < close else bucket + tf
+
+    def in_session(self, minute):
+        """
+        True for minutes in [session open, session close) of their day (also over NumPy arrays).
+        """
+        minute_of_day = minute % 1440
+        return (minute_of_day >= self.session_open) & (minute_of_day < self.session_close)
+
+    def add_tick(self, token, price, ts, volume_traded=None):
+        """
+        Folds one tick into the open base-timeframe bar of its token.
+        volume_traded is the tick's cumulative day volume (MODE_FULL / MODE_QUOTE ticks).
+        """
+        minute = minute_bucket(ts)
+        bucket = self.bucket_of(minute, self.base)
+        with self._lock:
+            volume = self._volume_delta(token, minute // 1440, volume_traded)
+            if self._active is not None and token not in self._active:
+                self.ignored_ticks += 1
+                return
+            if not self.in_session(minute):
+                self.off_session_ticks += 1
+                return
+
+            bars = self._open[self.base]
+            bar = bars.get(token)
+
+            if bar is not None and bar.bucket == bucket:
+                bar.update(price, volume)
+            elif bucket <= self._closed.get(token, -1) or (bar is not None and bucket < bar.bucket):
+                #  Tick for a bar that was already handed off
+                self.late_ticks += 1
+            else:
+                if bar is not None:
+                    self._hand_off(self.base, token, bar)
+                bars[token] = CandleAccumulator(bucket, price, volume)
+
+    def roll(self, now):
+        """
+        Completes every open bar whose interval ended at or before `now`
+        (base first, so its last bar is merged before the higher timeframes close).
+        """
+        minute = minute_bucket(now)
+        with self._lock:
+            for tf in self.timeframes:
+                bars = self._open[tf]
+                for token in [t for t, bar in bars.items() if self.bar_end(bar.bucket, tf) <= minute]:
+                    self._hand_off(tf, token, bars.pop(token))
+
+    def _volume_delta(self, token, day, volume_traded):
+        # Caller holds self._lock
+        if volume_traded is None:
+            return 0
+
+        last = self._last_volume.get(token)
+        if last is None or last[0] != day:
+            #  New token or new session → baseline only
+            self._last_volume[token] = (day, volume_traded)
+            return 0
+        if volume_traded < last[1]:
+            #  Out-of-order tick → counted by the newer tick already
+            return 0
+
+        self._last_volume[token] = (day, volume_traded)
+        return volume_traded - last[1]
+
+    def _hand_off(self, tf, token, bar):
+        # Caller holds self._lock
+        self._completed[tf].append((token, bar.to_entry()))
+        if tf != self.base:
+            return
+
+        #  Cascade the finished base bar into every higher timeframe
+        #  (base bars start inside the session, so their higher buckets do too)
+        self._closed[token] = bar.bucket
+        for higher in self.timeframes[1:]:
+            bucket = self.bucket_of(bar.bucket, higher)
+            bars = self._open[higher]
+            open_bar = bars.get(token)
+
+            if open_bar is not None and open_bar.bucket == bucket:
+                open_bar.merge(bar)
+            else:
+                if open_bar is not None:
+                    self._completed[higher].append((token, open_bar.to_entry()))
+                bars[token] = CandleAccumulator.from_bar(bucket, bar)
+
+    def drain(self, timeframe):
+        """
+        Returns and clears the completed bars of a timeframe as [(token, entry), ...] in close order.
+        """
+        with self._lock:
+            completed = self._completed[timeframe]
+            bars = list(completed)
+            completed.clear()
+        return bars
+
+    def set_active(self, tokens):
+        """
+        Builds bars only for `tokens` from now on and evicts the open bars of every other token.
+        """
+        with self._lock:
+            self._active = set(tokens)
+            for tf in self.timeframes:
+                bars = self._open[tf]
+                for token in [t for t in bars if t not in self._active]:
+                    del bars[token]
+            for token in [t for t in self._closed if t not in self._active]:
+                del self._closed[token]
+
+    def buffer_stats(self):
+        """
+        Gauge of what the builder holds: open and completed (undrained) bars, the ticks folded
+        into each token's open base bar, and the late / ignored / off-session tick counters.
+        """
+        with self._lock:
+            return {
+                "active_tokens": len(self._active) if self._active is not None else len(self._open[self.base]),
+                "open_bars": sum(len(bars) for bars in self._open.values()),
+                "completed_bars": sum(len(completed) for completed in self._completed.values()),
+                "ticks_by_token": {token: bar.ticks for token, bar in self._open[self.base].items()},
+                "late_ticks": self.late_ticks,
+                "ignored_ticks": self.ignored_ticks,
+                "off_session_ticks": self.off_session_ticks,
+            }
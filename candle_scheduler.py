@@ -0,0 +1,115 @@
+import datetime
+import logging
+import threading
+
+from candle_builder import minute_bucket, bucket_to_datetime
+
+
+class CandleCloseScheduler:
+    """
+    Sleeps until the next bar boundary and then fires one callback for every timeframe
+    that closes there, instead of polling the clock every second.
+
+    Boundaries are kept on exchange time: observe() is fed exchange timestamps from the
+    tick feed and tracks the offset between the exchange clock and the local clock, so the
+    local sleep ends at boundary + grace seconds *exchange* time. The grace watermark leaves
+    room for the last ticks of the bar to arrive. If a callback overruns one or more
+    boundaries, the next firing covers every timeframe that closed in between.
+
+    Timeframes are anchored at the session open and also close at the session close,
+    matching CandleBuilder. Boundaries where no bar closes (pre-open, post-close and, on the
+    live clock, weekends) are skipped: on_boundary is not called for them.
+    """
+
+    def __init__(self, on_boundary, timeframes=(1, 5), grace=2.0, session_open=(9, 15), session_close=(15, 30)):
+        self.on_boundary = on_boundary          # on_boundary(boundary datetime, [closing timeframes])
+        self.timeframes = tuple(timeframes)
+        self.session_open = session_open[0] * 60 + session_open[1]     # minute of day
+        self.session_close = session_close[0] * 60 + session_close[1]  # minute of day
+        self.grace = datetime.timedelta(seconds=grace)
+        self._offset = datetime.timedelta(0)    # exchange time - local time
+        self._last_fired = None                  # last boundary bucket handled
+        self._stop = threading.Event()
+
+    def observe(self, exchange_time):
+        """
+        Records the exchange timestamp of a freshly received tick.
+        """
+        if exchange_time is not None:
+            self._offset = exchange_time - datetime.datetime.now()
+
+    def exchange_now(self):
+        return datetime.datetime.now() + self._offset
+
+    def _closing_timeframes(self, after_bucket, boundary_bucket):
+        # Timeframes with a bar end in (after_bucket, boundary_bucket]; bars only end inside the session
+        day = boundary_bucket - boundary_bucket % 1440
+        session_close = day + self.session_close
+        crossed_close = after_bucket < session_close <= boundary_bucket
+        boundary_bucket = min(boundary_bucket, session_close)
+        after_bucket = max(after_bucket, day + self.session_open)
+        if boundary_bucket <= after_bucket:
+            return []
+        return [tf for tf in self.timeframes
+                if crossed_close
+                or (boundary_bucket - self.session_open) // tf > (after_bucket - self.session_open) // tf]
+
+    def advance_to(self, exchange_time):
+        """
+        Simulated clock (replay / benchmarks): fires, one by one and without sleeping, every
+        boundary whose grace period has passed by `exchange_time`. Returns the results of
+        the on_boundary calls.
+        """
+        results = []
+        if self._last_fired is None:
+            self._last_fired = minute_bucket(exchange_time)
+
+        while bucket_to_datetime(self._last_fired + 1) + self.grace <= exchange_time:
+            boundary_bucket = self._last_fired + 1
+            closing = self._closing_timeframes(self._last_fired, boundary_bucket)
+            self._last_fired = boundary_bucket
+            if closing:
+                results.append(self.on_boundary(bucket_to_datetime(boundary_bucket), closing))
+        return results
+
+    def stop(self):
+        self._stop.set()
+
+    def seconds_until_due(self):
+        """
+        Local seconds until the next boundary + grace (exchange time); <= 0 when one is due.
+        """
+        if self._last_fired is None:
+            self._last_fired = minute_bucket(self.exchange_now())
+
+        wake_at = bucket_to_datetime(self._last_fired + 1) + self.grace
+        return (wake_at - self.exchange_now()).total_seconds()
+
+    def fire_due(self):
+        """
+        Fires on_boundary once for every boundary that has passed (more than one timeframe
+        set only after an overrun) and returns its result; None when no bar closed there.
+        """
+        boundary_bucket = minute_bucket(self.exchange_now() - self.grace)
+        closing = self._closing_timeframes(self._last_fired, boundary_bucket)
+        self._last_fired = boundary_bucket
+
+        boundary = bucket_to_datetime(boundary_bucket)
+        if not closing or boundary.weekday() >= 5:
+            return None  # Outside the trading session → no roll, no contract switching, no LTP calls
+        return self.on_boundary(boundary, closing)
+
+    def run_forever(self):
+        """
+        Blocks the calling thread, firing on_boundary at every bar close until stop().
+        """
+        while not self._stop.is_set():
+            delay = self.seconds_until_due()
+            if delay > 0:
+                self._stop.wait(delay)
+                continue  # Re-check: the exchange clock offset may have moved while sleeping
+
+            try:
+                self.fire_due()
+            except Exception as e:
+                logging.error(f" Error in candle close callback: {e}")
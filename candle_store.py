@@ -0,0 +1,197 @@
+import datetime
+import logging
+import os
+import tempfile
+import threading
+
+from broker_client import IST, as_ist_datetime
+
+#  pyarrow is optional: without it the engine simply calls historical_data directly.
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+SESSION_OPEN = datetime.time(9, 15)
+SESSION_CLOSE = datetime.time(15, 30)
+
+
+class CandleStore:
+    """
+    Local Parquet warehouse of kite.historical_data candles, partitioned as
+
+        <root>/token=<instrument_token>/interval=<interval>/day=<YYYY-MM-DD>/candles.parquet
+
+    read_through() serves a request from disk and asks `fetch` only for the days (or, for
+    today, the tail of the day) that are not stored yet. Past days are stored once and
+    never refetched; trading days without data are stored empty so holidays are not
+    requested again. Files are read memory-mapped and merged as Arrow tables, so rows are
+    only converted to Python where the caller needs them. The layout is a hive-partitioned
+    dataset, so it doubles as a research archive across expiries (see dataset()).
+
+    Writes of one partition are serialised by a per-partition lock and go through a unique
+    hidden temporary file (skipped by dataset()), so concurrent jobs touching the same day
+    never clobber each other.
+    """
+
+    def __init__(self, root="candle_store"):
+        if not PYARROW_AVAILABLE:
+            raise ImportError("CandleStore requires pyarrow")
+
+        self.root = root
+        self.schema = pa.schema([
+            ("date", pa.timestamp("us", tz="+05:30")),
+            ("open", pa.float64()),
+            ("high", pa.float64()),
+            ("low", pa.float64()),
+            ("close", pa.float64()),
+            ("volume", pa.int64()),
+        ])
+        self._locks = {}  # partition path → threading.Lock
+        self._locks_lock = threading.Lock()
+
+    def _path(self, token, interval, day):
+        return os.path.join(self.root, f"token={token}", f"interval={interval}", f"day={day.isoformat()}", "candles.parquet")
+
+    def _lock(self, path):
+        with self._locks_lock:
+            lock = self._locks.get(path)
+            if lock is None:
+                lock = self._locks[path] = threading.Lock()
+            return lock
+
+    def read_day(self, token, interval, day):
+        """
+        Memory-mapped Arrow table of one stored partition, or None when it is not stored.
+        """
+        path = self._path(token, interval, day)
+        if not os.path.exists(path):
+            return None
+        return pq.read_table(path, memory_map=True)
+
+    def _coverage(self, table):
+        # (complete, covered_to) recorded in the partition's metadata
+        metadata = table.schema.metadata or {}
+        covered_to = metadata.get(b"covered_to")
+        return metadata.get(b"complete") == b"1", as_ist_datetime(covered_to.decode()) if covered_to else None
+
+    def _to_table(self, candles):
+        # kite.historical_data candle dicts → table in the store's schema
+        return pa.Table.from_pylist(
+            [{column: candle[column] for column in self.schema.names} for candle in candles],
+            schema=self.schema
+        )
+
+    def _merge(self, fetched, table):
+        # Fetched candles replace stored ones of the same date; sorted by date, one row per date
+        merged = fetched if table is None else pa.concat_tables([fetched, table.replace_schema_metadata(None)])
+        merged = merged.take(pc.sort_indices(merged, sort_keys=[("date", "ascending")])).combine_chunks()
+        if merged.num_rows < 2:
+            return merged
+
+        dates = merged["date"]
+        first_of_date = pc.not_equal(dates.slice(1), dates.slice(0, merged.num_rows - 1)).combine_chunks()
+        return merged.filter(pa.concat_arrays([pa.array([True]), first_of_date]))
+
+    def write_day(self, token, interval, day, candles, complete, covered_to=None):
+        """
+        Stores one trading day of candles, an Arrow table in the store's schema or candle
+        dicts (replacing the partition atomically).
+        """
+        path = self._path(token, interval, day)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        table = candles if isinstance(candles, pa.Table) else self._to_table(candles)
+        metadata = {b"complete": b"1" if complete else b"0"}
+        if covered_to is not None:
+            metadata[b"covered_to"] = covered_to.isoformat().encode()
+        table = table.replace_schema_metadata(metadata)
+
+        with self._lock(path):
+            fd, tmp_path = tempfile.mkstemp(prefix=".candles-", suffix=".tmp", dir=os.path.dirname(path))
+            os.close(fd)
+            try:
+                pq.write_table(table, tmp_path)
+                os.replace(tmp_path, path)
+            except Exception:
+                os.remove(tmp_path)
+                raise
+
+    def read_through(self, token, interval, from_date, to_date, fetch):
+        """
+        Candles of a token and interval with from_date <= date <= to_date as an Arrow table
+        in the store's schema (to_pylist() gives the kite.historical_data shape). Missing
+        ranges are requested with fetch(token, interval, from, to) (consecutive missing days
+        in one request) and stored before answering.
+        """
+        start, end = as_ist_datetime(from_date), as_ist_datetime(to_date)
+        today = datetime.datetime.now(IST).date()
+
+        days = []
+        day = start.date()
+        while day <= end.date():
+            if day.weekday() < 5:
+                days.append(day)
+            day += datetime.timedelta(days=1)
+
+        #  Work out what is missing: whole past days, or the tail of today
+        stored, missing = {}, []
+        for day in days:
+            table = self.read_day(token, interval, day)
+            complete, covered_to = self._coverage(table) if table is not None else (False, None)
+
+            if table is not None and (complete or (day == today and covered_to and covered_to >= end)):
+                stored[day] = table
+                continue
+
+            window_start = covered_to if (table is not None and day == today and covered_to) else \
+                datetime.datetime.combine(day, SESSION_OPEN, IST)
+            window_end = datetime.datetime.combine(day, SESSION_CLOSE, IST) if day < today else end
+            missing.append((day, window_start, window_end, table))
+
+        #  Fetch consecutive missing days with one request each
+        groups = []
+        for entry in missing:
+            if groups and days.index(entry[0]) == days.index(groups[-1][-1][0]) + 1:
+                groups[-1].append(entry)
+            else:
+                groups.append([entry])
+
+        for group in groups:
+            candles = fetch(token, interval, group[0][1], group[-1][2]) or []
+            fetched = self._to_table([dict(candle, date=as_ist_datetime(candle["date"])) for candle in candles])
+
+            for day, _, window_end, table in group:
+                day_start = datetime.datetime.combine(day, datetime.time(0), IST)
+                in_day = pc.and_(pc.greater_equal(fetched["date"], self._timestamp(day_start)),
+                                 pc.less(fetched["date"], self._timestamp(day_start + datetime.timedelta(days=1))))
+
+                merged = self._merge(fetched.filter(in_day), table)
+                self.write_day(token, interval, day, merged, complete=day < today,
+                               covered_to=window_end if day == today else None)
+                stored[day] = merged
+
+        if missing:
+            logging.info(f" Candle store: token {token} {interval} → {len(days) - len(missing)} days from disk, "
+                         f"{len(missing)} fetched in {len(groups)} requests")
+
+        tables = [stored[day].replace_schema_metadata(None) for day in days if stored.get(day) is not None]
+        if not tables:
+            return self.schema.empty_table()
+
+        table = pa.concat_tables(tables)
+        return table.filter(pc.and_(pc.greater_equal(table["date"], self._timestamp(start)),
+                                    pc.less_equal(table["date"], self._timestamp(end))))
+
+    def _timestamp(self, value):
+        return pa.scalar(value, type=self.schema.field("date").type)
+
+    def dataset(self):
+        """
+        The whole store as one hive-partitioned pyarrow dataset (token / interval / day).
+        """
+        import pyarrow.dataset as ds
+        return ds.dataset(self.root, format="parquet", partitioning="hive")
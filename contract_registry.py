@@ -0,0 +1,104 @@
+import datetime
+import logging
+import threading
+
+
+class ContractRegistry:
+    """
+    In-memory record of the current nearest OTM CE / PE contracts.
+
+    update() takes the nearest OTM candidates for a spot price and switches a side only
+    when spot has left the current contract's strike band by more than `hysteresis` points,
+    so the contract does not flip back and forth while spot sits on a strike boundary.
+    A new expiry always switches.
+
+    Contracts are dicts with at least "symbol", "token", "strike" and "expiry"; tokens()
+    is a lock-protected read. Every change is handed to persist(snapshot) on a background
+    thread (write-behind); when several changes queue up only the latest snapshot is written.
+    """
+
+    SIDES = ("CE", "PE")
+
+    def __init__(self, strike_step=50, hysteresis=10.0, persist=None):
+        self.strike_step = strike_step
+        self.hysteresis = hysteresis
+        self.persist = persist
+        self._current = {}            # side → contract
+        self._spot = None
+        self._updated_at = None
+        self._lock = threading.Lock()
+
+        self._pending = None          # latest snapshot not yet persisted
+        self._pending_ready = threading.Condition(threading.Lock())
+        self._writer = None
+        if persist is not None:
+            self._writer = threading.Thread(target=self._write_behind, name="contract-registry-writer", daemon=True)
+            self._writer.start()
+
+    def _holds(self, side, strike, spot):
+        # CE → nearest strike at or above spot, PE → nearest strike at or below spot, each band widened by the hysteresis
+        if side == "CE":
+            return strike - self.strike_step - self.hysteresis < spot <= strike + self.hysteresis
+        return strike - self.hysteresis <= spot < strike + self.strike_step + self.hysteresis
+
+    def update(self, spot, candidates):
+        """
+        Applies the nearest OTM candidates ({"CE": contract, "PE": contract}) for `spot`.
+        Returns the sides that switched contract.
+        """
+        switched = []
+        with self._lock:
+            for side in self.SIDES:
+                candidate = candidates.get(side)
+                current = self._current.get(side)
+                if candidate is None or (current is not None and current["token"] == candidate["token"]):
+                    continue
+                if current is not None and current["expiry"] == candidate["expiry"] and \
+                        self._holds(side, current["strike"], spot):
+                    continue
+
+                self._current[side] = dict(candidate)
+                switched.append(side)
+
+            self._spot = spot
+            if switched:
+                self._updated_at = datetime.datetime.now()
+                snapshot = self._snapshot()
+
+        if switched:
+            changes = ", ".join(f"{side} → {snapshot[side]['symbol']}" for side in switched)
+            logging.info(f" Contract registry: {changes} (spot {spot})")
+            self._queue_persist(snapshot)
+        return switched
+
+    def tokens(self):
+        """
+        (CE token, PE token) of the current contracts.
+        """
+        with self._lock:
+            return tuple(self._current[side]["token"] if side in self._current else None for side in self.SIDES)
+
+    def _snapshot(self):
+        # Caller holds self._lock
+        snapshot = {side: dict(contract) for side, contract in self._current.items()}
+        snapshot["spot"] = self._spot
+        snapshot["updated_at"] = self._updated_at
+        return snapshot
+
+    def _queue_persist(self, snapshot):
+        if self._writer is None:
+            return
+        with self._pending_ready:
+            self._pending = snapshot
+            self._pending_ready.notify()
+
+    def _write_behind(self):
+        while True:
+            with self._pending_ready:
+                while self._pending is None:
+                    self._pending_ready.wait()
+                snapshot, self._pending = self._pending, None
+            try:
+                self.persist(snapshot)
+            except Exception as e:
+                logging.error(f" Contract registry write-behind failed: {e}")
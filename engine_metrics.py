@@ -0,0 +1,247 @@
+import bisect
+import functools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+#  ENGINE_METRICS=0 turns every timer / counter into a no-op
+METRICS_ENABLED = os.environ.get("ENGINE_METRICS", "1") != "0"
+
+#  Latency buckets in seconds (upper bounds, Prometheus "le"), 100 µs … 30 s
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    """
+    Fixed-bucket latency histogram: O(log buckets) observe, quantiles estimated from the buckets.
+    """
+    __slots__ = ("counts", "count", "sum")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q):
+        """
+        Linear interpolation inside the bucket holding the q-th observation.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = LATENCY_BUCKETS[i - 1] if i > 0 else 0.0
+                upper = LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else LATENCY_BUCKETS[-1]
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return LATENCY_BUCKETS[-1]
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class EngineMetrics:
+    """
+    Per-stage timers and counters of the live engine, labelled by stage and (optionally) token.
+
+    timer() / timed() record a latency histogram per (stage, labels), count() adds to a counter.
+    render() produces Prometheus text exposition: histograms with cumulative buckets plus
+    p50 / p95 / p99 estimates, and counters. The text can be served on a local HTTP endpoint
+    (serve()) or written to a file periodically (write_file()). When disabled every call
+    returns immediately.
+    """
+
+    def __init__(self, enabled=METRICS_ENABLED, prefix="engine"):
+        self.enabled = enabled
+        self.prefix = prefix
+        self._histograms = {}  # (stage, labels) → Histogram
+        self._counters = {}    # (name, labels) → value
+        self._lock = threading.Lock()
+        self._server = None
+
+    def observe(self, stage, seconds, **labels):
+        if not self.enabled:
+            return
+        key = (stage, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def count(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def timer(self, stage, **labels):
+        """
+        Context manager timing one execution of a stage.
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return self._timer(stage, labels)
+
+    @contextmanager
+    def _timer(self, stage, labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, **labels)
+
+    def timed(self, stage, token_of=None):
+        """
+        Decorator timing every call of a function as `stage`; token_of(*args, **kwargs)
+        returns the token label of a call.
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                labels = {"token": token_of(*args, **kwargs)} if token_of else {}
+                with self._timer(stage, labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def instrument_methods(self, client, methods, stage="rest_call"):
+        """
+        Wraps the given methods of a client instance (e.g. kite.ltp) so every call is timed
+        and counted with a method label.
+        """
+        for name in methods:
+            method = getattr(client, name, None)
+            if method is None:
+                continue
+
+            def wrapper(*args, _method=method, _name=name, **kwargs):
+                self.count("rest_calls_total", method=_name)
+                with self.timer(stage, method=_name):
+                    return _method(*args, **kwargs)
+
+            setattr(client, name, functools.wraps(method)(wrapper))
+        return client
+
+    def snapshot(self):
+        """
+        {stage: {labels: {"count", "sum", "p50", "p95", "p99"}}} and counters, for logging.
+        """
+        with self._lock:
+            histograms = {
+                key: (histogram.count, histogram.sum, [histogram.quantile(q) for q in QUANTILES])
+                for key, histogram in self._histograms.items()
+            }
+            counters = dict(self._counters)
+
+        stages = {}
+        for (stage, labels), (count, total, quantiles) in histograms.items():
+            stages.setdefault(stage, {})[labels] = {
+                "count": count, "sum": round(total, 6),
+                **{f"p{int(q * 100)}": round(value, 6) for q, value in zip(QUANTILES, quantiles)}
+            }
+        return {"stages": stages, "counters": counters}
+
+    def render(self):
+        """
+        Prometheus text exposition of every histogram and counter.
+        """
+        with self._lock:
+            histograms = {key: (list(h.counts), h.count, h.sum, [h.quantile(q) for q in QUANTILES])
+                          for key, h in sorted(self._histograms.items())}
+            counters = sorted(self._counters.items())
+
+        name = f"{self.prefix}_stage_seconds"
+        lines = [f"# TYPE {name} histogram"]
+        for (stage, labels), (counts, count, total, _) in histograms.items():
+            base = _labels((("stage", stage),) + labels)
+            cumulative = 0
+            for bound, bucket_count in zip(LATENCY_BUCKETS + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{name}_bucket{{{base},le=\"{le}\"}} {cumulative}")
+            lines.append(f"{name}_sum{{{base}}} {total:.6f}")
+            lines.append(f"{name}_count{{{base}}} {count}")
+
+        lines.append(f"# TYPE {name}_quantile gauge")
+        for (stage, labels), (_, _, _, quantiles) in histograms.items():
+            base = _labels((("stage", stage),) + labels)
+            for q, value in zip(QUANTILES, quantiles):
+                lines.append(f"{name}_quantile{{{base},quantile=\"{q}\"}} {value:.6f}")
+
+        typed = set()
+        for (counter, labels), value in counters:
+            metric = f"{self.prefix}_{counter}"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            lines.append(f"{metric}{{{_labels(labels)}}} {value}" if labels else f"{metric} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    def write_file(self, path):
+        """
+        Atomically replaces `path` with the current exposition (for node_exporter's textfile collector).
+        """
+        if not self.enabled:
+            return
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+    def serve(self, port, host="127.0.0.1"):
+        """
+        Serves render() at http://host:port/metrics on a daemon thread.
+        """
+        if not self.enabled or self._server is not None:
+            return
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.render().encode()
+                self.send_response(200 if self.path.startswith("/metrics") else 404)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+        logging.info(f" Metrics endpoint: http://{host}:{port}/metrics")
+
+
+def _labels(labels):
+    return ",".join(f"{key}=\"{value}\"" for key, value in labels)
+
+
+#  Process-wide instance used by the engine modules
+metrics = EngineMetrics()
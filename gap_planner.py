@@ -0,0 +1,108 @@
+import datetime
+
+from broker_client import IST
+
+
+class GapPlanner:
+    """
+    Works out exactly which bars of a series are missing and turns them into as few
+    historical_data requests as possible.
+
+    The expected bar grid of a trading day (a weekday not in `holidays`) is every
+    `timeframe`-minute bar anchored at the session open, the last one cut at the session
+    close, as built by CandleBuilder. Only bars that have closed are expected. Missing bars
+    that are neighbours on the grid are merged into one request window, including the last
+    bar of one trading day and the first bar of the next. Windows separated by a run of at
+    most `merge_gap` stored bars are merged too (re-fetching a few stored bars is cheaper
+    than another rate-limited request), as long as a window spans at most `max_window_bars`.
+
+    Bars the exchange never printed (no trades in the interval) stay missing, so they are
+    planned again on every run; a CandleStore in front of the API answers those from disk.
+    """
+
+    def __init__(self, holidays=(), session_open=(9, 15), session_close=(15, 30),
+                 merge_gap=5, max_window_bars=2000):
+        self.holidays = {datetime.date.fromisoformat(day) if isinstance(day, str) else day for day in holidays}
+        self.session_open = datetime.time(*session_open)
+        self.session_close = datetime.time(*session_close)
+        self.merge_gap = merge_gap
+        self.max_window_bars = max_window_bars
+
+    def is_trading_day(self, day):
+        return day.weekday() < 5 and day not in self.holidays
+
+    def trading_days(self, start_day, end_day):
+        """
+        Trading days from start_day to end_day (both included).
+        """
+        day = start_day
+        while day <= end_day:
+            if self.is_trading_day(day):
+                yield day
+            day += datetime.timedelta(days=1)
+
+    def previous_trading_day(self, day):
+        day -= datetime.timedelta(days=1)
+        while not self.is_trading_day(day):
+            day -= datetime.timedelta(days=1)
+        return day
+
+    def expected_bars(self, day, timeframe):
+        """
+        (start, end) of every bar of a trading day in exchange time, in order.
+        """
+        start = datetime.datetime.combine(day, self.session_open)
+        close = datetime.datetime.combine(day, self.session_close)
+        step = datetime.timedelta(minutes=timeframe)
+
+        bars = []
+        while start < close:
+            bars.append((start, min(start + step, close)))
+            start += step
+        return bars
+
+    def missing_bars(self, timeframe, start, end, existing):
+        """
+        Grid positions and (start, end) of the bars with start <= bar start and bar end <= end
+        whose start time is not in `existing`.
+        """
+        start, end = exchange_time(start), exchange_time(end)
+        have = {exchange_time(timestamp) for timestamp in existing}
+
+        grid = [
+            bar
+            for day in self.trading_days(start.date(), end.date())
+            for bar in self.expected_bars(day, timeframe)
+            if bar[0] >= start and bar[1] <= end
+        ]
+        return [(position, bar) for position, bar in enumerate(grid) if bar[0] not in have]
+
+    def plan(self, timeframe, start, end, existing):
+        """
+        Request windows covering every missing bar between start and end.
+
+        Returns:
+            list: [(from_date, to_date), ...] as IST datetimes; from_date is the first missing
+            bar's start and to_date falls inside the last missing bar, so a request with
+            from_date <= candle date <= to_date returns the window's bars (plus the few stored
+            bars it was merged across, which the inserts skip).
+        """
+        windows = []
+        first_position = last_position = None
+        for position, (bar_start, bar_end) in self.missing_bars(timeframe, start, end, existing):
+            to_date = (bar_end - datetime.timedelta(seconds=1)).replace(tzinfo=IST)
+            if (last_position is not None and position - last_position - 1 <= self.merge_gap
+                    and position - first_position < self.max_window_bars):
+                windows[-1] = (windows[-1][0], to_date)
+            else:
+                windows.append((bar_start.replace(tzinfo=IST), to_date))
+                first_position = position
+            last_position = position
+        return windows
+
+
+def exchange_time(value):
+    """
+    Naive exchange-time (IST) datetime of a naive-IST or timezone-aware datetime.
+    """
+    return value.astimezone(IST).replace(tzinfo=None) if value.tzinfo else value
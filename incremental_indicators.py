@@ -0,0 +1,335 @@
+import math
+from collections import deque
+
+import numpy as np
+
+
+#  Incremental (append-only) indicator engine
+#
+#  Holds the recursive state every live indicator in adx_cboe_main.py needs and advances it
+#  by exactly one bar per call, so per-candle cost stays O(1) however long the table grows.
+#  Each step mirrors the full-table pandas/NumPy computation of the matching
+#  calculate_*_for_series function (ewm adjust=False, rolling windows with min_periods=window).
+
+
+def new_indicator_state(adx_period=2, ema_lengths=(22, 33), atr_length=10, atr_multiplier=3,
+                        smoothK=3, smoothD=3, lengthRSI=14, lengthStoch=14, lengthcboe=7):
+    """
+    Creates an empty incremental state. Parameters match the defaults used by the
+    calculate_*_for_series functions.
+    """
+    return {
+        "bars": 0,
+        "last_timestamp": None,
+        "prev_high": np.nan,
+        "prev_low": np.nan,
+        "prev_close": np.nan,
+        "adx": {
+            "period": adx_period,
+            "seed": [],
+            "tr_smooth": np.float64(0.0),
+            "plus_dm_smooth": np.float64(0.0),
+            "minus_dm_smooth": np.float64(0.0),
+            "dx": deque(maxlen=adx_period),
+        },
+        "ema": {length: _new_ewm(2 / (length + 1)) for length in ema_lengths},
+        "cboe": {
+            "smoothK": smoothK,
+            "smoothD": smoothD,
+            "lengthStoch": lengthStoch,
+            "lengthcboe": lengthcboe,
+            "rsi_gain": _new_ewm(1 / lengthRSI),
+            "rsi_loss": _new_ewm(1 / lengthRSI),
+            "cboe_gain": _new_ewm(1 / lengthcboe),
+            "cboe_loss": _new_ewm(1 / lengthcboe),
+            "rsi1": deque(maxlen=lengthStoch),
+            "stoch_rsi": deque(maxlen=smoothK),
+            "k": deque(maxlen=smoothD),
+            "rs": deque(maxlen=lengthcboe),
+            "up_volume_price": deque(maxlen=lengthcboe),
+            "down_volume_price": deque(maxlen=lengthcboe),
+        },
+        "supertrend": {
+            "atr_length": atr_length,
+            "atr_multiplier": atr_multiplier,
+            "warmup_true_range": [],
+            "atr": np.float64(0.0),
+            "upper": np.nan,
+            "lower": np.nan,
+            "os": 0,
+            "max_channel": np.nan,
+            "min_channel": np.nan,
+        },
+    }
+
+
+def update_indicator_state(state, bar):
+    """
+    Advances the state by one bar and returns the indicator values for that bar.
+
+    Args:
+        state (dict): State from new_indicator_state(), advanced in place.
+        bar (dict): timestamp, open, high, low, close, volume of the new bar.
+
+    Returns:
+        dict: {column_name: value} for every indicator column of the 5-min table.
+    """
+    high = np.float64(bar["high"])
+    low = np.float64(bar["low"])
+    close = np.float64(bar["close"])
+    volume = np.float64(bar["volume"]) if bar["volume"] is not None else np.float64(np.nan)
+
+    values = {}
+    with np.errstate(divide="ignore", invalid="ignore"):
+        values.update(_step_adx(state, high, low, close))
+        for length, ewm in state["ema"].items():
+            values[f"ema_{length}"] = _ewm_step(ewm, close)
+        values.update(_step_cboe(state, close, volume))
+        values.update(_step_supertrend(state, high, low, close))
+
+    state["prev_high"] = high
+    state["prev_low"] = low
+    state["prev_close"] = close
+    state["bars"] += 1
+    state["last_timestamp"] = bar["timestamp"]
+    return values
+
+
+#  ADX / DI+ / DI− (Wilder smoothing seeded with the sum of the first `period` bars)
+def _step_adx(state, high, low, close):
+    adx = state["adx"]
+    period = adx["period"]
+    i = state["bars"]
+
+    if i == 0:
+        tr = high - low
+        plus_dm = minus_dm = np.float64(0.0)
+    else:
+        prev_close = state["prev_close"]
+        tr = max(high - low, abs(high - prev_close), abs(low - prev_close))
+        up_move = high - state["prev_high"]
+        down_move = state["prev_low"] - low
+        plus_dm = up_move if (up_move > down_move) and (up_move > 0) else np.float64(0.0)
+        minus_dm = down_move if (down_move > up_move) and (down_move > 0) else np.float64(0.0)
+
+    if i < period:
+        if i >= 1:
+            adx["seed"].append((tr, plus_dm, minus_dm))
+    elif i == period:
+        adx["seed"].append((tr, plus_dm, minus_dm))
+        adx["tr_smooth"] = np.sum([seed[0] for seed in adx["seed"]])
+        adx["plus_dm_smooth"] = np.sum([seed[1] for seed in adx["seed"]])
+        adx["minus_dm_smooth"] = np.sum([seed[2] for seed in adx["seed"]])
+        adx["seed"] = []
+    else:
+        adx["tr_smooth"] = adx["tr_smooth"] - (adx["tr_smooth"] / period) + tr
+        adx["plus_dm_smooth"] = adx["plus_dm_smooth"] - (adx["plus_dm_smooth"] / period) + plus_dm
+        adx["minus_dm_smooth"] = adx["minus_dm_smooth"] - (adx["minus_dm_smooth"] / period) + minus_dm
+
+    di_plus = 100 * adx["plus_dm_smooth"] / adx["tr_smooth"]
+    di_minus = 100 * adx["minus_dm_smooth"] / adx["tr_smooth"]
+    dx = 100 * abs(di_plus - di_minus) / (di_plus + di_minus)
+    adx["dx"].append(dx)
+
+    return {
+        "adx": _window_mean(adx["dx"], period),
+        "di_plus": di_plus,
+        "di_minus": di_minus,
+    }
+
+
+#  CBOE (Stochastic RSI + volume-weighted market index + odds)
+def _step_cboe(state, close, volume):
+    cboe = state["cboe"]
+    lengthcboe = cboe["lengthcboe"]
+
+    change = close - state["prev_close"]
+    gain = max(change, 0.0) if not np.isnan(change) else change
+    loss = -min(change, 0.0) if not np.isnan(change) else change
+
+    # Stochastic RSI
+    rsi1 = _rsi(_ewm_step(cboe["rsi_gain"], gain), _ewm_step(cboe["rsi_loss"], loss))
+    cboe["rsi1"].append(rsi1)
+    rsi_min = _window_reduce(cboe["rsi1"], cboe["lengthStoch"], min)
+    rsi_max = _window_reduce(cboe["rsi1"], cboe["lengthStoch"], max)
+    cboe["stoch_rsi"].append(100 * (rsi1 - rsi_min) / (rsi_max - rsi_min))
+    k = _window_mean(cboe["stoch_rsi"], cboe["smoothK"])
+    cboe["k"].append(k)
+    d = _window_mean(cboe["k"], cboe["smoothD"])
+
+    # CBOE RSI-based oscillator
+    rs = _rsi(_ewm_step(cboe["cboe_gain"], gain), _ewm_step(cboe["cboe_loss"], loss))
+    cboe["rs"].append(rs)
+    rh = _window_reduce(cboe["rs"], lengthcboe, max)
+    rl = _window_reduce(cboe["rs"], lengthcboe, min)
+
+    stch = 100 * (rs - rl) / (rh - rl)
+    stch1 = 100 - stch
+    f1 = stch * stch1 / 100
+    f2 = stch - f1
+    f3 = stch1 - f1
+    f4 = f1 + f2 + f3
+
+    # Volume-weighted market index
+    up_input = close if change > 0 else 0
+    down_input = close if change < 0 else 0
+    cboe["up_volume_price"].append(volume * up_input)
+    cboe["down_volume_price"].append(volume * down_input)
+    upper_s = _window_reduce(cboe["up_volume_price"], lengthcboe, _sum)
+    lower_s = _window_reduce(cboe["down_volume_price"], lengthcboe, _sum)
+
+    R = upper_s / lower_s if lower_s != 0 else np.float64(np.nan)
+    market_index = 100 - (100 / (1 + R))
+
+    bull_gross = market_index
+    bear_gross = 100 - market_index
+    price_stagnant = (bull_gross * bear_gross) / 100
+    price_bull = bull_gross - price_stagnant
+    price_bear = bear_gross - price_stagnant
+
+    coeff_price = (price_stagnant + price_bull + price_bear) / 100
+    bull = price_bull / coeff_price
+    bear = price_bear / coeff_price
+    stagnant = price_stagnant / coeff_price
+
+    temp_stagnant = stagnant * (1 + (f3 / f4))
+    temp_bull = bull * (1 + (f2 / f4))
+    temp_bear = bear * (1 + (f3 / f4))
+    coeff = (temp_stagnant + temp_bull + temp_bear) / 100
+
+    return {
+        "stoch_k": k,
+        "stoch_d": d,
+        "odd_bull": temp_bull / coeff,
+        "odd_bear": temp_bear / coeff,
+        "odd_stagnant": temp_stagnant / coeff,
+    }
+
+
+#  Supertrend bands, oscillation state, pivot and max/min channels
+def _step_supertrend(state, high, low, close):
+    st = state["supertrend"]
+    atr_length = st["atr_length"]
+    i = state["bars"]
+
+    hl2 = (high + low) / 2
+
+    if i == 0:
+        true_range = np.float64(0.0)
+    else:
+        prev_close = state["prev_close"]
+        true_range = max(high - low, abs(high - prev_close), abs(low - prev_close))
+
+    if i < atr_length:
+        st["warmup_true_range"].append(true_range)
+        st["atr"] = np.float64(0.0) if i == 0 else np.mean(st["warmup_true_range"])
+        if i == atr_length - 1:
+            st["warmup_true_range"] = []
+    else:
+        st["atr"] = ((st["atr"] * (atr_length - 1)) + true_range) / atr_length
+
+    atr = st["atr"] * st["atr_multiplier"]
+    initial_upper = hl2 + atr
+    initial_lower = hl2 - atr
+
+    if i == 0:
+        upper = initial_upper
+        lower = initial_lower
+    else:
+        prev_close = state["prev_close"]
+        upper = min(initial_upper, st["upper"]) if prev_close < st["upper"] else initial_upper
+        lower = max(initial_lower, st["lower"]) if prev_close >= st["lower"] else initial_lower
+
+    if close > upper:
+        os_state = 1
+    elif close < lower:
+        os_state = 0
+    else:
+        os_state = st["os"] if i > 0 else 0
+
+    spt = lower if os_state == 1 else upper
+
+    if i == 0:
+        max_channel = close
+        min_channel = close
+    else:
+        prev_max_channel = st["max_channel"]
+        prev_min_channel = st["min_channel"]
+
+        if close > spt:
+            max_channel = max(prev_max_channel, close)
+        elif os_state == 1:
+            max_channel = max(close, prev_max_channel)
+        else:
+            max_channel = min(spt, prev_max_channel)
+
+        if close < spt:
+            min_channel = min(prev_min_channel, close)
+        elif os_state == 0:
+            min_channel = min(close, prev_min_channel)
+        else:
+            min_channel = max(spt, prev_min_channel)
+
+    st["upper"] = upper
+    st["lower"] = lower
+    st["os"] = os_state
+    st["max_channel"] = max_channel
+    st["min_channel"] = min_channel
+
+    return {
+        "hl2": hl2,
+        "atr": atr,
+        "initial_upper_bar": initial_upper,
+        "initial_lower_bar": initial_lower,
+        "supertrend_upper": upper,
+        "supertrend_lower": lower,
+        "os": os_state,
+        "spt": spt,
+        "max_channel": max_channel,
+        "min_channel": min_channel,
+        "supertrend_avg": (max_channel + min_channel) / 2,
+    }
+
+
+#  Helpers
+def _new_ewm(alpha):
+    return {"alpha": alpha, "value": np.float64(np.nan), "old_wt": 1.0}
+
+
+def _ewm_step(ewm, value):
+    """
+    One step of pandas' ewm(alpha=alpha, adjust=False).mean(), including its
+    NaN handling (ignore_na=False) so results match the full-series computation.
+    """
+    weighted = ewm["value"]
+    if np.isnan(weighted):
+        ewm["value"] = value
+        return value
+
+    ewm["old_wt"] *= 1.0 - ewm["alpha"]
+    if not np.isnan(value):
+        if weighted != value:
+            weighted = (ewm["old_wt"] * weighted + ewm["alpha"] * value) / (ewm["old_wt"] + ewm["alpha"])
+        ewm["old_wt"] = 1.0
+        ewm["value"] = weighted
+    return ewm["value"]
+
+
+def _rsi(avg_gain, avg_loss):
+    rs = avg_gain / avg_loss
+    return 100 - (100 / (1 + rs))
+
+
+def _window_reduce(window, length, func):
+    """Rolling reduction over a full window; NaN until `length` valid values are present."""
+    if len(window) < length or any(np.isnan(value) for value in window):
+        return np.float64(np.nan)
+    return func(window)
+
+
+def _window_mean(window, length):
+    return _window_reduce(window, length, lambda values: _sum(values) / length)
+
+
+def _sum(values):
+    return np.float64(math.fsum(values))
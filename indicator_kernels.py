@@ -0,0 +1,178 @@
+import numpy as np
+
+#  Numba is optional: kernels are JIT-compiled when it is installed,
+#  otherwise the same loops run as plain Python over NumPy arrays.
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+
+#  Array-in / array-out kernels for the path-dependent recurrences in adx_cboe_main.py.
+#
+#  Every comparison below spells out the exact branch Python's builtin min()/max() takes
+#  (min(a, b) keeps a unless b < a; max(a, b) keeps a unless b > a), so the compiled and
+#  fallback paths produce bit-for-bit the same values as the original pandas loops.
+#  Reductions that NumPy performs with pairwise summation (seed sums, warm-up means) are
+#  done in the Python wrappers with NumPy itself for the same reason.
+
+
+def wilder_smooth(values, period):
+    """
+    Wilder smoothing as used by calculate_adx_for_series: zero before `period`, seeded at
+    index `period` with the sum of values[1:period+1], then s[i] = s[i-1] - s[i-1]/period + x[i].
+    """
+    values = np.ascontiguousarray(values, dtype=np.float64)
+    out = np.zeros(len(values))
+    if len(values) > period:
+        out[period] = values[1:period + 1].sum()
+        _wilder_smooth_kernel(values, period, out)
+    return out
+
+
+@njit(cache=True)
+def _wilder_smooth_kernel(values, period, out):
+    for i in range(period + 1, len(values)):
+        out[i] = out[i - 1] - (out[i - 1] / period) + values[i]
+
+
+def true_range(high, low, close):
+    """
+    True Range with the first bar left at 0 (no previous close), as in the ATR/Supertrend path.
+    """
+    return _true_range_kernel(
+        np.ascontiguousarray(high, dtype=np.float64),
+        np.ascontiguousarray(low, dtype=np.float64),
+        np.ascontiguousarray(close, dtype=np.float64),
+    )
+
+
+@njit(cache=True)
+def _true_range_kernel(high, low, close):
+    n = len(high)
+    out = np.zeros(n)
+    for i in range(1, n):
+        prev_close = close[i - 1]
+        tr = high[i] - low[i]
+        up = abs(high[i] - prev_close)
+        down = abs(low[i] - prev_close)
+        if up > tr:
+            tr = up
+        if down > tr:
+            tr = down
+        out[i] = tr
+    return out
+
+
+def atr_rma(true_range_values, length):
+    """
+    Unscaled ATR: 0 on the first bar, the running mean of True Range while warming up
+    (bars 1 .. length-1), then the RMA recursion ((prev * (length - 1)) + tr) / length.
+    """
+    true_range_values = np.ascontiguousarray(true_range_values, dtype=np.float64)
+    n = len(true_range_values)
+    out = np.zeros(n)
+    for i in range(1, min(length, n)):
+        out[i] = true_range_values[:i + 1].mean()
+    _rma_kernel(true_range_values, length, out)
+    return out
+
+
+@njit(cache=True)
+def _rma_kernel(values, length, out):
+    for i in range(length, len(values)):
+        out[i] = ((out[i - 1] * (length - 1)) + values[i]) / length
+
+
+@njit(cache=True)
+def supertrend_bands(initial_upper, initial_lower, close):
+    """
+    Supertrend upper/lower band recursions. The upper band only tightens (min) while the
+    previous close stayed below it; the lower band only rises (max) while it stayed above.
+    Returns (supertrend_upper, supertrend_lower).
+    """
+    n = len(close)
+    upper = np.empty(n)
+    lower = np.empty(n)
+    if n == 0:
+        return upper, lower
+
+    upper[0] = initial_upper[0]
+    lower[0] = initial_lower[0]
+
+    for i in range(1, n):
+        prev_upper = upper[i - 1]
+        prev_lower = lower[i - 1]
+        prev_close = close[i - 1]
+
+        if prev_close < prev_upper:
+            upper[i] = prev_upper if prev_upper < initial_upper[i] else initial_upper[i]
+        else:
+            upper[i] = initial_upper[i]
+
+        if prev_close >= prev_lower:
+            lower[i] = prev_lower if prev_lower > initial_lower[i] else initial_lower[i]
+        else:
+            lower[i] = initial_lower[i]
+
+    return upper, lower
+
+
+@njit(cache=True)
+def oscillation_state(close, upper, lower):
+    """
+    Oscillation state machine: 1 (bullish) above the upper band, 0 (bearish) below the
+    lower band, otherwise carries the previous state (0 on the first bar).
+    """
+    n = len(close)
+    out = np.zeros(n, dtype=np.int64)
+    for i in range(n):
+        if close[i] > upper[i]:
+            out[i] = 1
+        elif close[i] < lower[i]:
+            out[i] = 0
+        elif i > 0:
+            out[i] = out[i - 1]
+    return out
+
+
+@njit(cache=True)
+def supertrend_channels(close, spt, os_state):
+    """
+    Max / Min channel recursions driven by close, supertrend pivot (spt) and oscillation state.
+    Returns (max_channel, min_channel).
+    """
+    n = len(close)
+    max_channel = np.empty(n)
+    min_channel = np.empty(n)
+    if n == 0:
+        return max_channel, min_channel
+
+    max_channel[0] = close[0]
+    min_channel[0] = close[0]
+
+    for i in range(1, n):
+        prev_max = max_channel[i - 1]
+        prev_min = min_channel[i - 1]
+
+        if close[i] > spt[i]:
+            max_channel[i] = close[i] if close[i] > prev_max else prev_max
+        elif os_state[i] == 1:
+            max_channel[i] = prev_max if prev_max > close[i] else close[i]
+        else:
+            max_channel[i] = prev_max if prev_max < spt[i] else spt[i]
+
+        if close[i] < spt[i]:
+            min_channel[i] = close[i] if close[i] < prev_min else prev_min
+        elif os_state[i] == 0:
+            min_channel[i] = prev_min if prev_min < close[i] else close[i]
+        else:
+            min_channel[i] = prev_min if prev_min > spt[i] else spt[i]
+
+    return max_channel, min_channel
@@ -0,0 +1,132 @@
+import bisect
+import datetime
+import glob
+import json
+import logging
+import os
+
+
+class InstrumentIndex:
+    """
+    Instrument master indexed by (underlying, expiry, instrument_type, strike).
+
+    Every (underlying, expiry, instrument_type) chain keeps a sorted strike ladder, so the
+    nearest strike and strike-range lookups are binary searches instead of scans over the
+    whole master. Expiries per underlying come from the master itself.
+    """
+
+    def __init__(self, instruments):
+        self.instruments = instruments
+        self._ladders = {}    # (name, expiry, type) → (sorted strikes, rows in strike order)
+        self._expiries = {}   # name → sorted expiries
+        self._by_token = {}   # instrument_token → row
+
+        chains = {}
+        for row in instruments:
+            self._by_token[row["instrument_token"]] = row
+            if row.get("instrument_type") not in ("CE", "PE") or not row.get("expiry"):
+                continue
+            key = (row["name"], row["expiry"], row["instrument_type"])
+            chains.setdefault(key, []).append(row)
+
+        for key, rows in chains.items():
+            rows.sort(key=lambda r: r["strike"])
+            self._ladders[key] = ([r["strike"] for r in rows], rows)
+            self._expiries.setdefault(key[0], set()).add(key[1])
+
+        self._expiries = {name: sorted(expiries) for name, expiries in self._expiries.items()}
+
+    @classmethod
+    def load(cls, kite, exchange="NFO", cache_dir="instrument_cache", today=None):
+        """
+        Loads today's instrument master from the local cache file, downloading it with
+        kite.instruments(exchange) only when the cache is missing or from an older day.
+        """
+        today = today or datetime.date.today()
+        os.makedirs(cache_dir, exist_ok=True)
+        path = os.path.join(cache_dir, f"{exchange}_{today.isoformat()}.json")
+
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    instruments = [_decode_row(row) for row in json.load(f)]
+                logging.info(f" Loaded {len(instruments)} {exchange} instruments from cache {path}")
+                return cls(instruments)
+            except Exception as e:
+                logging.warning(f" Instrument cache {path} unreadable, downloading again: {e}")
+
+        instruments = kite.instruments(exchange)
+        logging.info(f" Downloaded {len(instruments)} {exchange} instruments")
+
+        try:
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump([_encode_row(row) for row in instruments], f)
+            os.replace(tmp_path, path)
+
+            #  Keep only today's master
+            for old in glob.glob(os.path.join(cache_dir, f"{exchange}_*.json")):
+                if old != path:
+                    os.remove(old)
+        except Exception as e:
+            logging.warning(f" Could not write instrument cache {path}: {e}")
+
+        return cls(instruments)
+
+    def expiries(self, name):
+        """
+        All listed expiries of an underlying in ascending order.
+        """
+        return self._expiries.get(name, [])
+
+    def next_expiry(self, name, on_or_after=None):
+        """
+        Nearest expiry of an underlying on or after the given date (default: today).
+        """
+        expiries = self.expiries(name)
+        i = bisect.bisect_left(expiries, on_or_after or datetime.date.today())
+        return expiries[i] if i < len(expiries) else None
+
+    def nearest_strike(self, name, expiry, instrument_type, price):
+        """
+        Contract whose strike is closest to `price` (lower strike on a tie), or None.
+        """
+        strikes, rows = self._ladders.get((name, expiry, instrument_type), ([], []))
+        if not strikes:
+            return None
+
+        i = bisect.bisect_left(strikes, price)
+        if i == len(strikes):
+            return rows[-1]
+        if i > 0 and price - strikes[i - 1] <= strikes[i] - price:
+            return rows[i - 1]
+        return rows[i]
+
+    def by_token(self, instrument_token):
+        return self._by_token.get(instrument_token)
+
+    def neighbours(self, name, expiry, instrument_type, strike, count):
+        """
+        Contracts within `count` ladder steps of `strike` on each side (strike included), in strike order.
+        """
+        strikes, rows = self._ladders.get((name, expiry, instrument_type), ([], []))
+        i = bisect.bisect_left(strikes, strike)
+        return rows[max(i - count, 0):i + count + 1]
+
+    def strikes_between(self, name, expiry, instrument_type, low, high):
+        """
+        Contracts with low <= strike <= high, in strike order.
+        """
+        strikes, rows = self._ladders.get((name, expiry, instrument_type), ([], []))
+        return rows[bisect.bisect_left(strikes, low):bisect.bisect_right(strikes, high)]
+
+
+def _encode_row(row):
+    return {key: value.isoformat() if isinstance(value, (datetime.date, datetime.datetime)) else value
+            for key, value in row.items()}
+
+
+def _decode_row(row):
+    if row.get("expiry"):
+        row["expiry"] = datetime.date.fromisoformat(row["expiry"])
+    return row
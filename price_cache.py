@@ -0,0 +1,52 @@
+import threading
+import time
+
+
+class LastPriceCache:
+    """
+    Thread-safe last price / last quote per instrument token, fed from the websocket.
+
+    update_ticks() runs on the KiteTicker thread and stores each token's latest tick;
+    readers ask for a price no older than max_age seconds (local receive time) and get
+    None when the cached value is missing or stale, so they can fall back to REST.
+    """
+
+    def __init__(self, max_age=5.0):
+        self.max_age = max_age
+        self._quotes = {}  # token → (received at monotonic, tick)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def update(self, token, last_price, **fields):
+        """
+        Stores a price (and optional quote fields) for one token, e.g. from a REST fallback.
+        """
+        with self._lock:
+            self._quotes[token] = (time.monotonic(), dict(fields, instrument_token=token, last_price=last_price))
+
+    def update_ticks(self, ticks):
+        """
+        Stores the latest tick of every token in a KiteTicker batch.
+        """
+        received = time.monotonic()
+        with self._lock:
+            for tick in ticks:
+                self._quotes[tick["instrument_token"]] = (received, tick)
+
+    def quote(self, token, max_age=None):
+        """
+        Latest tick dict of a token, or None when missing or older than max_age seconds.
+        """
+        max_age = self.max_age if max_age is None else max_age
+        with self._lock:
+            cached = self._quotes.get(token)
+            if cached is None or time.monotonic() - cached[0] > max_age:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return cached[1]
+
+    def last_price(self, token, max_age=None):
+        quote = self.quote(token, max_age)
+        return quote["last_price"] if quote is not None else None
@@ -0,0 +1,61 @@
+import threading
+import time
+
+from async_engine import AsyncEngine
+
+#  AsyncEngine on a real event loop (own thread), with a scheduler that never comes due.
+
+
+class IdleScheduler:
+    def seconds_until_due(self):
+        return 3600.0
+
+    def fire_due(self):
+        pass
+
+
+def start(engine):
+    thread = threading.Thread(target=engine.run, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_full_tick_queue_blocks_the_feed_instead_of_dropping():
+    received = []
+
+    def on_ticks(ws, ticks):
+        time.sleep(0.01)
+        received.append(ticks[0])
+
+    engine = AsyncEngine(IdleScheduler(), on_ticks, tick_queue_size=2)
+    thread = start(engine)
+    for i in range(20):
+        engine.feed_ticks(None, [i])
+
+    deadline = time.time() + 5
+    while len(received) < 20 and time.time() < deadline:
+        time.sleep(0.01)
+    engine.stop()
+    thread.join(5)
+
+    assert received == list(range(20))
+    assert engine.stats["backpressure_waits"] > 0
+    assert engine.stats["tick_batches"] == 20
+
+
+def test_slow_job_times_out_and_is_not_stacked():
+    release = threading.Event()
+    engine = AsyncEngine(IdleScheduler(), lambda ws, ticks: None)
+    thread = start(engine)
+    engine._ready.wait(5)
+
+    engine.spawn("slow", release.wait, 5, timeout=0.05)
+    time.sleep(0.2)
+    engine.spawn("slow", release.wait, 5, timeout=0.05)
+    time.sleep(0.1)
+    release.set()
+    engine.stop()
+    thread.join(5)
+
+    assert engine.stats["job_timeouts"] == 1
+    assert engine.stats["job_skips"] == 1
@@ -0,0 +1,56 @@
+import datetime
+import threading
+
+from backfill import HistoricalBackfill
+
+#  Concurrent historical_data jobs of HistoricalBackfill against a stub client.
+
+START = datetime.datetime(2024, 1, 2, 9, 15)
+END = datetime.datetime(2024, 1, 2, 15, 29)
+
+
+class StubKite:
+    """
+    historical_data returns two candles per request; tokens in `flaky` fail their first call.
+    """
+
+    def __init__(self, flaky=(), broken=()):
+        self.flaky = set(flaky)
+        self.broken = set(broken)
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def historical_data(self, instrument_token, from_date, to_date, interval):
+        with self._lock:
+            self.calls.append(instrument_token)
+            if instrument_token in self.broken:
+                raise RuntimeError("no data")
+            if instrument_token in self.flaky:
+                self.flaky.discard(instrument_token)
+                raise RuntimeError("timed out")
+        return [{"date": from_date, "close": 1.0}, {"date": to_date, "close": 2.0}]
+
+
+def test_every_job_is_written_once_with_retries():
+    kite = StubKite(flaky={2})
+    written = {}
+    backfill = HistoricalBackfill(kite, lambda target, candles: written.setdefault(target, []).extend(candles),
+                                  workers=3, rate_limit=1000, backoff=0.0)
+
+    report = backfill.run([(f"series-{token}", token, "minute", START, END) for token in range(1, 6)])
+
+    assert report["jobs"] == 5 and report["failed"] == 0 and report["rows"] == 10
+    assert sorted(written) == [f"series-{token}" for token in range(1, 6)]
+    assert kite.calls.count(2) == 2
+
+
+def test_failed_job_is_reported_without_stopping_the_others():
+    kite = StubKite(broken={3})
+    backfill = HistoricalBackfill(kite, lambda target, candles: None, workers=2, rate_limit=1000,
+                                  retries=1, backoff=0.0)
+
+    report = backfill.run([(token, token, "minute", START, END) for token in (1, 2, 3)])
+
+    assert (report["failed"], report["rows"]) == (1, 4)
+    assert kite.calls.count(3) == 2
+    assert backfill.run([])["jobs"] == 0
@@ -0,0 +1,68 @@
+import datetime
+
+from candle_builder import CandleBuilder
+
+#  Session-anchored cascade of CandleBuilder: 1-minute bars from ticks, higher timeframes
+#  merged from them, the last bar of the day cut at the 15:30 close.
+
+DAY = datetime.date(2024, 1, 2)
+
+
+def at(hour, minute, second=0):
+    return datetime.datetime.combine(DAY, datetime.time(hour, minute, second))
+
+
+def feed(builder, ticks):
+    for ts, price, volume in ticks:
+        builder.add_tick(1, price, ts, volume)
+
+
+def stamps(builder, tf):
+    return [entry["timestamp"][-5:] for _, entry in builder.drain(tf)]
+
+
+def test_last_bar_is_cut_at_session_close():
+    builder = CandleBuilder((1, 5, 60))
+    feed(builder, [(at(15, 14, 30), 100.0, 1000), (at(15, 15, 5), 101.0, 1010),
+                   (at(15, 22), 99.0, 1030), (at(15, 29, 59), 102.0, 1060)])
+    builder.roll(at(15, 30))
+
+    assert stamps(builder, 60) == ["14:15", "15:15"]
+    assert stamps(builder, 5) == ["15:10", "15:15", "15:20", "15:25"]
+
+    builder.roll(at(15, 31))
+    assert builder.buffer_stats()["open_bars"] == 0
+
+
+def test_higher_timeframe_merges_base_bars():
+    builder = CandleBuilder((1, 5))
+    feed(builder, [(at(9, 15), 100.0, 0), (at(9, 16), 104.0, 50),
+                   (at(9, 18), 97.0, 80), (at(9, 19, 40), 101.0, 120)])
+    builder.roll(at(9, 20))
+
+    (_, bar), = builder.drain(5)
+    assert bar["timestamp"] == "2024-01-02 09:15"
+    assert (bar["open"], bar["high"], bar["low"], bar["close"], bar["volume"]) == (100.0, 104.0, 97.0, 101.0, 120)
+    assert len(builder.drain(1)) == 4
+
+
+def test_post_close_ticks_open_no_bars():
+    builder = CandleBuilder((1, 3, 5, 15, 60))
+    feed(builder, [(at(15, 29, 50), 100.0, 1000), (at(15, 30, 1), 105.0, 1200),
+                   (at(15, 31), 95.0, 1300), (at(15, 45), 90.0, 1500)])
+    builder.roll(at(16, 30))
+
+    assert [stamps(builder, tf) for tf in (1, 3, 5, 15)] == [["15:29"], ["15:27"], ["15:25"], ["15:15"]]
+    (_, bar), = builder.drain(60)
+    assert bar["timestamp"] == "2024-01-02 15:15"
+    assert (bar["high"], bar["low"], bar["close"]) == (100.0, 100.0, 100.0)
+    assert builder.buffer_stats()["off_session_ticks"] == 3
+
+
+def test_pre_open_ticks_only_set_the_volume_baseline():
+    builder = CandleBuilder((1,))
+    feed(builder, [(at(9, 10), 100.0, 500), (at(9, 15), 100.0, 700), (at(9, 15, 30), 101.0, 760)])
+    builder.roll(at(9, 16))
+
+    (_, bar), = builder.drain(1)
+    assert bar["volume"] == 260
@@ -0,0 +1,60 @@
+import datetime
+
+from candle_builder import minute_bucket
+from candle_scheduler import CandleCloseScheduler
+
+#  Boundaries fired by CandleCloseScheduler on a simulated exchange clock.
+
+DAY = datetime.date(2024, 1, 2)  # Tuesday
+
+
+def at(hour, minute, second=0, day=DAY):
+    return datetime.datetime.combine(day, datetime.time(hour, minute, second))
+
+
+def recording_scheduler(timeframes=(1, 5, 60)):
+    fired = []
+    scheduler = CandleCloseScheduler(lambda boundary, closing: fired.append((boundary.strftime("%H:%M"), closing)),
+                                     timeframes=timeframes, grace=2.0)
+    return scheduler, fired
+
+
+def test_fires_each_boundary_with_its_closing_timeframes():
+    scheduler, fired = recording_scheduler()
+    scheduler.advance_to(at(10, 12, 30))
+    scheduler.advance_to(at(10, 16, 1))
+
+    assert fired == [("10:13", [1]), ("10:14", [1]), ("10:15", [1, 5, 60])]
+
+
+def test_grace_period_delays_the_boundary():
+    scheduler, fired = recording_scheduler()
+    scheduler.advance_to(at(10, 14, 30))
+    scheduler.advance_to(at(10, 15, 1))
+    assert fired == []
+
+    scheduler.advance_to(at(10, 15, 2))
+    assert fired == [("10:15", [1, 5, 60])]
+
+
+def test_no_boundaries_outside_the_session():
+    scheduler, fired = recording_scheduler()
+    scheduler.advance_to(at(9, 10))
+    scheduler.advance_to(at(9, 16, 5))
+    assert fired == [("09:16", [1])]
+
+    scheduler, fired = recording_scheduler()
+    scheduler.advance_to(at(15, 28, 5))
+    scheduler.advance_to(at(15, 45))
+    assert fired == [("15:29", [1]), ("15:30", [1, 5, 60])]
+
+
+def test_fire_due_skips_closed_boundaries_and_weekends():
+    scheduler, fired = recording_scheduler()
+
+    for now in (at(15, 30, 3), at(15, 35, 3), at(10, 0, 3, day=datetime.date(2024, 1, 6))):
+        scheduler.exchange_now = lambda now=now: now
+        scheduler._last_fired = minute_bucket(now) - 1
+        scheduler.fire_due()
+
+    assert fired == [("15:30", [1, 5, 60])]
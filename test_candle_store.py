@@ -0,0 +1,87 @@
+import datetime
+import os
+import threading
+
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from broker_client import IST
+from candle_store import CandleStore
+
+#  Parquet partitions of CandleStore (one token / interval / day per file).
+
+DAY = datetime.date(2024, 1, 2)
+
+
+def candle(hour, minute, price=100.0, volume=10, day=DAY):
+    return {"date": datetime.datetime.combine(day, datetime.time(hour, minute), IST),
+            "open": price, "high": price + 1, "low": price - 1, "close": price, "volume": volume}
+
+
+def test_concurrent_writes_of_one_partition(tmp_path):
+    store = CandleStore(str(tmp_path))
+    errors = []
+
+    def write(i):
+        try:
+            store.write_day(1, "minute", DAY, [candle(9, 15 + i % 10, price=100.0 + i)], complete=True)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(i,)) for i in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert store.read_day(1, "minute", DAY).num_rows == 1
+    partition = os.path.dirname(store._path(1, "minute", DAY))
+    assert os.listdir(partition) == ["candles.parquet"]
+
+
+class FakeHistorical:
+    """
+    historical_data stand-in: a few candles per day of the requested range, calls recorded.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, token, interval, from_date, to_date):
+        self.calls.append((from_date, to_date))
+        candles = []
+        day = from_date.date()
+        while day <= to_date.date():
+            candles += [candle(9, 15 + i, price=100.0 + day.day + i, day=day) for i in range(5)]
+            day += datetime.timedelta(days=1)
+        return [c for c in candles if from_date <= c["date"] <= to_date]
+
+
+def test_read_through_round_trip(tmp_path):
+    store = CandleStore(str(tmp_path))
+    fetch = FakeHistorical()
+    start = datetime.datetime.combine(DAY, datetime.time(9, 15), IST)
+    end = datetime.datetime.combine(DAY + datetime.timedelta(days=1), datetime.time(15, 30), IST)
+
+    first = store.read_through(1, "minute", start, end, fetch)
+    assert len(fetch.calls) == 1  # Consecutive missing days in one request
+    assert first.num_rows == 10
+    assert first.to_pylist()[0] == candle(9, 15, price=102.0)
+
+    second = store.read_through(1, "minute", start, end, fetch)
+    assert len(fetch.calls) == 1  # Served from disk
+    assert second.equals(first)
+
+    tail = store.read_through(1, "minute", start.replace(minute=17), start.replace(minute=18), fetch)
+    assert [row["date"].minute for row in tail.to_pylist()] == [17, 18]
+
+
+def test_merge_keeps_one_row_per_date_preferring_fetched(tmp_path):
+    store = CandleStore(str(tmp_path))
+    stored = store._to_table([candle(9, 15, 100.0), candle(9, 16, 100.0), candle(9, 18, 100.0)])
+    fetched = store._to_table([candle(9, 17, 200.0), candle(9, 16, 200.0)])
+
+    merged = store._merge(fetched, stored).to_pylist()
+    assert [(row["date"].minute, row["close"]) for row in merged] == [(15, 100.0), (16, 200.0), (17, 200.0), (18, 100.0)]
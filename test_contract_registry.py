@@ -0,0 +1,66 @@
+import datetime
+import threading
+
+from contract_registry import ContractRegistry
+
+#  Nearest OTM switching with hysteresis and the write-behind of ContractRegistry.
+
+EXPIRY = datetime.date(2024, 1, 4)
+
+
+def contract(side, strike, expiry=EXPIRY):
+    token = (expiry.day * 100000 + strike) * 10 + (side == "PE")
+    return {"symbol": f"NIFTY{strike}{side}", "token": token, "strike": strike, "expiry": expiry}
+
+
+def nearest_otm(spot, step=50, expiry=EXPIRY):
+    lower = int(spot // step * step)
+    return {"CE": contract("CE", lower if lower == spot else lower + step, expiry), "PE": contract("PE", lower, expiry)}
+
+
+def test_first_update_takes_both_sides():
+    registry = ContractRegistry()
+    assert registry.update(22030, nearest_otm(22030)) == ["CE", "PE"]
+    assert registry.tokens() == (4220500, 4220001)
+
+
+def test_spot_near_a_strike_does_not_flip_contracts():
+    registry = ContractRegistry(strike_step=50, hysteresis=10.0)
+    registry.update(22040, nearest_otm(22040))  # CE 22050, PE 22000
+
+    for spot in (22049, 22055, 22058, 22045, 21995, 21992):
+        assert registry.update(spot, nearest_otm(spot)) == []
+    assert registry.tokens() == (4220500, 4220001)
+
+
+def test_spot_beyond_the_band_switches():
+    registry = ContractRegistry(strike_step=50, hysteresis=10.0)
+    registry.update(22040, nearest_otm(22040))
+
+    assert registry.update(22061, nearest_otm(22061)) == ["CE", "PE"]
+    assert registry.tokens() == (4221000, 4220501)
+    assert registry.update(21989, nearest_otm(21989)) == ["CE", "PE"]
+
+
+def test_new_expiry_always_switches():
+    registry = ContractRegistry()
+    registry.update(22040, nearest_otm(22040))
+
+    next_expiry = datetime.date(2024, 1, 11)
+    assert registry.update(22041, nearest_otm(22041, expiry=next_expiry)) == ["CE", "PE"]
+
+
+def test_changes_are_persisted_behind():
+    written = []
+    done = threading.Event()
+
+    def persist(snapshot):
+        written.append(snapshot)
+        done.set()
+
+    registry = ContractRegistry(persist=persist)
+    registry.update(22040, nearest_otm(22040))
+
+    assert done.wait(5)
+    assert written[-1]["CE"]["symbol"] == "NIFTY22050CE"
+    assert written[-1]["spot"] == 22040
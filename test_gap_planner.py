@@ -0,0 +1,67 @@
+import datetime
+
+from broker_client import IST
+from gap_planner import GapPlanner
+
+#  Request windows planned by GapPlanner over the session-anchored bar grid.
+
+DAY = datetime.date(2024, 1, 2)  # Tuesday
+
+
+def at(hour, minute, day=DAY):
+    return datetime.datetime.combine(day, datetime.time(hour, minute))
+
+
+def minutes(first, last, day=DAY):
+    start = at(*first, day=day)
+    return {start + datetime.timedelta(minutes=i) for i in range(int((at(*last, day=day) - start).total_seconds() // 60) + 1)}
+
+
+def window(start, end):
+    return (start.replace(tzinfo=IST), (end - datetime.timedelta(seconds=1)).replace(tzinfo=IST))
+
+
+def test_nothing_missing_plans_nothing():
+    planner = GapPlanner()
+    assert planner.plan(1, at(9, 15), at(10, 0), minutes((9, 15), (9, 59))) == []
+
+
+def test_neighbouring_missing_bars_form_one_window():
+    planner = GapPlanner()
+    stored = minutes((9, 15), (9, 59)) - minutes((9, 30), (9, 39))
+    assert planner.plan(1, at(9, 15), at(10, 0), stored) == [window(at(9, 30), at(9, 40))]
+
+
+def test_windows_merge_across_short_stored_runs():
+    planner = GapPlanner(merge_gap=2)
+    stored = minutes((9, 15), (9, 59)) - {at(9, 20), at(9, 23), at(9, 40)}
+
+    #  9:21-9:22 stored (2 bars) → merged; 9:24-9:39 stored (16 bars) → separate request
+    assert planner.plan(1, at(9, 15), at(10, 0), stored) == [
+        window(at(9, 20), at(9, 24)), window(at(9, 40), at(9, 41))
+    ]
+
+
+def test_merged_window_span_is_capped():
+    planner = GapPlanner(merge_gap=5, max_window_bars=10)
+    stored = {at(9, 15) + datetime.timedelta(minutes=i) for i in range(45) if i % 3}
+
+    windows = planner.plan(1, at(9, 15), at(10, 0), stored)
+    assert [(w[0].strftime("%H:%M"), w[1].strftime("%H:%M")) for w in windows] == [
+        ("09:15", "09:24"), ("09:27", "09:36"), ("09:39", "09:48"), ("09:51", "09:57")
+    ]
+
+
+def test_window_spans_the_overnight_gap_and_skips_holidays():
+    planner = GapPlanner(holidays={"2024-01-03"})
+    thursday = datetime.date(2024, 1, 4)
+    stored = minutes((9, 15), (15, 29)) - {at(15, 29)}
+
+    assert planner.plan(1, at(9, 15), at(9, 17, day=thursday), stored) == [window(at(15, 29), at(9, 17, day=thursday))]
+    assert planner.previous_trading_day(thursday) == DAY
+
+
+def test_last_bar_of_the_day_is_cut_at_the_close():
+    planner = GapPlanner()
+    assert planner.expected_bars(DAY, 60)[-1] == (at(15, 15), at(15, 30))
+    assert len(planner.expected_bars(DAY, 5)) == 75
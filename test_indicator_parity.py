@@ -0,0 +1,306 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from indicator_kernels import (
+    wilder_smooth, true_range, atr_rma,
+    supertrend_bands, oscillation_state, supertrend_channels
+)
+from incremental_indicators import new_indicator_state, update_indicator_state
+
+#  Parity of the compiled kernels (bit-for-bit) and of the incremental engine against the
+#  original per-table pandas loops of adx_cboe_main.py, reproduced below without the DB.
+
+ATR_LENGTH = 10
+ATR_MULTIPLIER = 3
+
+
+def random_ohlc(seed, n=300):
+    """
+    Random-walk OHLCV on a 0.05 tick grid, so equal prices (band / channel ties) occur.
+    """
+    rng = np.random.default_rng(seed)
+    close = np.round((100 + rng.normal(0, 1.5, n).cumsum()).clip(5) / 0.05) * 0.05
+    open_ = np.round((close + rng.normal(0, 0.8, n)).clip(5) / 0.05) * 0.05
+    high = np.maximum(open_, close) + np.round(rng.exponential(0.6, n) / 0.05) * 0.05
+    low = (np.minimum(open_, close) - np.round(rng.exponential(0.6, n) / 0.05) * 0.05).clip(1)
+    volume = rng.integers(0, 5000, n).astype(float)
+    volume[rng.random(n) < 0.05] = 0
+    return pd.DataFrame({"open": open_, "high": high, "low": low, "close": close, "volume": volume})
+
+
+#  Baseline loops (as in the original calculate_*_for_table functions)
+
+def baseline_adx(df, period=2):
+    df = df.copy()
+    df["prev_close"] = df["close"].shift(1)
+    df["prev_high"] = df["high"].shift(1)
+    df["prev_low"] = df["low"].shift(1)
+
+    tr1 = df["high"] - df["low"]
+    tr2 = (df["high"] - df["prev_close"]).abs()
+    tr3 = (df["low"] - df["prev_close"]).abs()
+    df["tr"] = pd.concat([tr1, tr2, tr3], axis=1).max(axis=1)
+
+    up_move = df["high"] - df["prev_high"]
+    down_move = df["prev_low"] - df["low"]
+    df["+dm"] = np.where((up_move > down_move) & (up_move > 0), up_move, 0.0)
+    df["-dm"] = np.where((down_move > up_move) & (down_move > 0), down_move, 0.0)
+
+    df["tr_smooth"] = 0.0
+    df["+dm_smooth"] = 0.0
+    df["-dm_smooth"] = 0.0
+    df.loc[period, "tr_smooth"] = df["tr"].iloc[1:period+1].sum()
+    df.loc[period, "+dm_smooth"] = df["+dm"].iloc[1:period+1].sum()
+    df.loc[period, "-dm_smooth"] = df["-dm"].iloc[1:period+1].sum()
+
+    for i in range(period + 1, len(df)):
+        df.loc[i, "tr_smooth"] = df.loc[i-1, "tr_smooth"] - (df.loc[i-1, "tr_smooth"] / period) + df.loc[i, "tr"]
+        df.loc[i, "+dm_smooth"] = df.loc[i-1, "+dm_smooth"] - (df.loc[i-1, "+dm_smooth"] / period) + df.loc[i, "+dm"]
+        df.loc[i, "-dm_smooth"] = df.loc[i-1, "-dm_smooth"] - (df.loc[i-1, "-dm_smooth"] / period) + df.loc[i, "-dm"]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        df["di_plus"] = 100 * df["+dm_smooth"] / df["tr_smooth"]
+        df["di_minus"] = 100 * df["-dm_smooth"] / df["tr_smooth"]
+        df["dx"] = 100 * (df["di_plus"] - df["di_minus"]).abs() / (df["di_plus"] + df["di_minus"])
+    df["adx"] = df["dx"].rolling(window=period).mean()
+    return df
+
+
+def baseline_atr(df):
+    df = df.copy()
+    df["true_range"] = 0.0
+    df["atr"] = 0.0
+    for i in range(1, len(df)):
+        high = df.iloc[i]["high"]
+        low = df.iloc[i]["low"]
+        prev_close = df.iloc[i - 1]["close"]
+        tr = max(high - low, abs(high - prev_close), abs(low - prev_close))
+        df.at[df.index[i], "true_range"] = tr
+
+    for i in range(len(df)):
+        if i == 0:
+            df.at[df.index[i], "atr"] = 0.0
+        elif i < ATR_LENGTH:
+            df.at[df.index[i], "atr"] = df["true_range"][:i+1].mean()
+        else:
+            prev_atr = df.iloc[i-1]["atr"]
+            tr = df.iloc[i]["true_range"]
+            df.at[df.index[i], "atr"] = ((prev_atr * (ATR_LENGTH - 1)) + tr) / ATR_LENGTH
+    return df
+
+
+def baseline_supertrend(df):
+    df = baseline_atr(df)
+    df["atr"] *= ATR_MULTIPLIER
+    df["hl2"] = (df["high"] + df["low"]) / 2
+    df["initial_upper_bar"] = df["hl2"] + df["atr"]
+    df["initial_lower_bar"] = df["hl2"] - df["atr"]
+
+    df["supertrend_upper"] = 0.0
+    df["supertrend_lower"] = 0.0
+    for i in range(len(df)):
+        if i == 0:
+            df.at[i, "supertrend_upper"] = df.at[i, "initial_upper_bar"]
+            df.at[i, "supertrend_lower"] = df.at[i, "initial_lower_bar"]
+            continue
+        prev_upper = df.at[i - 1, "supertrend_upper"]
+        prev_lower = df.at[i - 1, "supertrend_lower"]
+        prev_close = df.at[i - 1, "close"]
+        if prev_close < prev_upper:
+            df.at[i, "supertrend_upper"] = min(df.at[i, "initial_upper_bar"], prev_upper)
+        else:
+            df.at[i, "supertrend_upper"] = df.at[i, "initial_upper_bar"]
+        if prev_close >= prev_lower:
+            df.at[i, "supertrend_lower"] = max(df.at[i, "initial_lower_bar"], prev_lower)
+        else:
+            df.at[i, "supertrend_lower"] = df.at[i, "initial_lower_bar"]
+
+    df["os"] = 0
+    for i in range(len(df)):
+        close = df.at[i, "close"]
+        if close > df.at[i, "supertrend_upper"]:
+            df.at[i, "os"] = 1
+        elif close < df.at[i, "supertrend_lower"]:
+            df.at[i, "os"] = 0
+        else:
+            df.at[i, "os"] = df.at[i - 1, "os"] if i > 0 else 0
+
+    df["spt"] = df.apply(lambda row: row["supertrend_lower"] if row["os"] == 1 else row["supertrend_upper"], axis=1)
+
+    df["max_channel"] = 0.0
+    df["min_channel"] = 0.0
+    for i in range(len(df)):
+        close = df.at[i, "close"]
+        os = df.at[i, "os"]
+        spt = df.at[i, "spt"]
+        if i == 0:
+            df.at[i, "max_channel"] = close
+            df.at[i, "min_channel"] = close
+            continue
+        prev_max_channel = df.at[i - 1, "max_channel"]
+        prev_min_channel = df.at[i - 1, "min_channel"]
+        if close > spt:
+            df.at[i, "max_channel"] = max(prev_max_channel, close)
+        elif os == 1:
+            df.at[i, "max_channel"] = max(close, prev_max_channel)
+        else:
+            df.at[i, "max_channel"] = min(spt, prev_max_channel)
+        if close < spt:
+            df.at[i, "min_channel"] = min(prev_min_channel, close)
+        elif os == 0:
+            df.at[i, "min_channel"] = min(close, prev_min_channel)
+        else:
+            df.at[i, "min_channel"] = max(spt, prev_min_channel)
+
+    df["supertrend_avg"] = (df["max_channel"] + df["min_channel"]) / 2
+    return df
+
+
+def baseline_cboe(df, smoothK=3, smoothD=3, lengthRSI=14, lengthStoch=14, lengthcboe=7):
+    df = df.copy()
+
+    def calculate_rsi_rma(series, length):
+        delta = series.diff()
+        gain = delta.clip(lower=0)
+        loss = -delta.clip(upper=0)
+        avg_gain = gain.ewm(alpha=1/length, adjust=False).mean()
+        avg_loss = loss.ewm(alpha=1/length, adjust=False).mean()
+        rs = avg_gain / avg_loss
+        return 100 - (100 / (1 + rs))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        df["rsi1"] = calculate_rsi_rma(df["close"], lengthRSI)
+        rsi_min = df["rsi1"].rolling(window=lengthStoch).min()
+        rsi_max = df["rsi1"].rolling(window=lengthStoch).max()
+        df["stoch_rsi"] = 100 * (df["rsi1"] - rsi_min) / (rsi_max - rsi_min)
+        df["k"] = df["stoch_rsi"].rolling(window=smoothK).mean()
+        df["d"] = df["k"].rolling(window=smoothD).mean()
+
+        df["rs"] = calculate_rsi_rma(df["close"], lengthcboe)
+        df["rh"] = df["rs"].rolling(window=lengthcboe).max()
+        df["rl"] = df["rs"].rolling(window=lengthcboe).min()
+        df["stch"] = 100 * (df["rs"] - df["rl"]) / (df["rh"] - df["rl"])
+        df["stch1"] = 100 - df["stch"]
+        df["f1"] = df["stch"] * df["stch1"] / 100
+        df["f2"] = df["stch"] - df["f1"]
+        df["f3"] = df["stch1"] - df["f1"]
+        df["f4"] = df["f1"] + df["f2"] + df["f3"]
+
+        df["change"] = df["close"].diff()
+        df["up_input"] = np.where(df["change"] > 0, df["close"], 0)
+        df["down_input"] = np.where(df["change"] < 0, df["close"], 0)
+        df["upper_s"] = (df["volume"] * df["up_input"]).rolling(window=lengthcboe).sum()
+        df["lower_s"] = (df["volume"] * df["down_input"]).rolling(window=lengthcboe).sum()
+        df["R"] = df["upper_s"] / df["lower_s"].replace(0, np.nan)
+        market_index = 100 - (100 / (1 + df["R"]))
+
+        bull_gross = market_index
+        bear_gross = 100 - market_index
+        price_stagnant = (bull_gross * bear_gross) / 100
+        price_bull = bull_gross - price_stagnant
+        price_bear = bear_gross - price_stagnant
+        coeff_price = (price_stagnant + price_bull + price_bear) / 100
+        temp_stagnant = price_stagnant / coeff_price * (1 + (df["f3"] / df["f4"]))
+        temp_bull = price_bull / coeff_price * (1 + (df["f2"] / df["f4"]))
+        temp_bear = price_bear / coeff_price * (1 + (df["f3"] / df["f4"]))
+        coeff = (temp_stagnant + temp_bull + temp_bear) / 100
+        df["odd_bull"] = temp_bull / coeff
+        df["odd_bear"] = temp_bear / coeff
+        df["odd_stagnant"] = temp_stagnant / coeff
+    return df
+
+
+SEEDS = [0, 1, 7, 42]
+
+
+#  Kernels: bit-for-bit
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("period", [2, 14])
+def test_wilder_smooth_matches_baseline(seed, period):
+    expected = baseline_adx(random_ohlc(seed), period)
+    for column in ("tr", "+dm", "-dm"):
+        result = wilder_smooth(expected[column].to_numpy(), period)
+        np.testing.assert_array_equal(result, expected[f"{column}_smooth"].to_numpy())
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_true_range_and_atr_match_baseline(seed):
+    df = random_ohlc(seed)
+    expected = baseline_atr(df)
+    tr = true_range(df["high"], df["low"], df["close"])
+    np.testing.assert_array_equal(tr, expected["true_range"].to_numpy())
+    np.testing.assert_array_equal(atr_rma(tr, ATR_LENGTH), expected["atr"].to_numpy())
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_supertrend_chain_matches_baseline(seed):
+    df = random_ohlc(seed)
+    expected = baseline_supertrend(df)
+    close = df["close"].to_numpy()
+    initial_upper = expected["initial_upper_bar"].to_numpy()
+    initial_lower = expected["initial_lower_bar"].to_numpy()
+
+    upper, lower = supertrend_bands(initial_upper, initial_lower, close)
+    np.testing.assert_array_equal(upper, expected["supertrend_upper"].to_numpy())
+    np.testing.assert_array_equal(lower, expected["supertrend_lower"].to_numpy())
+
+    os_state = oscillation_state(close, upper, lower)
+    np.testing.assert_array_equal(os_state, expected["os"].to_numpy())
+
+    spt = np.where(os_state == 1, lower, upper)
+    np.testing.assert_array_equal(spt, expected["spt"].to_numpy())
+
+    max_channel, min_channel = supertrend_channels(close, spt, os_state)
+    np.testing.assert_array_equal(max_channel, expected["max_channel"].to_numpy())
+    np.testing.assert_array_equal(min_channel, expected["min_channel"].to_numpy())
+
+
+def test_kernels_handle_short_and_empty_series():
+    empty = np.array([], dtype=float)
+    assert len(wilder_smooth(empty, 2)) == 0
+    assert len(true_range(empty, empty, empty)) == 0
+    assert len(atr_rma(empty, ATR_LENGTH)) == 0
+    upper, lower = supertrend_bands(empty, empty, empty)
+    assert len(upper) == len(lower) == 0
+    np.testing.assert_array_equal(wilder_smooth(np.array([1.0, 2.0]), 2), [0.0, 0.0])
+
+
+#  Incremental engine: one bar at a time against the full-table computation
+
+def run_incremental(df):
+    state = new_indicator_state()
+    rows = [
+        update_indicator_state(state, {"timestamp": i, **bar})
+        for i, bar in enumerate(df.to_dict("records"))
+    ]
+    return pd.DataFrame(rows)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_incremental_matches_full_table(seed):
+    df = random_ohlc(seed)
+    incremental = run_incremental(df)
+
+    adx = baseline_adx(df, period=2)
+    supertrend = baseline_supertrend(df)
+    cboe = baseline_cboe(df)
+
+    #  Recursions are replayed step by step → identical
+    for column in ("hl2", "atr", "initial_upper_bar", "initial_lower_bar", "supertrend_upper",
+                   "supertrend_lower", "os", "spt", "max_channel", "min_channel", "supertrend_avg"):
+        np.testing.assert_array_equal(incremental[column].to_numpy(dtype=float),
+                                      supertrend[column].to_numpy(dtype=float), err_msg=column)
+    for column in ("di_plus", "di_minus"):
+        np.testing.assert_array_equal(incremental[column].to_numpy(), adx[column].to_numpy(), err_msg=column)
+    for length in (22, 33):
+        expected = df["close"].ewm(span=length, adjust=False).mean().to_numpy()
+        np.testing.assert_array_equal(incremental[f"ema_{length}"].to_numpy(), expected)
+
+    #  Rolling windows are summed exactly per bar, pandas keeps a running sum → equal up to rounding
+    np.testing.assert_allclose(incremental["adx"].to_numpy(), adx["adx"].to_numpy(), rtol=1e-9, equal_nan=True)
+    for column, baseline_column in (("stoch_k", "k"), ("stoch_d", "d"), ("odd_bull", "odd_bull"),
+                                    ("odd_bear", "odd_bear"), ("odd_stagnant", "odd_stagnant")):
+        np.testing.assert_allclose(incremental[column].to_numpy(dtype=float), cboe[baseline_column].to_numpy(),
+                                   rtol=1e-9, atol=1e-9, equal_nan=True, err_msg=column)
@@ -0,0 +1,68 @@
+import datetime
+
+from instrument_index import InstrumentIndex
+
+#  Strike ladders and the daily instrument cache of InstrumentIndex.
+
+WEEK_1 = datetime.date(2024, 1, 4)
+WEEK_2 = datetime.date(2024, 1, 11)
+
+
+def option(strike, side="CE", expiry=WEEK_1, name="NIFTY"):
+    return {"instrument_token": int(strike) * 10 + (side == "PE") + expiry.day * 1000000,
+            "tradingsymbol": f"{name}{expiry:%y%m%d}{strike}{side}", "name": name,
+            "expiry": expiry, "strike": float(strike), "instrument_type": side}
+
+
+INSTRUMENTS = [option(strike, side, expiry)
+               for expiry in (WEEK_2, WEEK_1) for side in ("PE", "CE") for strike in range(22300, 21700, -50)] + [
+    {"instrument_token": 256265, "tradingsymbol": "NIFTY 50", "name": "NIFTY", "expiry": "",
+     "strike": 0.0, "instrument_type": "EQ"},
+]
+
+
+class CountingKite:
+    def __init__(self):
+        self.calls = 0
+
+    def instruments(self, exchange):
+        self.calls += 1
+        return [dict(row) for row in INSTRUMENTS]
+
+
+def test_expiries_and_next_expiry():
+    index = InstrumentIndex(INSTRUMENTS)
+    assert index.expiries("NIFTY") == [WEEK_1, WEEK_2]
+    assert index.next_expiry("NIFTY", datetime.date(2024, 1, 5)) == WEEK_2
+    assert index.next_expiry("NIFTY", datetime.date(2024, 1, 12)) is None
+
+
+def test_nearest_strike_prefers_the_lower_strike_on_a_tie():
+    index = InstrumentIndex(INSTRUMENTS)
+    assert index.nearest_strike("NIFTY", WEEK_1, "CE", 22010)["strike"] == 22000
+    assert index.nearest_strike("NIFTY", WEEK_1, "CE", 22025)["strike"] == 22000
+    assert index.nearest_strike("NIFTY", WEEK_1, "CE", 22026)["strike"] == 22050
+    assert index.nearest_strike("NIFTY", WEEK_1, "PE", 30000)["strike"] == 22300
+    assert index.nearest_strike("BANKNIFTY", WEEK_1, "CE", 22000) is None
+
+
+def test_neighbours_and_strike_ranges():
+    index = InstrumentIndex(INSTRUMENTS)
+    assert [row["strike"] for row in index.neighbours("NIFTY", WEEK_1, "CE", 22000, 2)] == [21900, 21950, 22000, 22050, 22100]
+    assert [row["strike"] for row in index.neighbours("NIFTY", WEEK_1, "CE", 21750, 2)] == [21750, 21800, 21850]
+    assert [row["strike"] for row in index.strikes_between("NIFTY", WEEK_2, "PE", 21990, 22100)] == [22000, 22050, 22100]
+    assert index.by_token(256265)["tradingsymbol"] == "NIFTY 50"
+
+
+def test_master_is_downloaded_once_per_day(tmp_path):
+    kite = CountingKite()
+    today = datetime.date(2024, 1, 2)
+
+    first = InstrumentIndex.load(kite, cache_dir=str(tmp_path), today=today)
+    second = InstrumentIndex.load(kite, cache_dir=str(tmp_path), today=today)
+    assert kite.calls == 1
+    assert second.expiries("NIFTY") == first.expiries("NIFTY")
+
+    InstrumentIndex.load(kite, cache_dir=str(tmp_path), today=today + datetime.timedelta(days=1))
+    assert kite.calls == 2
+    assert [path.name for path in tmp_path.iterdir()] == ["NFO_2024-01-03.json"]
@@ -0,0 +1,28 @@
+import time
+
+from price_cache import LastPriceCache
+
+#  Freshness rules of LastPriceCache.
+
+
+def test_latest_tick_per_token_is_served():
+    cache = LastPriceCache(max_age=5.0)
+    cache.update_ticks([{"instrument_token": 1, "last_price": 100.0},
+                        {"instrument_token": 2, "last_price": 50.0},
+                        {"instrument_token": 1, "last_price": 101.5}])
+
+    assert cache.last_price(1) == 101.5
+    assert cache.quote(2)["last_price"] == 50.0
+    assert (cache.hits, cache.misses) == (2, 0)
+
+
+def test_missing_or_stale_prices_are_misses():
+    cache = LastPriceCache(max_age=0.05)
+    cache.update(1, 100.0, depth=None)
+
+    assert cache.last_price(1) == 100.0
+    assert cache.last_price(2) is None
+    time.sleep(0.1)
+    assert cache.last_price(1) is None
+    assert cache.last_price(1, max_age=60) == 100.0
+    assert (cache.hits, cache.misses) == (2, 2)
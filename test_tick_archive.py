@@ -0,0 +1,81 @@
+import datetime
+
+import numpy as np
+
+from candle_builder import CandleBuilder
+from tick_archive import TickArchive, ticks_to_candles
+
+#  Memory-mapped tick files of TickArchive and the candles rebuilt from them.
+
+DAY = datetime.date(2024, 1, 2)
+
+
+def at(hour, minute, second=0):
+    return datetime.datetime.combine(DAY, datetime.time(hour, minute, second))
+
+
+def test_file_grows_past_its_capacity(tmp_path):
+    archive = TickArchive(str(tmp_path), capacity=4)
+    for i in range(37):
+        archive.append(7, at(9, 15) + datetime.timedelta(seconds=i), 100.0 + i, 1000 + i)
+    archive.flush()
+
+    ticks = archive.read(7, DAY)
+    assert len(ticks) == 37
+    assert ticks["last_price"].tolist() == [100.0 + i for i in range(37)]
+    assert archive.tokens(DAY) == [7]
+
+
+def test_reopened_file_appends_after_committed_ticks(tmp_path):
+    archive = TickArchive(str(tmp_path), capacity=8)
+    archive.append(7, at(9, 15), 100.0)
+    archive.close()
+
+    archive = TickArchive(str(tmp_path), capacity=8)
+    archive.append(7, at(9, 16), 101.0)
+    archive.flush()
+    assert archive.read(7, DAY)["last_price"].tolist() == [100.0, 101.0]
+
+
+def test_range_read(tmp_path):
+    archive = TickArchive(str(tmp_path))
+    for second in range(0, 600, 30):
+        archive.append(7, at(9, 15) + datetime.timedelta(seconds=second), 100.0 + second)
+    archive.flush()
+
+    ticks = archive.read(7, DAY, start=at(9, 17), end=at(9, 19))
+    assert ticks["ts"].min() == np.datetime64(at(9, 17), "us")
+    assert len(ticks) == 4
+    assert len(archive.read(7, DAY, end=at(9, 15))) == 0
+    assert len(archive.read(8, DAY)) == 0
+
+
+def test_range_read_with_out_of_order_ticks(tmp_path):
+    archive = TickArchive(str(tmp_path))
+    for minute, second in ((15, 0), (16, 0), (15, 50), (17, 0), (16, 30), (18, 0)):
+        archive.append(7, at(9, minute, second), float(minute * 100 + second))
+    archive.flush()
+
+    ticks = archive.read(7, DAY, start=at(9, 16), end=at(9, 17))
+    assert ticks["last_price"].tolist() == [1600.0, 1630.0]
+
+
+def test_candles_match_the_live_builder():
+    rng = np.random.default_rng(3)
+    seconds = np.sort(rng.integers(-300, 6 * 3600 + 1200, 4000))
+    times = [at(9, 15) + datetime.timedelta(seconds=int(s)) for s in seconds]
+    prices = np.round(100 + rng.normal(0, 0.2, len(times)).cumsum(), 2)
+    volumes = np.cumsum(rng.integers(0, 50, len(times)))
+
+    ticks = np.zeros(len(times), dtype=[("ts", "<M8[us]"), ("last_price", "<f8"), ("volume_traded", "<u8")])
+    ticks["ts"] = [np.datetime64(ts, "us") for ts in times]
+    ticks["last_price"] = prices
+    ticks["volume_traded"] = volumes
+
+    for timeframe in (1, 3, 5, 15, 60):
+        builder = CandleBuilder((timeframe,))
+        for ts, price, volume in zip(times, prices, volumes):
+            builder.add_tick(7, float(price), ts, int(volume))
+        builder.roll(at(16, 30))
+
+        assert ticks_to_candles(ticks, timeframe) == [entry for _, entry in builder.drain(timeframe)]
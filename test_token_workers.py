@@ -0,0 +1,45 @@
+import threading
+
+from token_workers import TokenWorkerPool
+
+#  Per-token ordering of TokenWorkerPool.
+
+
+def test_tasks_of_one_token_run_in_submission_order():
+    pool = TokenWorkerPool(workers=3)
+    order = {token: [] for token in range(6)}
+    for i in range(50):
+        for token in order:
+            pool.submit(token, order[token].append, i)
+    pool.join()
+    pool.shutdown()
+
+    assert all(done == list(range(50)) for done in order.values())
+
+
+def test_release_keeps_the_worker_until_queued_work_has_run():
+    pool = TokenWorkerPool(workers=2)
+    gate = threading.Event()
+    order = []
+
+    first = pool.submit(1, lambda: (gate.wait(5), order.append("first")))
+    pool.release(1)
+    pool.submit(2, lambda: None)  # Takes the worker the release freed up
+    second = pool.submit(1, order.append, "second")
+
+    gate.set()
+    first.result(5)
+    second.result(5)
+    pool.shutdown()
+
+    assert order == ["first", "second"]
+
+
+def test_released_token_is_unpinned_once_drained():
+    pool = TokenWorkerPool(workers=2)
+    pool.submit(1, lambda: None).result(5)
+    pool.release(1)
+    pool.join()
+
+    assert 1 not in pool._assignment
+    pool.shutdown()
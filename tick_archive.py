@@ -0,0 +1,228 @@
+import datetime
+import logging
+import os
+
+import numpy as np
+
+from candle_builder import CandleBuilder, bucket_to_datetime, minute_bucket
+
+#  Fixed-width tick record (32 bytes). Exchange time is stored as datetime64[us] so reads
+#  come back as ready-to-use NumPy datetimes.
+TICK_DTYPE = np.dtype([
+    ("token", "<u4"),
+    ("oi", "<u4"),
+    ("ts", "<M8[us]"),
+    ("last_price", "<f8"),
+    ("volume_traded", "<u8"),
+])
+
+#  File layout: 16-byte header (magic, committed record count, out-of-order flag) followed by
+#  the records. The flag is set once a tick arrives with an earlier exchange time than the last.
+_MAGIC = b"TICKARC1"
+_HEADER_DTYPE = np.dtype([("magic", "S8"), ("count", "<u4"), ("unsorted", "<u4")])
+_HEADER_SIZE = _HEADER_DTYPE.itemsize
+
+
+class _TickFile:
+    """
+    One memory-mapped, append-only record file (one token, one trading day).
+    The header count is written after the record, so a reader never sees a half-written tick.
+    """
+
+    def __init__(self, path, capacity):
+        self.path = path
+        new_file = not os.path.exists(path)
+        if new_file:
+            with open(path, "wb") as f:
+                f.truncate(_HEADER_SIZE + capacity * TICK_DTYPE.itemsize)
+
+        self._map(max(capacity, self._capacity_on_disk()))
+        if new_file:
+            self.header["magic"] = _MAGIC
+            self.header["count"] = 0
+            self.header["unsorted"] = 0
+        elif self.header["magic"] != _MAGIC:
+            raise ValueError(f"{path} is not a tick archive file")
+        self.count = int(self.header["count"])
+        self.last_ts = self.records["ts"][self.count - 1] if self.count else None
+
+    def _capacity_on_disk(self):
+        return (os.path.getsize(self.path) - _HEADER_SIZE) // TICK_DTYPE.itemsize
+
+    def _map(self, capacity):
+        if self._capacity_on_disk() < capacity:
+            with open(self.path, "r+b") as f:
+                f.truncate(_HEADER_SIZE + capacity * TICK_DTYPE.itemsize)
+        self.capacity = capacity
+        self.header = np.memmap(self.path, dtype=_HEADER_DTYPE, mode="r+", shape=())
+        self.records = np.memmap(self.path, dtype=TICK_DTYPE, mode="r+",
+                                 offset=_HEADER_SIZE, shape=(capacity,))
+
+    def append(self, record):
+        if self.count == self.capacity:
+            #  Full → flush and remap at double the size
+            self.flush()
+            self._map(self.capacity * 2)
+
+        self.records[self.count] = record
+        ts = self.records["ts"][self.count]
+        if self.last_ts is not None and ts < self.last_ts:
+            self.header["unsorted"] = 1
+        else:
+            self.last_ts = ts
+        self.count += 1
+        self.header["count"] = self.count
+
+    def flush(self):
+        self.records.flush()
+        self.header.flush()
+
+
+class TickArchive:
+    """
+    Append-only tick log of the KiteTicker feed, one directory per trading day and one
+    memory-mapped file per token: <root>/<YYYY-MM-DD>/<token>.ticks
+
+    append() runs on the websocket thread and is a single fixed-width record store.
+    read() maps a token's file read-only and returns the committed ticks in a time range
+    as a zero-copy NumPy structured array, located by binary search on the exchange time
+    (or by a mask when the file holds out-of-order ticks).
+    """
+
+    def __init__(self, root="tick_archive", capacity=65536):
+        self.root = root
+        self.capacity = capacity
+        self._files = {}  # token → _TickFile of the current day
+        self._day = None
+
+    def _file_for(self, token, day):
+        if day != self._day:
+            #  New trading day → close yesterday's files
+            self.close()
+            self._day = day
+            os.makedirs(os.path.join(self.root, day.isoformat()), exist_ok=True)
+
+        tick_file = self._files.get(token)
+        if tick_file is None:
+            tick_file = _TickFile(self._path(day, token), self.capacity)
+            self._files[token] = tick_file
+        return tick_file
+
+    def _path(self, day, token):
+        return os.path.join(self.root, day.isoformat(), f"{token}.ticks")
+
+    def append(self, token, exchange_timestamp, last_price, volume_traded=0, oi=0):
+        """
+        Archives one tick.
+        """
+        self._file_for(token, exchange_timestamp.date()).append(
+            (token, oi or 0, np.datetime64(exchange_timestamp, "us"), last_price, volume_traded or 0)
+        )
+
+    def append_ticks(self, ticks):
+        """
+        Archives a batch of KiteTicker tick dicts (as passed to on_ticks).
+        """
+        for tick in ticks:
+            try:
+                self.append(tick["instrument_token"], tick["exchange_timestamp"], tick["last_price"],
+                            tick.get("volume_traded"), tick.get("oi"))
+            except Exception as e:
+                logging.error(f" Error archiving tick for token {tick.get('instrument_token')}: {e}")
+
+    def flush(self):
+        for tick_file in self._files.values():
+            tick_file.flush()
+
+    def close(self):
+        self.flush()
+        self._files.clear()
+
+    def tokens(self, day):
+        """
+        Tokens archived on a trading day.
+        """
+        directory = os.path.join(self.root, day.isoformat())
+        if not os.path.isdir(directory):
+            return []
+        return sorted(int(name[:-len(".ticks")]) for name in os.listdir(directory) if name.endswith(".ticks"))
+
+    def read(self, token, day, start=None, end=None):
+        """
+        Returns the ticks of a token on a trading day with start <= ts < end (either bound
+        optional), in arrival order, as a read-only structured array backed directly by the
+        archive file. If the file is flagged as holding out-of-order ticks, the range is
+        selected with a boolean mask instead of binary search (the result is then a copy).
+        """
+        path = self._path(day, token)
+        if not os.path.exists(path):
+            return np.empty(0, dtype=TICK_DTYPE)
+
+        header = np.memmap(path, dtype=_HEADER_DTYPE, mode="r", shape=())
+        if header["magic"] != _MAGIC:
+            raise ValueError(f"{path} is not a tick archive file")
+        count = int(header["count"])
+        if count == 0:
+            return np.empty(0, dtype=TICK_DTYPE)
+
+        records = np.memmap(path, dtype=TICK_DTYPE, mode="r", offset=_HEADER_SIZE, shape=(count,))
+        times = records["ts"]
+        if header["unsorted"]:
+            in_range = np.ones(count, dtype=bool)
+            if start is not None:
+                in_range &= times >= np.datetime64(start, "us")
+            if end is not None:
+                in_range &= times < np.datetime64(end, "us")
+            return records[in_range]
+
+        lo = 0 if start is None else int(np.searchsorted(times, np.datetime64(start, "us"), side="left"))
+        hi = count if end is None else int(np.searchsorted(times, np.datetime64(end, "us"), side="left"))
+        return records[lo:hi]
+
+
+def ticks_to_candles(ticks, timeframe=1, session_open=(9, 15), session_close=(15, 30)):
+    """
+    Rebuilds OHLCV bars of `timeframe` minutes from archived ticks of one token.
+    Bars use CandleBuilder's grid: anchored at the session open, the last bar of the day cut
+    at the session close; ticks outside the session are left out.
+    Volume is the volume_traded delta against the highest cumulative volume seen so far,
+    as in CandleBuilder (an out-of-order lower value adds nothing and is not the new baseline).
+
+    Returns:
+        list: [{"timestamp", "open", "high", "low", "close", "volume"}, ...] in time order.
+    """
+    if len(ticks) == 0:
+        return []
+
+    builder = CandleBuilder((timeframe,), session_open, session_close)
+    epoch_minute = minute_bucket(datetime.datetime(1970, 1, 1))
+    minutes = ticks["ts"].astype("datetime64[m]").astype(np.int64) + epoch_minute
+    buckets = builder.bucket_of(minutes, timeframe)
+
+    cumulative = np.asarray(ticks["volume_traded"]).astype(np.int64)
+    deltas = np.r_[0, np.diff(np.maximum.accumulate(cumulative))]
+
+    in_bar = builder.in_session(minutes)
+    buckets = buckets[in_bar]
+    prices = np.asarray(ticks["last_price"])[in_bar]
+    deltas = deltas[in_bar]
+    if len(buckets) == 0:
+        return []
+
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(buckets)] - 1
+    highs = np.maximum.reduceat(prices, starts)
+    lows = np.minimum.reduceat(prices, starts)
+    volumes = np.add.reduceat(deltas, starts)
+
+    return [
+        {
+            "timestamp": bucket_to_datetime(int(buckets[s])).strftime("%Y-%m-%d %H:%M"),
+            "open": float(prices[s]),
+            "high": float(highs[i]),
+            "low": float(lows[i]),
+            "close": float(prices[e]),
+            "volume": int(volumes[i]),
+        }
+        for i, (s, e) in enumerate(zip(starts, ends))
+    ]
@@ -0,0 +1,235 @@
+import argparse
+import datetime
+import logging
+import time
+
+import numpy as np
+
+from candle_builder import CandleBuilder
+from candle_scheduler import CandleCloseScheduler
+from incremental_indicators import new_indicator_state, update_indicator_state
+from tick_archive import TickArchive
+from token_workers import TokenWorkerPool
+
+#  Offline tick replay: feeds recorded or synthetic ticks through on_ticks / candle-close
+#  callbacks on a simulated exchange clock and reports throughput and close latency.
+#
+#    python tick_replay.py                                  → synthetic session, as fast as possible
+#    python tick_replay.py --source archive --day 2025-03-10 --speed 60
+#
+#  Any pair of callbacks with the live signatures can be replayed. adx_cboe_main itself is not
+#  importable offline (it logs in, backfills and starts the engine at import), so the replay
+#  runs ReplayPipeline: the live builder, per-token workers and incremental indicators with
+#  bars kept in memory. Its close callback returns the futures of the worker finalisations,
+#  as process_ohlc_candle does, so candles and close latency cover them.
+
+REPLAY_TIMEFRAMES = (1, 3, 5, 15, 60)
+
+
+def synthetic_ticks(tokens, day, ticks_per_second=2, session_open=(9, 15), session_close=(15, 30), seed=7):
+    """
+    Yields KiteTicker-style tick batches (one batch per exchange second) of a seeded
+    random walk for every token over one trading session.
+    """
+    rng = np.random.default_rng(seed)
+    start = datetime.datetime.combine(day, datetime.time(*session_open))
+    seconds = int((datetime.datetime.combine(day, datetime.time(*session_close)) - start).total_seconds())
+
+    prices = {token: 100.0 + 10 * i for i, token in enumerate(tokens)}
+    volumes = {token: 0 for token in tokens}
+
+    for second in range(seconds):
+        ts = start + datetime.timedelta(seconds=second)
+        batch = []
+        for token in tokens:
+            for _ in range(rng.poisson(ticks_per_second)):
+                prices[token] = max(0.05, prices[token] + rng.normal(0, 0.05))
+                volumes[token] += int(rng.integers(1, 20)) * 75
+                batch.append({
+                    "instrument_token": token,
+                    "last_price": round(prices[token], 2),
+                    "exchange_timestamp": ts,
+                    "volume_traded": volumes[token],
+                    "oi": 0,
+                })
+        if batch:
+            yield batch
+
+
+def archived_ticks(archive, day, tokens=None):
+    """
+    Yields tick batches (one per exchange second, all tokens merged in time order)
+    from a TickArchive trading day.
+    """
+    tokens = tokens or archive.tokens(day)
+    records = [archive.read(token, day) for token in tokens]
+    records = [r for r in records if len(r)]
+    if not records:
+        return
+
+    ticks = np.concatenate(records)
+    ticks = ticks[np.argsort(ticks["ts"], kind="stable")]
+    seconds = ticks["ts"].astype("datetime64[s]")
+    starts = np.flatnonzero(np.r_[True, seconds[1:] != seconds[:-1]])
+
+    for lo, hi in zip(starts, np.r_[starts[1:], len(ticks)]):
+        yield [
+            {
+                "instrument_token": int(record["token"]),
+                "last_price": float(record["last_price"]),
+                "exchange_timestamp": record["ts"].astype(datetime.datetime),
+                "volume_traded": int(record["volume_traded"]),
+                "oi": int(record["oi"]),
+            }
+            for record in ticks[lo:hi]
+        ]
+
+
+class TickReplayer:
+    """
+    Drives on_ticks(ws, ticks) and on_boundary(boundary, closing_timeframes) from a stream of
+    tick batches on a simulated exchange clock: before each batch, every bar boundary whose
+    grace period has passed is fired through CandleCloseScheduler.advance_to().
+
+    speed=0 replays as fast as possible; speed=N sleeps 1/N of the exchange time between
+    batches (speed=1 is real time). If on_boundary returns futures (worker tasks), the close
+    latency of a boundary includes waiting for them.
+    """
+
+    def __init__(self, on_ticks, on_boundary, timeframes=REPLAY_TIMEFRAMES, grace=2.0, speed=0.0):
+        self.on_ticks = on_ticks
+        self.on_boundary = on_boundary
+        self.timeframes = tuple(timeframes)
+        self.speed = speed
+        self.scheduler = CandleCloseScheduler(self._timed_boundary, timeframes=self.timeframes, grace=grace)
+
+        self.ticks = 0
+        self.candles = 0
+        self.boundaries = 0
+        self.latencies = []  # seconds per boundary
+        self.elapsed = 0.0
+
+    def _timed_boundary(self, boundary, closing_timeframes):
+        start = time.perf_counter()
+        result = self.on_boundary(boundary, closing_timeframes)
+
+        futures = list(result) if result else []
+        for future in futures:
+            future.result()
+
+        self.latencies.append(time.perf_counter() - start)
+        self.boundaries += 1
+        self.candles += len(futures)
+
+    def run(self, batches):
+        """
+        Replays every batch, then closes the bars still open at the end of the stream.
+        """
+        start = time.perf_counter()
+        last_ts = None
+
+        for batch in batches:
+            ts = batch[-1]["exchange_timestamp"]
+            if self.speed and last_ts is not None:
+                time.sleep(max((ts - last_ts).total_seconds(), 0) / self.speed)
+
+            self.scheduler.advance_to(ts)
+            self.on_ticks(None, batch)
+            self.ticks += len(batch)
+            last_ts = ts
+
+        if last_ts is not None:
+            self.scheduler.advance_to(last_ts + datetime.timedelta(minutes=max(self.timeframes)) + self.scheduler.grace)
+
+        self.elapsed = time.perf_counter() - start
+        return self.report()
+
+    def report(self):
+        """
+        Throughput and candle-close latency percentiles (milliseconds) of the last run.
+        """
+        latencies_ms = np.array(self.latencies) * 1000 if self.latencies else np.zeros(1)
+        elapsed = self.elapsed or float("inf")
+        return {
+            "ticks": self.ticks,
+            "candles": self.candles,
+            "boundaries": self.boundaries,
+            "elapsed_sec": round(self.elapsed, 3),
+            "ticks_per_sec": round(self.ticks / elapsed, 1),
+            "candles_per_sec": round(self.candles / elapsed, 1),
+            "close_latency_p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+            "close_latency_p90_ms": round(float(np.percentile(latencies_ms, 90)), 3),
+            "close_latency_p99_ms": round(float(np.percentile(latencies_ms, 99)), 3),
+            "close_latency_max_ms": round(float(latencies_ms.max()), 3),
+        }
+
+
+class ReplayPipeline:
+    """
+    In-memory stand-in for the live engine: the same candle builder, per-token workers and
+    incremental indicator engine, with bars kept in memory instead of Postgres.
+    """
+
+    def __init__(self, timeframes=REPLAY_TIMEFRAMES, workers=4):
+        self.timeframes = tuple(timeframes)
+        self.builder = CandleBuilder(timeframes=self.timeframes)
+        self.workers = TokenWorkerPool(workers=workers, name="replay-worker")
+        self.indicator_state = {}  # (token, timeframe) → incremental state
+        self.last_values = {}      # (token, timeframe) → indicator values of the latest bar
+
+    def on_ticks(self, ws, ticks):
+        for tick in ticks:
+            self.builder.add_tick(tick["instrument_token"], tick["last_price"],
+                                  tick["exchange_timestamp"], tick.get("volume_traded"))
+
+    def on_boundary(self, boundary, closing_timeframes):
+        self.builder.roll(boundary)
+        return [
+            self.workers.submit(token, self._finalise, token, timeframe, entry)
+            for timeframe in self.timeframes
+            for token, entry in self.builder.drain(timeframe)
+        ]
+
+    def _finalise(self, token, timeframe, entry):
+        state = self.indicator_state.get((token, timeframe))
+        if state is None:
+            state = self.indicator_state[(token, timeframe)] = new_indicator_state()
+        self.last_values[(token, timeframe)] = update_indicator_state(state, entry)
+
+    def close(self):
+        self.workers.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay ticks through the candle / indicator pipeline offline.")
+    parser.add_argument("--source", choices=["synthetic", "archive"], default="synthetic")
+    parser.add_argument("--day", default=None, help="Trading day YYYY-MM-DD (default: today)")
+    parser.add_argument("--archive-dir", default="tick_archive")
+    parser.add_argument("--tokens", type=int, default=2, help="Synthetic: number of instruments")
+    parser.add_argument("--ticks-per-second", type=float, default=2.0, help="Synthetic: mean ticks/sec per instrument")
+    parser.add_argument("--speed", type=float, default=0.0, help="0 = as fast as possible, 1 = real time")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    day = datetime.date.fromisoformat(args.day) if args.day else datetime.date.today()
+
+    if args.source == "archive":
+        batches = archived_ticks(TickArchive(args.archive_dir), day)
+    else:
+        batches = synthetic_ticks([256265 + i for i in range(args.tokens)], day, args.ticks_per_second)
+
+    pipeline = ReplayPipeline(workers=args.workers)
+    replayer = TickReplayer(pipeline.on_ticks, pipeline.on_boundary, speed=args.speed)
+    try:
+        report = replayer.run(batches)
+    finally:
+        pipeline.close()
+
+    logging.info(f" Replay of {day} ({args.source}) finished")
+    for key, value in report.items():
+        logging.info(f"   {key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
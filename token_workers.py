@@ -0,0 +1,118 @@
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+
+
+class TokenWorkerPool:
+    """
+    Fixed set of worker threads, each with its own bounded queue.
+
+    Every token is pinned to one worker the first time it is seen (least-loaded worker first),
+    so work for the same token always runs in submission order while different tokens run in
+    parallel. submit() blocks when the target worker's queue is full (back-pressure).
+    A released token keeps its worker until its queued tasks have run, so re-submitting it
+    never overtakes earlier work on another worker.
+    """
+
+    def __init__(self, workers=4, queue_size=64, name="candle-worker"):
+        self.workers = max(1, int(workers))
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in range(self.workers)]
+        self._assignment = {}  # token → worker index
+        self._assigned_count = [0] * self.workers
+        self._pending = {}     # token → tasks queued or running
+        self._released = set()  # released tokens still draining their queued tasks
+        self._lock = threading.Lock()
+        self._threads = [
+            threading.Thread(target=self._run, args=(q,), name=f"{name}-{i}", daemon=True)
+            for i, q in enumerate(self._queues)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _worker_for(self, token):
+        # Pins the token (if needed) and counts one more pending task for it
+        with self._lock:
+            index = self._assignment.get(token)
+            if index is None:
+                index = min(range(self.workers), key=lambda i: self._assigned_count[i])
+                self._assignment[token] = index
+                self._assigned_count[index] += 1
+            self._pending[token] = self._pending.get(token, 0) + 1
+            self._released.discard(token)
+            return index
+
+    def _unpin(self, token):
+        # Caller holds self._lock
+        self._released.discard(token)
+        index = self._assignment.pop(token, None)
+        if index is not None:
+            self._assigned_count[index] -= 1
+
+    def _task_done(self, token):
+        with self._lock:
+            pending = self._pending.pop(token, 1) - 1
+            if pending:
+                self._pending[token] = pending
+            elif token in self._released:
+                self._unpin(token)
+
+    def submit(self, token, func, *args, **kwargs):
+        """
+        Queues func(*args, **kwargs) on the worker owning `token` and returns a Future.
+        """
+        future = Future()
+        self._queues[self._worker_for(token)].put((token, future, func, args, kwargs))
+        return future
+
+    def release(self, token):
+        """
+        Forgets the worker pinning of a token that is no longer tracked, once the work
+        already queued for it has run (in order, on its worker).
+        """
+        with self._lock:
+            if self._pending.get(token):
+                self._released.add(token)
+            else:
+                self._unpin(token)
+
+    def queue_depths(self):
+        """
+        Returns the number of queued (not yet started) tasks per worker.
+        """
+        return [q.qsize() for q in self._queues]
+
+    def join(self):
+        """
+        Blocks until every task submitted so far has finished.
+        """
+        for q in self._queues:
+            q.join()
+
+    def shutdown(self, wait=True):
+        """
+        Stops every worker after the tasks already queued have run.
+        """
+        for q in self._queues:
+            q.put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _run(self, task_queue):
+        while True:
+            task = task_queue.get()
+            if task is None:
+                task_queue.task_done()
+                return
+
+            token, future, func, args, kwargs = task
+            try:
+                if future.set_running_or_notify_cancel():
+                    future.set_result(func(*args, **kwargs))
+            except BaseException as e:
+                logging.error(f" Worker task {getattr(func, '__name__', func)} failed: {e}")
+                future.set_exception(e)
+            finally:
+                self._task_done(token)
+                task_queue.task_done()